@@ -0,0 +1,67 @@
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from api_handlers.deadline import Deadline
+from api_handlers.fanout import review_prompts_concurrently
+from api_handlers.mock_review import FallbackReview, MockReview
+from utils.code_chunker import split_code, summarize_symbols
+from utils.token_budget import clean_code
+
+
+class ChunkedReview:
+    """Map-reduce review for a solution too large to fit in one prompt
+
+    The code is split along ast boundaries into parts that each fit the prompt budget.
+    Every part is reviewed in parallel together with the problem statement and an outline
+    of the whole file (map), then the part reviews are merged into the standard report
+    (reduce). Latency grows with the largest part rather than the file, and no code is dropped.
+    """
+
+    def __init__(self, prompt_builder, problem_statement: str, python_code: str):
+        self.prompt_builder = prompt_builder
+        self.problem_statement = problem_statement
+        code = clean_code(python_code)
+        self.outline = summarize_symbols(code)
+        self.chunks = split_code(code, prompt_builder.get_chunk_code_budget(problem_statement, self.outline))
+        self.chunk_prompts = {
+            chunk.title: prompt_builder.build_chunk_review_prompt(problem_statement, chunk, self.outline, part, len(self.chunks))
+            for part, chunk in enumerate(self.chunks, start=1)
+        }
+
+    def review_chunks(self, handler, review_fn: Optional[Callable[..., str]] = None, max_workers: Optional[int] = None,
+                      deadline: Optional[Deadline] = None) -> Iterator[Tuple[str, str, float]]:
+        """Review every part concurrently, yielding ``(title, review, elapsed_seconds)`` as each completes"""
+        return review_prompts_concurrently(handler, self.chunk_prompts, review_fn=review_fn,
+                                           max_workers=max_workers, deadline=deadline)
+
+    def build_reduce_prompt(self, chunk_reviews: Dict[str, str]) -> str:
+        """Build the merge prompt from part reviews, in file order"""
+        ordered = {title: chunk_reviews[title] for title in self.chunk_prompts}
+        return self.prompt_builder.build_chunk_reduce_prompt(self.problem_statement, self.outline, ordered)
+
+    def get_failed_review(self, chunk_reviews: Dict[str, str]) -> Optional[str]:
+        """The first failed part review, if any; merging partial results would silently drop code"""
+        for title in self.chunk_prompts:
+            if isinstance(chunk_reviews.get(title), MockReview):
+                return chunk_reviews[title]
+        return None
+
+    def get_review(self, handler, review_fn: Optional[Callable[..., str]] = None, max_workers: Optional[int] = None,
+                   deadline: Optional[Deadline] = None) -> str:
+        """Run the whole map-reduce review and return the merged report"""
+        review_fn = review_fn or (lambda handler, prompt, deadline=None: handler.get_review(prompt, deadline=deadline))
+        chunk_reviews = {title: review for title, review, _ in self.review_chunks(handler, review_fn, max_workers, deadline)}
+
+        failed = self.get_failed_review(chunk_reviews)
+        if failed is not None:
+            return failed
+
+        review = review_fn(handler, self.build_reduce_prompt(chunk_reviews), deadline=deadline)
+        return self.mark_merged_review(review, chunk_reviews)
+
+    def mark_merged_review(self, review: str, chunk_reviews: Dict[str, str]) -> str:
+        """Flag a merged report as a fallback review if any part came from a fallback model"""
+        if not isinstance(review, (MockReview, FallbackReview)) and any(
+            isinstance(chunk_review, FallbackReview) for chunk_review in chunk_reviews.values()
+        ):
+            return FallbackReview(review)
+        return review
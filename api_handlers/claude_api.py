@@ -1,32 +1,32 @@
-import os
-import streamlit as st
-import anthropic
-from typing import Optional
+import json
+from typing import Iterator, Optional
+
+from api_handlers.deadline import Deadline, ReviewCancelledError, ReviewTimeoutError, request_timeout, resolve_error
+from api_handlers.health import CircuitOpenError, guarded_call
+from api_handlers.mock_review import MockReview
+from api_handlers.provider_registry import get_provider_registry
+from api_handlers.rate_limiter import call_with_retries, estimate_request_tokens, get_status_code, is_rate_limit_error
+from api_handlers.usage import record_usage
+from utils.prompt_builder import split_cacheable_prompt
+
+SYSTEM_PROMPT = "You are a professional Python code reviewer. Provide detailed, constructive feedback."
 
 class ClaudeHandler:
     """Handler for Anthropic Claude API integration"""
     
     def __init__(self):
+        self.provider = "anthropic"
+        self.model_name = "claude-3-sonnet-20240229"
+        self.generation_params = {'max_tokens': 4000, 'temperature': 0.7}
         self.api_key = self._get_api_key()
-        self.client = None
-        if self.api_key:
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+        # Clients are shared process-wide so connections are reused across sessions
+        self.client = get_provider_registry().get_client('anthropic')
     
     def _get_api_key(self) -> Optional[str]:
         """Get Claude API key from environment or Streamlit secrets"""
-        # Try to get from environment variable
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        
-        # If not in environment, try Streamlit secrets
-        if not api_key:
-            try:
-                api_key = st.secrets["anthropic"]["api_key"]
-            except:
-                pass
-        
-        return api_key
+        return get_provider_registry().get_api_key('anthropic')
     
-    def get_review(self, prompt: str) -> str:
+    def get_review(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
         """Get code review from Claude AI"""
         if not self.api_key:
             return self._get_mock_response("Claude API key not configured. Please set ANTHROPIC_API_KEY environment variable or configure in Streamlit secrets.")
@@ -35,31 +35,124 @@ class ClaudeHandler:
             return self._get_mock_response("Claude client not initialized. Please check your API key.")
         
         try:
-            response = self.client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=4000,
-                temperature=0.7,
-                messages=[
-                    {"role": "system", "content": "You are a professional Python code reviewer. Provide detailed, constructive feedback."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = guarded_call(self.provider, self.model_name, lambda: call_with_retries(
+                self.provider,
+                lambda: self.client.messages.create(
+                    model=self.model_name,
+                    **self.generation_params,
+                    system=SYSTEM_PROMPT,
+                    messages=self._build_messages(prompt),
+                    timeout=request_timeout(deadline)
+                ),
+                estimated_tokens=estimate_request_tokens(prompt, self.generation_params['max_tokens']),
+                deadline=deadline
+            ))
+            self._record_usage(getattr(response, 'usage', None), deadline=deadline)
+            # A structured review arrives as the input of the tool the model was made to call
+            for block in response.content:
+                if block.type == "tool_use":
+                    return json.dumps(block.input)
             return response.content[0].text
             
         except Exception as e:
-            error_message = str(e)
-            if "authentication" in error_message.lower() or "api key" in error_message.lower():
-                return self._get_mock_response("❌ Authentication failed. Please check your Claude API key.")
-            elif "rate limit" in error_message.lower() or "quota" in error_message.lower() or "exceeded" in error_message.lower():
-                return self._get_mock_response("❌ Claude API quota exceeded. Please try using another model instead, or wait until your quota resets.")
-            elif "api" in error_message.lower():
-                return self._get_mock_response(f"❌ Claude API error: {error_message}")
-            else:
-                return self._get_mock_response(f"❌ Unexpected error: {error_message}")
+            return self._get_error_response(resolve_error(e, deadline))
+    
+    def get_review_stream(self, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream code review text from Claude AI as it is generated"""
+        if not self.api_key:
+            yield self._get_mock_response("Claude API key not configured. Please set ANTHROPIC_API_KEY environment variable or configure in Streamlit secrets.")
+            return
+        
+        if not self.client:
+            yield self._get_mock_response("Claude client not initialized. Please check your API key.")
+            return
+        
+        try:
+            # Only opening the stream is retried; a failure mid-stream is reported to the caller
+            stream = guarded_call(self.provider, self.model_name, lambda: call_with_retries(
+                self.provider,
+                lambda: self.client.messages.create(
+                    model=self.model_name,
+                    **self.generation_params,
+                    system=SYSTEM_PROMPT,
+                    messages=self._build_messages(prompt),
+                    stream=True,
+                    timeout=request_timeout(deadline)
+                ),
+                estimated_tokens=estimate_request_tokens(prompt, self.generation_params['max_tokens']),
+                deadline=deadline
+            ))
+            # Cancelling closes the response from the caller's thread, unblocking a pending read
+            unregister = deadline.on_cancel(stream.close) if deadline else None
+            usage = None
+            output_tokens = 0
+            try:
+                for event in stream:
+                    if deadline:
+                        deadline.check()
+                    if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                        yield event.delta.text
+                    elif event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                        # Forced tool calls stream their input as JSON fragments
+                        yield event.delta.partial_json
+                    elif event.type == "message_start":
+                        usage = event.message.usage
+                    elif event.type == "message_delta":
+                        output_tokens = event.usage.output_tokens
+                if usage is not None:
+                    self._record_usage(usage, output_tokens, deadline)
+            finally:
+                if unregister:
+                    unregister()
+                # Release the HTTP connection even if the consumer stops early
+                stream.close()
+        except Exception as e:
+            yield self._get_error_response(resolve_error(e, deadline))
+    
+    def _build_messages(self, prompt: str) -> list:
+        """Build the messages for a review request
+        
+        The prompt is sent as one text block per cacheable segment, with a cache breakpoint
+        after the instructions and after the problem statement, so reviews sharing them
+        read that prefix from Anthropic's prompt cache.
+        """
+        segments = split_cacheable_prompt(prompt)
+        content = [{"type": "text", "text": segment} for segment in segments]
+        for block in content[:-1]:
+            block["cache_control"] = {"type": "ephemeral"}
+        return [{"role": "user", "content": content}]
+    
+    def _record_usage(self, usage, output_tokens: Optional[int] = None, deadline: Optional[Deadline] = None) -> None:
+        """Record token usage; Anthropic reports cached prompt tokens separately from input_tokens"""
+        if usage is None:
+            return
+        cached_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+        input_tokens = (usage.input_tokens or 0) + cached_tokens + (getattr(usage, 'cache_creation_input_tokens', None) or 0)
+        record_usage(self.provider, self.model_name, input_tokens, cached_tokens, output_tokens or usage.output_tokens,
+                     deadline)
+    
+    def _get_error_response(self, error: Exception) -> str:
+        """Map an API error to a user-facing mock response"""
+        error_message = str(error)
+        status = get_status_code(error)
+        if isinstance(error, ReviewCancelledError):
+            return self._get_mock_response("⏹️ Review cancelled.")
+        elif isinstance(error, ReviewTimeoutError):
+            return self._get_mock_response("❌ Claude API did not finish the review before the deadline. Please try again or increase the review timeout.")
+        elif isinstance(error, CircuitOpenError):
+            return self._get_mock_response(f"❌ Claude API unavailable: {error_message}")
+        elif status in (401, 403):
+            return self._get_mock_response("❌ Authentication failed. Please check your Claude API key.")
+        elif is_rate_limit_error(error):
+            return self._get_mock_response("❌ Claude API quota exceeded. Please try using another model instead, or wait until your quota resets.")
+        elif status is not None:
+            return self._get_mock_response(f"❌ Claude API error: {error_message}")
+        else:
+            return self._get_mock_response(f"❌ Unexpected error: {error_message}")
     
     def _get_mock_response(self, error_message: str) -> str:
         """Return a mock response when API is not available"""
-        return f"""
+        return MockReview(f"""
 # Code Review Report
 
 {error_message}
@@ -82,4 +175,4 @@ Since the API is paid, here's an example of what a code review might look like:
 - Algorithm complexity is appropriate
 - Memory usage is efficient
 - Consider caching for expensive operations
-"""
\ No newline at end of file
+""")
\ No newline at end of file
@@ -0,0 +1,205 @@
+import threading
+from typing import Iterator, Optional
+
+from api_handlers.deadline import Deadline, ReviewCancelledError, ReviewTimeoutError
+from api_handlers.mock_review import MockReview, join_review_chunks
+from utils.review_cache import ReviewCache
+
+
+class CoalescingStats:
+    """Process-wide counters of review calls and how many joined a call already in flight"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'coalesced': 0}
+
+    def increment(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        counts['coalesced_rate'] = round(counts['coalesced'] / counts['requests'], 3) if counts['requests'] else 0.0
+        return counts
+
+
+class _Flight:
+    """One provider call shared by every caller that asked for the same review while it runs"""
+
+    def __init__(self, key: str):
+        self.key = key
+        # The shared call has no time limit of its own; it is cancelled once every caller has left
+        self.deadline = Deadline()
+        self.chunks = []
+        self.done = False
+        self.subscribers = 0
+        # The call's token usage is credited to one caller only: the leader, or if the leader
+        # left before the end, the first caller to receive the whole review
+        self.usage_claimed = False
+        self.leader_left = False
+        self.condition = threading.Condition()
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_stats = CoalescingStats()
+
+
+def get_coalescing_stats() -> dict:
+    """How many review calls joined an identical call already in flight, across this process"""
+    return _stats.snapshot()
+
+
+class CoalescingHandler:
+    """Coalesces identical concurrent reviews into a single provider call (single flight)
+
+    The first caller for a prompt, model and handler setup starts the call on a background
+    thread. Callers arriving while it runs attach to it: they are replayed every chunk
+    streamed so far, then receive new chunks as they arrive. Each caller's own deadline
+    only ends its wait; the shared call is cancelled once every caller has gone away.
+    The call's token usage is added to the leader's deadline; the others are marked
+    coalesced, at no cost.
+    In-flight calls are tracked process-wide, so identical reviews from different
+    sessions share one call.
+    """
+
+    def __init__(self, handler, label: str = None):
+        self.handler = handler
+        self.label = label or handler.model_name
+        self.model_name = handler.model_name
+        self.generation_params = getattr(handler, 'generation_params', {})
+        self.provider = getattr(handler, 'provider', None)
+
+    def get_review(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        """Get a review, sharing an identical call already in flight"""
+        return join_review_chunks(self._subscribe(prompt, deadline, streaming=False))
+
+    def get_review_stream(self, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream a review, attaching to an identical stream already in flight"""
+        return self._subscribe(prompt, deadline, streaming=True)
+
+    def _subscribe(self, prompt: str, deadline: Optional[Deadline], streaming: bool) -> Iterator[str]:
+        key = self._flight_key(prompt, streaming)
+        _stats.increment('requests')
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = _Flight(key)
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(
+                target=self._run,
+                args=(flight, prompt, streaming),
+                name="single-flight",
+                daemon=True
+            ).start()
+        else:
+            _stats.increment('coalesced')
+
+        try:
+            index = 0
+            while True:
+                with flight.condition:
+                    while index == len(flight.chunks) and not flight.done:
+                        # Wake up periodically so this caller's cancellation is noticed
+                        flight.condition.wait(timeout=0.25)
+                        if deadline and (deadline.cancelled or deadline.expired()):
+                            break
+                    chunks = flight.chunks[index:]
+                    done = flight.done
+                index += len(chunks)
+                yield from chunks
+                if done and index == len(flight.chunks):
+                    self._report_usage(flight, deadline, leader)
+                    return
+                if deadline:
+                    deadline.check()
+        except (ReviewCancelledError, ReviewTimeoutError) as e:
+            yield self._get_deadline_response(e)
+        finally:
+            self._leave(flight, leader)
+
+    def _run(self, flight: _Flight, prompt: str, streaming: bool) -> None:
+        """Drive the shared call, publishing each chunk to every attached caller"""
+        try:
+            if streaming:
+                stream = self.handler.get_review_stream(prompt, deadline=flight.deadline)
+                try:
+                    for chunk in stream:
+                        self._publish(flight, chunk)
+                        if flight.deadline.cancelled:
+                            break
+                finally:
+                    # Closing the generator runs the handler's cleanup, which closes the HTTP stream
+                    stream.close()
+            else:
+                self._publish(flight, self.handler.get_review(prompt, deadline=flight.deadline))
+        except Exception as e:
+            self._publish(flight, MockReview(f"❌ Unexpected error: {str(e)}"))
+        finally:
+            # Later callers start a fresh call (or hit the review cache) instead of replaying this one
+            with _flights_lock:
+                if _flights.get(flight.key) is flight:
+                    del _flights[flight.key]
+            with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    def _publish(self, flight: _Flight, chunk: str) -> None:
+        with flight.condition:
+            flight.chunks.append(chunk)
+            flight.condition.notify_all()
+
+    def _report_usage(self, flight: _Flight, deadline: Optional[Deadline], leader: bool) -> None:
+        """Tell a caller what the shared call used, counting its tokens for one caller only"""
+        with flight.condition:
+            credited = not flight.usage_claimed and (leader or flight.leader_left)
+            if credited:
+                flight.usage_claimed = True
+        if deadline is None:
+            return
+        usage = flight.deadline.get_usage()
+        for model_name, totals in usage.items():
+            if credited:
+                deadline.add_usage(model_name, totals['input_tokens'], totals['output_tokens'])
+            else:
+                deadline.mark_coalesced(model_name)
+        if not credited and not usage:
+            deadline.mark_coalesced(self.model_name)
+
+    def _leave(self, flight: _Flight, leader: bool) -> None:
+        if leader:
+            with flight.condition:
+                # Leaving before the end hands the call's token usage to a caller that stays
+                flight.leader_left = not flight.usage_claimed
+        with _flights_lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers == 0 and not flight.done
+            if abandoned and _flights.get(flight.key) is flight:
+                del _flights[flight.key]
+        if abandoned:
+            # Nobody is waiting for the answer any more: close the provider's stream
+            flight.deadline.cancel()
+
+    def _flight_key(self, prompt: str, streaming: bool) -> str:
+        # Wrapped handlers (failover, hedging) change where a review may come from, so they are part of the key
+        setup = f"{_describe(self.handler)}:{'stream' if streaming else 'review'}"
+        return ReviewCache.make_key(prompt, self.model_name, {'params': self.generation_params, 'setup': setup})
+
+    def _get_deadline_response(self, error: Exception) -> str:
+        if isinstance(error, ReviewCancelledError):
+            return MockReview("⏹️ Review cancelled.")
+        return MockReview(f"❌ {self.label} did not finish the review before the deadline. Please try again or increase the review timeout.")
+
+
+def _describe(handler) -> str:
+    """Class and model of a handler and of every handler it wraps"""
+    wrapped = [
+        _describe(inner) for inner in
+        (getattr(handler, attribute, None) for attribute in ('primary', 'alternate', 'secondary', 'handler'))
+        if inner is not None
+    ]
+    described = f"{type(handler).__name__}[{handler.model_name}]"
+    return f"{described}({', '.join(wrapped)})" if wrapped else described
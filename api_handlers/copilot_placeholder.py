@@ -1,4 +1,3 @@
-import streamlit as st
 from typing import Optional
 
 class CopilotHandler:
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+# Per-request timeout used when the caller sets no deadline, so no call can hang forever
+DEFAULT_REQUEST_TIMEOUT = float(os.getenv('AI_REVIEWER_REQUEST_TIMEOUT', '120'))
+
+
+class ReviewCancelledError(Exception):
+    """The user cancelled the review while it was in flight"""
+
+    def __init__(self):
+        super().__init__("Review cancelled")
+
+
+class ReviewTimeoutError(Exception):
+    """The review's end-to-end deadline passed before the provider answered"""
+
+    def __init__(self):
+        super().__init__("Review deadline exceeded")
+
+
+class Deadline:
+    """End-to-end deadline and cancellation token for one review
+
+    Passed from the caller down into every handler. Handlers derive per-request SDK
+    timeouts from it, check it between streamed chunks and register callbacks that close
+    their HTTP stream, so cancelling (or expiring) frees the worker thread right away.
+    Handlers also add the token usage providers report, so the caller learns what the
+    review actually cost; a review that shared another caller's provider call is marked
+    coalesced and costs nothing.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._usage = {}
+        self._coalesced = set()
+        self._parent = None
+        self._detach = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None if there is no time limit"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        """Raise if the review was cancelled or ran out of time"""
+        if self.cancelled:
+            raise ReviewCancelledError()
+        if self.expired():
+            raise ReviewTimeoutError()
+
+    def request_timeout(self, default: float = DEFAULT_REQUEST_TIMEOUT) -> float:
+        """Timeout to pass to a single SDK request made under this deadline"""
+        self.check()
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep like time.sleep, but wake up as soon as the review is cancelled"""
+        self._cancelled.wait(seconds)
+
+    def cancel(self) -> None:
+        """Cancel the review and close any in-flight requests registered with on_cancel"""
+        self._cancelled.set()
+        self._fire_callbacks()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run callback on cancellation or expiry; returns a function that unregisters it"""
+        with self._lock:
+            fire_now = self.cancelled or self.expired()
+            if not fire_now:
+                self._callbacks.append(callback)
+                if self._timer is None and self.expires_at is not None:
+                    self._timer = threading.Timer(self.remaining(), self._fire_callbacks)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if fire_now:
+            _run_quietly(callback)
+
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+                if not self._callbacks and self._timer is not None:
+                    # Nothing is left to close on expiry, so let the timer thread exit now
+                    self._timer.cancel()
+                    self._timer = None
+        return unregister
+
+    def child(self) -> 'Deadline':
+        """A deadline with the same expiry that is also cancelled when this one is
+
+        The child expires on its own timer, so expiry is reported as a timeout rather than
+        a cancellation. Call detach() on it once its request is over. Token usage added to
+        the child is added to this deadline too.
+        """
+        child = Deadline(self.remaining())
+        child._parent = self
+        # Expiry fires callbacks too; only pass on an actual cancellation
+        child._detach = self.on_cancel(lambda: child.cancel() if self.cancelled else None)
+        return child
+
+    def detach(self) -> None:
+        """Stop following the parent's cancellation, dropping the callback the parent holds for this child"""
+        detach, self._detach = self._detach, None
+        if detach is not None:
+            detach()
+
+    def add_usage(self, model_name: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+        """Count the tokens a provider reported for a request made under this deadline"""
+        with self._lock:
+            totals = self._usage.setdefault(model_name, {'input_tokens': 0, 'output_tokens': 0})
+            totals['input_tokens'] += input_tokens or 0
+            totals['output_tokens'] += output_tokens or 0
+        if self._parent is not None:
+            self._parent.add_usage(model_name, input_tokens, output_tokens)
+
+    def get_usage(self) -> dict:
+        """Reported input and output tokens per model, for requests made under this deadline so far"""
+        with self._lock:
+            return {model_name: dict(totals) for model_name, totals in self._usage.items()}
+
+    def mark_coalesced(self, model_name: str) -> None:
+        """Record that a review by model_name shared a provider call another caller paid for"""
+        with self._lock:
+            self._usage.setdefault(model_name, {'input_tokens': 0, 'output_tokens': 0})
+            self._coalesced.add(model_name)
+        if self._parent is not None:
+            self._parent.mark_coalesced(model_name)
+
+    def get_coalesced(self) -> set:
+        """Models whose reviews under this deadline came from a shared call, at no token cost"""
+        with self._lock:
+            return set(self._coalesced)
+
+    def _fire_callbacks(self) -> None:
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for callback in callbacks:
+            _run_quietly(callback)
+
+
+def _run_quietly(callback: Callable[[], None]) -> None:
+    try:
+        callback()
+    except Exception:
+        # Closing an already-finished stream can raise; the request is over either way
+        pass
+
+
+def request_timeout(deadline: Optional[Deadline]) -> float:
+    """Timeout for a single SDK request, honouring the deadline if there is one"""
+    return deadline.request_timeout() if deadline else DEFAULT_REQUEST_TIMEOUT
+
+
+def resolve_error(error: Exception, deadline: Optional[Deadline]) -> Exception:
+    """Report errors caused by closing a cancelled or expired request as what they really are"""
+    if deadline is not None:
+        if deadline.cancelled:
+            return ReviewCancelledError()
+        if deadline.expired():
+            return ReviewTimeoutError()
+    return error
@@ -0,0 +1,59 @@
+from typing import Iterator, Optional
+
+from api_handlers.deadline import Deadline
+from api_handlers.health import is_available
+from api_handlers.mock_review import FallbackReview, MockReview
+
+
+class FailoverHandler:
+    """Wraps a primary handler and switches to an alternate provider while the primary's breaker is open
+
+    Exposes the same interface as the model handlers. Reviews from the alternate are
+    returned as FallbackReview, so they are never cached under the primary model's key.
+    """
+
+    def __init__(self, primary, alternate, primary_label: str = None, alternate_label: str = None):
+        self.primary = primary
+        self.alternate = alternate
+        self.primary_label = primary_label or primary.model_name
+        self.alternate_label = alternate_label or alternate.model_name
+        self.model_name = primary.model_name
+        self.generation_params = getattr(primary, 'generation_params', {})
+        self.provider = getattr(primary, 'provider', None)
+
+    def get_review(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        """Get a review from the primary, or the alternate while the primary is unavailable"""
+        if is_available(self.primary):
+            review = self.primary.get_review(prompt, deadline=deadline)
+            # A failure that just tripped the breaker fails over right away, unless the
+            # review was cancelled or ran out of time
+            if not isinstance(review, MockReview) or is_available(self.primary) or _is_over(deadline):
+                return review
+
+        return self._from_alternate(self.alternate.get_review(prompt, deadline=deadline))
+
+    def get_review_stream(self, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream a review from the primary, or the alternate while the primary is unavailable"""
+        if is_available(self.primary):
+            stream = self.primary.get_review_stream(prompt, deadline=deadline)
+            first_chunk = next(stream, "")
+            # A cancelled or expired review must not be retried against the alternate
+            if not isinstance(first_chunk, MockReview) or is_available(self.primary) or _is_over(deadline):
+                yield first_chunk
+                yield from stream
+                return
+
+        yield FallbackReview(self._get_failover_notice())
+        yield from self.alternate.get_review_stream(prompt, deadline=deadline)
+
+    def _from_alternate(self, review: str) -> str:
+        if isinstance(review, MockReview):
+            return review
+        return FallbackReview(self._get_failover_notice() + review)
+
+    def _get_failover_notice(self) -> str:
+        return f"⚠️ {self.primary_label} is temporarily unavailable. Failing over to {self.alternate_label}...\n\n"
+
+
+def _is_over(deadline: Optional[Deadline]) -> bool:
+    return deadline is not None and (deadline.cancelled or deadline.expired())
@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from api_handlers.deadline import Deadline
+from api_handlers.mock_review import MockReview
+
+
+def _default_review(handler, prompt: str, deadline: Optional[Deadline] = None) -> str:
+    return handler.get_review(prompt, deadline=deadline)
+
+
+def review_concurrently(handlers: Dict[str, object], prompt: str,
+                        review_fn: Optional[Callable[..., str]] = None,
+                        max_workers: Optional[int] = None,
+                        deadline: Optional[Deadline] = None) -> Iterator[Tuple[str, str, float]]:
+    """Send the same prompt to several handlers at once and yield results as they complete
+
+    Yields ``(label, review, elapsed_seconds)`` tuples in completion order, so total
+    wall-clock time is that of the slowest handler rather than the sum of all of them.
+    ``review_fn(handler, prompt, deadline=...)`` can be used to route calls through a cache.
+    Every handler shares the deadline, so cancelling it stops all of them.
+    """
+    jobs = {label: (handler, prompt) for label, handler in handlers.items()}
+    yield from _run_concurrently(jobs, review_fn or _default_review, max_workers, deadline)
+
+
+def review_prompts_concurrently(handler, prompts: Dict[str, str],
+                                review_fn: Optional[Callable[..., str]] = None,
+                                max_workers: Optional[int] = None,
+                                deadline: Optional[Deadline] = None) -> Iterator[Tuple[str, str, float]]:
+    """Send several prompts to the same handler at once and yield results as they complete
+
+    The counterpart of ``review_concurrently`` for one model and many prompts, e.g. the
+    parts of a large file. Yields ``(label, review, elapsed_seconds)`` in completion order.
+    """
+    jobs = {label: (handler, prompt) for label, prompt in prompts.items()}
+    yield from _run_concurrently(jobs, review_fn or _default_review, max_workers, deadline)
+
+
+def _run_concurrently(jobs: Dict[str, tuple], review_fn: Callable[..., str], max_workers: Optional[int],
+                      deadline: Optional[Deadline]) -> Iterator[Tuple[str, str, float]]:
+    def timed_review(handler, prompt):
+        started_at = time.perf_counter()
+        return review_fn(handler, prompt, deadline=deadline), time.perf_counter() - started_at
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(jobs) or 1, thread_name_prefix="fanout") as executor:
+        futures = {executor.submit(timed_review, *job): label for label, job in jobs.items()}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                review, elapsed = future.result()
+            except Exception as e:
+                # Handlers report API errors as text; anything raised here is unexpected
+                review, elapsed = MockReview(f"❌ Unexpected error: {str(e)}"), 0.0
+            yield label, review, elapsed
@@ -1,38 +1,34 @@
-import os
-import streamlit as st
-from typing import Optional
-import google.generativeai as genai
+from typing import Iterator, Optional
+
+from api_handlers.deadline import Deadline, ReviewCancelledError, ReviewTimeoutError, request_timeout, resolve_error
+from api_handlers.health import guarded_call
+from api_handlers.mock_review import MockReview
+from api_handlers.provider_registry import get_provider_registry
+from api_handlers.rate_limiter import call_with_retries, estimate_request_tokens
+from api_handlers.usage import record_usage
 
 class GeminiHandler:
     """Handler for Google Gemini API integration"""
     
     def __init__(self):
+        self.provider = "gemini"
+        self.model_name = "models/gemini-1.5-flash"
+        self.generation_params = {}
         self.api_key = self._get_api_key()
         self.model = None
         if self.api_key:
             try:
-                import google.generativeai as genai
-                genai.configure(api_key=self.api_key)
-                # Use the correct model name based on the available models
-                self.model = genai.GenerativeModel("models/gemini-1.5-flash")
+                # The SDK is configured once and models are shared process-wide
+                self.model = get_provider_registry().get_gemini_model(self.model_name)
             except ImportError:
+                import streamlit as st
                 st.error("Google Generative AI library not installed. Run: pip install google-generativeai")
     
     def _get_api_key(self) -> Optional[str]:
         """Get Gemini API key from environment or Streamlit secrets"""
-        # Try to get from environment variable
-        api_key = os.getenv('GEMINI_API_KEY')
-        
-        # If not in environment, try Streamlit secrets
-        if not api_key:
-            try:
-                api_key = st.secrets["gemini"]["api_key"]
-            except:
-                pass
-        
-        return api_key
+        return get_provider_registry().get_api_key('gemini')
     
-    def get_review(self, prompt: str) -> str:
+    def get_review(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
         """Get code review from Google Gemini"""
         if not self.api_key:
             return self._get_mock_response("Gemini API key not configured. Please set GEMINI_API_KEY environment variable or configure in Streamlit secrets.")
@@ -41,15 +37,98 @@ class GeminiHandler:
             return self._get_mock_response("Gemini model not initialized. Please check your API key and install google-generativeai library.")
         
         try:
-            response = self.model.generate_content(prompt)
+            response = guarded_call(self.provider, self.model_name, lambda: call_with_retries(
+                self.provider,
+                lambda: self.model.generate_content(
+                    prompt,
+                    generation_config=self.generation_params or None,
+                    request_options=self._request_options(deadline)
+                ),
+                estimated_tokens=estimate_request_tokens(prompt),
+                deadline=deadline
+            ))
+            self._record_usage(response, deadline)
             return response.text
             
         except Exception as e:
-            return self._get_mock_response(f"❌ Gemini API error: {str(e)}")
+            return self._get_error_response(resolve_error(e, deadline))
+    
+    def get_review_stream(self, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream code review text from Google Gemini as it is generated"""
+        if not self.api_key:
+            yield self._get_mock_response("Gemini API key not configured. Please set GEMINI_API_KEY environment variable or configure in Streamlit secrets.")
+            return
+        
+        if not self.model:
+            yield self._get_mock_response("Gemini model not initialized. Please check your API key and install google-generativeai library.")
+            return
+        
+        try:
+            # The first chunk is fetched when the stream opens, so errors before any output are retried
+            response = guarded_call(self.provider, self.model_name, lambda: call_with_retries(
+                self.provider,
+                lambda: self.model.generate_content(
+                    prompt,
+                    generation_config=self.generation_params or None,
+                    stream=True,
+                    request_options=self._request_options(deadline)
+                ),
+                estimated_tokens=estimate_request_tokens(prompt),
+                deadline=deadline
+            ))
+            unregister = deadline.on_cancel(lambda: self._cancel_stream(response)) if deadline else None
+            try:
+                for chunk in response:
+                    if deadline:
+                        deadline.check()
+                    # Chunks without text parts (e.g. safety metadata) raise on .text
+                    if chunk.parts:
+                        yield chunk.text
+                # Usage is aggregated on the response once every chunk has arrived
+                self._record_usage(response, deadline)
+            finally:
+                if unregister:
+                    unregister()
+                # Stop the underlying RPC even if the consumer stops early
+                self._cancel_stream(response)
+        except Exception as e:
+            yield self._get_error_response(resolve_error(e, deadline))
+    
+    def _record_usage(self, response, deadline: Optional[Deadline] = None) -> None:
+        """Record token usage, including prompt tokens Gemini served from its context cache"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        record_usage(
+            self.provider,
+            self.model_name,
+            usage.prompt_token_count,
+            getattr(usage, 'cached_content_token_count', 0),
+            usage.candidates_token_count,
+            deadline
+        )
+    
+    def _request_options(self, deadline: Optional[Deadline]) -> dict:
+        """Per-request timeout; the SDK's own retry loop is disabled so it cannot outlive the deadline"""
+        return {'timeout': request_timeout(deadline), 'retry': None}
+    
+    def _cancel_stream(self, response) -> None:
+        """Cancel a streaming response's underlying gRPC call, if it is still running"""
+        cancel = getattr(getattr(response, '_iterator', None), 'cancel', None)
+        if cancel:
+            cancel()
+    
+    def _get_error_response(self, error: Exception) -> str:
+        """Map an API error to a user-facing mock response"""
+        if isinstance(error, ReviewCancelledError):
+            return self._get_mock_response("⏹️ Review cancelled.")
+        elif isinstance(error, ReviewTimeoutError):
+            return self._get_mock_response("❌ Gemini API did not finish the review before the deadline. Please try again or increase the review timeout.")
+        return self._get_mock_response(f"❌ Gemini API error: {str(error)}")
     
     def _get_mock_response(self, error_message: str) -> str:
         """Return a mock response when API is not available"""
-        return f"""
+        return MockReview(f"""
 # Code Review Report (Gemini)
 
 {error_message}
@@ -94,4 +173,4 @@ Since the API is not configured, here's an example of what a Gemini code review
 - **Testability**: Needs improvement
 
 This review was generated by Google Gemini AI model.
-        """
\ No newline at end of file
+        """)
\ No newline at end of file
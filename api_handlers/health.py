@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, TypeVar
+
+from api_handlers.rate_limiter import get_status_code, is_retryable_error
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"{key} is temporarily unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.key = key
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Circuit breaker over a rolling window of call outcomes and latencies for one provider model
+
+    Closed: calls flow normally. Open: calls are rejected immediately until the cool-down
+    passes. Half-open: a limited number of probe calls decide whether to close or re-open.
+    """
+
+    def __init__(self, key: str, failure_rate_threshold: float = 0.5, min_calls: int = 4,
+                 window_size: int = 20, window_seconds: float = 120.0, open_seconds: float = 30.0,
+                 half_open_probes: int = 1):
+        self.key = key
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Whether a call may be sent now; in half-open state this claims a probe slot"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def can_accept(self) -> bool:
+        """Whether allow_request would let a call through now, without claiming a probe slot"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at >= self.open_seconds
+            if self.state == HALF_OPEN:
+                return self._probes_in_flight < self.half_open_probes
+            return True
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._outcomes.append((time.monotonic(), True, latency))
+            if self.state == HALF_OPEN:
+                # The probe got through, so the provider has recovered
+                self.state = CLOSED
+                self._outcomes.clear()
+                self._outcomes.append((time.monotonic(), True, latency))
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot for a call that ended without a verdict, e.g. a cancelled one"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record_failure(self, latency: float) -> None:
+        with self._lock:
+            self._outcomes.append((time.monotonic(), False, latency))
+            if self.state == HALF_OPEN:
+                self._trip()
+                return
+
+            outcomes = self._recent_outcomes()
+            failures = sum(1 for _, ok, _ in outcomes if not ok)
+            if len(outcomes) >= self.min_calls and failures / len(outcomes) >= self.failure_rate_threshold:
+                self._trip()
+
+    def snapshot(self) -> dict:
+        """Current state with rolling error rate and latency percentiles"""
+        with self._lock:
+            outcomes = self._recent_outcomes()
+            latencies = sorted(latency for _, _, latency in outcomes)
+            failures = sum(1 for _, ok, _ in outcomes if not ok)
+            return {
+                'key': self.key,
+                'state': self.state,
+                'calls': len(outcomes),
+                'error_rate': round(failures / len(outcomes), 3) if outcomes else 0.0,
+                'p50_latency': _percentile(latencies, 0.5),
+                'p95_latency': _percentile(latencies, 0.95),
+            }
+
+    def _recent_outcomes(self) -> list:
+        cutoff = time.monotonic() - self.window_seconds
+        return [outcome for outcome in self._outcomes if outcome[0] >= cutoff]
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+
+
+def _percentile(sorted_values: list, fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str, model_name: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker for a provider model"""
+    key = f"{provider}:{model_name}"
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(key)
+        return _breakers[key]
+
+
+def get_health_snapshots() -> list:
+    """Health of every provider model that has been called in this process"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
+
+
+def is_available(handler) -> bool:
+    """Whether a handler's provider model is currently accepting calls
+    
+    A half-open breaker whose probe slots are all taken counts as unavailable, so requests
+    arriving during the probe fail over instead of being rejected.
+    """
+    provider = getattr(handler, 'provider', None)
+    if provider is None:
+        return True
+    return get_circuit_breaker(provider, handler.model_name).can_accept()
+
+
+def guarded_call(provider: str, model_name: str, request: Callable[[], T]) -> T:
+    """Call a provider through its circuit breaker, recording the outcome and latency
+
+    Only provider-side failures (timeouts, 429s, 5xx, connection errors) count against
+    the breaker. Client errors such as a bad request still show the provider answered, so
+    they count as successes. Anything else, such as the review being cancelled or running
+    out of time, gives no verdict and just releases the call's probe slot.
+    """
+    breaker = get_circuit_breaker(provider, model_name)
+    if not breaker.allow_request():
+        raise CircuitOpenError(breaker.key, breaker.retry_in())
+
+    started_at = time.perf_counter()
+    try:
+        result = request()
+    except Exception as e:
+        if is_retryable_error(e):
+            breaker.record_failure(time.perf_counter() - started_at)
+        elif get_status_code(e) is not None:
+            breaker.record_success(time.perf_counter() - started_at)
+        else:
+            breaker.release_probe()
+        raise
+    except BaseException:
+        breaker.release_probe()
+        raise
+    breaker.record_success(time.perf_counter() - started_at)
+    return result
@@ -0,0 +1,246 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+from api_handlers.deadline import Deadline
+from api_handlers.mock_review import FallbackReview, MockReview, join_review_chunks
+
+PRIMARY = 'primary'
+SECONDARY = 'secondary'
+
+
+class LatencyTracker:
+    """Rolling window of time-to-first-token samples for one provider model"""
+
+    def __init__(self, window_size: int = 200):
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgeStats:
+    """Process-wide counters used to tune the hedging deadline"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'hedged': 0, 'primary_wins': 0, 'secondary_wins': 0}
+
+    def increment(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        counts['hedge_rate'] = round(counts['hedged'] / counts['requests'], 3) if counts['requests'] else 0.0
+        return counts
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+_stats = HedgeStats()
+
+
+def get_latency_tracker(handler) -> LatencyTracker:
+    """Get the process-wide time-to-first-token tracker for a handler's model"""
+    key = f"{getattr(handler, 'provider', type(handler).__name__)}:{handler.model_name}"
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker()
+        return _trackers[key]
+
+
+def get_hedge_stats() -> dict:
+    """Hedge rate and which side won, across every hedged handler in this process"""
+    return _stats.snapshot()
+
+
+class HedgedHandler:
+    """Sends the prompt to a secondary model when the primary is slow to produce its first token
+
+    The hedge deadline is a percentile of the primary's recent time-to-first-token, clamped
+    to [min_deadline, max_deadline]. If the primary starts streaming in time, its output is
+    passed straight through. Otherwise both run, the first complete answer wins and the
+    loser's stream is closed so its HTTP connection is released. Only review text counts as
+    the first token: an error from the primary hedges at once, and notices are held back
+    until the primary's review text starts.
+    """
+
+    def __init__(self, primary, secondary, primary_label: str = None, secondary_label: str = None,
+                 percentile: float = 0.95, default_deadline: float = 8.0,
+                 min_deadline: float = 1.0, max_deadline: float = 30.0, min_samples: int = 20):
+        self.primary = primary
+        self.secondary = secondary
+        self.primary_label = primary_label or primary.model_name
+        self.secondary_label = secondary_label or secondary.model_name
+        self.percentile = percentile
+        self.default_deadline = default_deadline
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.min_samples = min_samples
+
+        self.model_name = primary.model_name
+        self.generation_params = getattr(primary, 'generation_params', {})
+        self.provider = getattr(primary, 'provider', None)
+        self.tracker = get_latency_tracker(primary)
+
+    def get_deadline(self) -> float:
+        """Seconds to wait for the primary's first token before hedging"""
+        if len(self.tracker) < self.min_samples:
+            return self.default_deadline
+        return min(self.max_deadline, max(self.min_deadline, self.tracker.percentile(self.percentile)))
+
+    def get_review(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        """Get a complete review, hedging if the primary is slow"""
+        return join_review_chunks(self.get_review_stream(prompt, deadline=deadline))
+
+    def get_review_stream(self, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream the primary's review, or the first complete review once hedged"""
+        _stats.increment('requests')
+        events = queue.Queue()
+        # Each side gets its own cancellable deadline so the loser's HTTP stream can be closed
+        # without touching the winner; cancelling the caller's deadline cancels both
+        deadline = deadline or Deadline()
+        cancel = {PRIMARY: deadline.child(), SECONDARY: deadline.child()}
+        buffers = {PRIMARY: [], SECONDARY: []}
+        finished = {}
+
+        started_at = time.monotonic()
+        hedge_at = started_at + self.get_deadline()
+        self._start(PRIMARY, self.primary, prompt, events, cancel[PRIMARY])
+        first_token_at = None
+        primary_failed = False
+        hedged = False
+        # Set once it is too late to hedge; the primary is then waited for without a timer
+        hedge_abandoned = False
+
+        try:
+            while True:
+                waiting_for_hedge = not (hedged or hedge_abandoned or first_token_at)
+                timeout = max(0.0, hedge_at - time.monotonic()) if waiting_for_hedge else None
+                try:
+                    side, kind, chunk = events.get(timeout=timeout)
+                except queue.Empty:
+                    if _is_over(deadline):
+                        # Too late to start a second request; keep waiting for the primary to wind down
+                        hedge_abandoned = True
+                        continue
+                    hedged = True
+                    _stats.increment('hedged')
+                    self._start(SECONDARY, self.secondary, prompt, events, cancel[SECONDARY])
+                    continue
+
+                if kind == 'chunk':
+                    if hedged or side != PRIMARY or first_token_at is not None:
+                        if hedged:
+                            buffers[side].append(chunk)
+                        else:
+                            yield chunk
+                        continue
+                    # Until the primary's review text starts, hold back its notices and errors
+                    buffers[PRIMARY].append(chunk)
+                    if isinstance(chunk, MockReview):
+                        # A failure is not a first token; ask the secondary right away instead
+                        primary_failed = True
+                        if not _is_over(deadline):
+                            hedged = True
+                            _stats.increment('hedged')
+                            self._start(SECONDARY, self.secondary, prompt, events, cancel[SECONDARY])
+                    elif not isinstance(chunk, FallbackReview):
+                        first_token_at = time.monotonic()
+                        self.tracker.record(first_token_at - started_at)
+                        yield from buffers[PRIMARY]
+                        buffers[PRIMARY].clear()
+                    continue
+
+                # The side's stream has finished
+                if not hedged:
+                    if first_token_at is None and _is_over(deadline):
+                        # A side cut off by the deadline drops its own error, so report the deadline here
+                        yield self._get_deadline_response(deadline)
+                    else:
+                        yield from buffers[PRIMARY]
+                    _stats.increment('primary_wins')
+                    return
+                if _is_over(deadline):
+                    yield self._get_deadline_response(deadline)
+                    return
+
+                finished[side] = join_review_chunks(buffers[side])
+                other = SECONDARY if side == PRIMARY else PRIMARY
+                # An error only wins if the other side has failed as well
+                if isinstance(finished[side], MockReview) and other not in finished:
+                    continue
+
+                winner = side
+                if isinstance(finished[side], MockReview) and not isinstance(finished[other], MockReview):
+                    winner = other
+                cancel[SECONDARY if winner == PRIMARY else PRIMARY].cancel()
+                _stats.increment('primary_wins' if winner == PRIMARY else 'secondary_wins')
+
+                if winner == PRIMARY:
+                    yield from buffers[PRIMARY]
+                else:
+                    yield FallbackReview(self._get_hedge_notice())
+                    yield from buffers[SECONDARY]
+                return
+        finally:
+            # Stop whichever streams are still running, including when the consumer stops early
+            if first_token_at is None and not primary_failed:
+                # The primary never answered; its wait so far is a lower bound worth remembering
+                self.tracker.record(time.monotonic() - started_at)
+            for side_deadline in cancel.values():
+                side_deadline.cancel()
+                side_deadline.detach()
+
+    def _start(self, side: str, handler, prompt: str, events: queue.Queue, side_deadline: Deadline) -> None:
+        thread = threading.Thread(
+            target=self._pump,
+            args=(side, handler, prompt, events, side_deadline),
+            name=f"hedge-{side}",
+            daemon=True
+        )
+        thread.start()
+
+    def _pump(self, side: str, handler, prompt: str, events: queue.Queue, side_deadline: Deadline) -> None:
+        """Relay a handler's stream into the shared queue until it ends or is cancelled"""
+        stream = handler.get_review_stream(prompt, deadline=side_deadline)
+        try:
+            for chunk in stream:
+                if side_deadline.cancelled:
+                    break
+                events.put((side, 'chunk', chunk))
+        except Exception as e:
+            events.put((side, 'chunk', MockReview(f"❌ Unexpected error: {str(e)}")))
+        finally:
+            # Closing the generator runs the handler's cleanup, which closes the HTTP stream
+            stream.close()
+            events.put((side, 'done', None))
+
+    def _get_deadline_response(self, deadline: Deadline) -> str:
+        if deadline.cancelled and not deadline.expired():
+            return MockReview("⏹️ Review cancelled.")
+        return MockReview(f"❌ {self.primary_label} did not finish the review before the deadline. Please try again or increase the review timeout.")
+
+    def _get_hedge_notice(self) -> str:
+        return f"⚠️ {self.primary_label} was slow to respond. Using the faster answer from {self.secondary_label}...\n\n"
+
+
+def _is_over(deadline: Deadline) -> bool:
+    return deadline.cancelled or deadline.expired()
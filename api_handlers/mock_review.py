@@ -0,0 +1,27 @@
+from typing import Iterable
+
+
+class MockReview(str):
+    """Review text produced locally instead of by a model (missing key, API error, placeholder)
+
+    Behaves exactly like ``str`` so callers can keep treating reviews as text,
+    but lets caching layers tell fallback output apart from real model output.
+    """
+
+
+class FallbackReview(str):
+    """Review produced by a fallback model after the requested model stayed rate limited
+
+    It is real model output, but must not be cached under the requested model's key.
+    """
+
+
+def join_review_chunks(chunks: Iterable[str]) -> str:
+    """Join streamed review chunks, keeping the MockReview/FallbackReview marker of any chunk"""
+    chunks = list(chunks)
+    text = ''.join(chunks)
+    if any(isinstance(chunk, MockReview) for chunk in chunks):
+        return MockReview(text)
+    if any(isinstance(chunk, FallbackReview) for chunk in chunks):
+        return FallbackReview(text)
+    return text
@@ -1,32 +1,33 @@
-import os
-import streamlit as st
-from openai import OpenAI
-from typing import Optional
+from typing import Iterator, List, Optional
+
+from api_handlers.deadline import Deadline, ReviewCancelledError, ReviewTimeoutError, request_timeout, resolve_error
+from api_handlers.health import CircuitOpenError, guarded_call
+from api_handlers.mock_review import FallbackReview, MockReview
+from api_handlers.provider_registry import get_provider_registry
+from api_handlers.rate_limiter import call_with_retries, estimate_request_tokens, get_status_code, is_rate_limit_error
+from api_handlers.usage import record_usage
+
+# Models tried in order when the requested model stays rate limited after retries
+DEFAULT_FALLBACK_MODELS = ["gpt-3.5-turbo"]
 
 class OpenAIHandler:
     """Handler for OpenAI GPT-4 API integration"""
     
-    def __init__(self):
+    def __init__(self, fallback_models: Optional[List[str]] = None):
+        self.provider = "openai"
+        self.model_name = "gpt-4o"
+        self.generation_params = {}
+        # Downgrading is an explicit policy: pass [] to never switch models
+        self.fallback_models = list(DEFAULT_FALLBACK_MODELS if fallback_models is None else fallback_models)
         self.api_key = self._get_api_key()
-        self.client = None
-        if self.api_key:
-            self.client = OpenAI(api_key=self.api_key)
+        # Clients are shared process-wide so connections are reused across sessions
+        self.client = get_provider_registry().get_client('openai')
     
     def _get_api_key(self) -> Optional[str]:
         """Get OpenAI API key from environment or Streamlit secrets"""
-        # Try to get from environment variable
-        api_key = os.getenv('OPENAI_API_KEY')
-        
-        # If not in environment, try Streamlit secrets
-        if not api_key:
-            try:
-                api_key = st.secrets["openai"]["api_key"]
-            except:
-                pass
-        
-        return api_key
+        return get_provider_registry().get_api_key('openai')
     
-    def get_review(self, prompt: str) -> str:
+    def get_review(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
         """Get code review from OpenAI GPT-4"""
         if not self.api_key:
             return self._get_mock_response("OpenAI API key not configured. Please set OPENAI_API_KEY environment variable or configure in Streamlit secrets.")
@@ -35,55 +36,179 @@ class OpenAIHandler:
             return self._get_mock_response("OpenAI client not initialized. Please check your API key.")
         
         try:
-            # Try with gpt-4o first
+            return self._complete(self.model_name, prompt, deadline)
+        except Exception as e:
+            e = resolve_error(e, deadline)
+            # Transient errors were already retried with backoff; only a persistent
+            # rate limit or an open circuit triggers the fallback policy
+            if not self._should_fall_back(e):
+                return self._get_error_response(e)
+            cause = last_error = e
+        
+        for fallback_model in self.fallback_models:
             try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a professional Python code reviewer. Provide detailed, constructive feedback."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                # Check if it's a rate limit error
-                if "quota" in str(e).lower() or "exceeded" in str(e).lower() or "insufficient_quota" in str(e).lower() or "rate limit" in str(e).lower():
-                    # Add a prefix to the response that the app can detect
-                    fallback_prefix = "⚠️ GPT-4 quota exceeded. Falling back to GPT-3.5-Turbo...\n\n"
-                    try:
-                        response = self.client.chat.completions.create(
-                            model="gpt-3.5-turbo",
-                            messages=[
-                                {"role": "system", "content": "You are a professional Python code reviewer. Provide detailed, constructive feedback."},
-                                {"role": "user", "content": prompt}
-                            ]
-                        )
-                        return fallback_prefix + response.choices[0].message.content
-                    except Exception as fallback_error:
-                        # If fallback also fails, return a more specific error message
-                        error_msg = str(fallback_error)
-                        if "quota" in error_msg.lower() or "exceeded" in error_msg.lower() or "insufficient_quota" in error_msg.lower():
-                            return self._get_mock_response("❌ GPT-4 quota exceeded and GPT-3.5 fallback failed: OpenAI API quota exceeded. Please try using the Gemini model instead, or wait until your quota resets.")
-                        else:
-                            return self._get_mock_response(f"❌ GPT-4 quota exceeded and GPT-3.5 fallback failed: {error_msg}")
-                else:
-                    # Re-raise the exception if it's not a quota issue
-                    raise e
-            
+                return FallbackReview(self._get_fallback_notice(fallback_model, cause) + self._complete(fallback_model, prompt, deadline))
+            except Exception as fallback_error:
+                last_error = resolve_error(fallback_error, deadline)
+                if not self._should_fall_back(last_error):
+                    break
+        return self._get_fallback_error_response(cause, last_error)
+    
+    def get_review_stream(self, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream code review text from OpenAI GPT-4 as it is generated"""
+        if not self.api_key:
+            yield self._get_mock_response("OpenAI API key not configured. Please set OPENAI_API_KEY environment variable or configure in Streamlit secrets.")
+            return
+        
+        if not self.client:
+            yield self._get_mock_response("OpenAI client not initialized. Please check your API key.")
+            return
+        
+        started = False
+        try:
+            for text in self._stream_completion(self.model_name, prompt, deadline):
+                started = True
+                yield text
+            return
         except Exception as e:
-            error_message = str(e)
-            if "authentication" in error_message.lower() or "api key" in error_message.lower():
-                return self._get_mock_response("❌ Authentication failed. Please check your OpenAI API key.")
-            elif "rate limit" in error_message.lower() or "quota" in error_message.lower() or "exceeded" in error_message.lower() or "insufficient_quota" in error_message.lower():
-                return self._get_mock_response("❌ OpenAI API quota exceeded. Please try using the Gemini model instead, or wait until your quota resets.")
-            elif "api" in error_message.lower():
-                return self._get_mock_response(f"❌ OpenAI API error: {error_message}")
-            else:
-                return self._get_mock_response(f"❌ Unexpected error: {error_message}")
+            e = resolve_error(e, deadline)
+            # Only fall back if nothing was streamed yet, otherwise the output would be mixed
+            if started or not self._should_fall_back(e):
+                yield self._get_error_response(e)
+                return
+            cause = last_error = e
+        
+        for fallback_model in self.fallback_models:
+            try:
+                stream = self._stream_completion(fallback_model, prompt, deadline)
+                first_chunk = next(stream, "")
+            except Exception as fallback_error:
+                last_error = resolve_error(fallback_error, deadline)
+                if not self._should_fall_back(last_error):
+                    break
+                continue
+            
+            yield FallbackReview(self._get_fallback_notice(fallback_model, cause))
+            yield first_chunk
+            try:
+                yield from stream
+            except Exception as fallback_error:
+                yield self._get_error_response(resolve_error(fallback_error, deadline))
+            return
+        yield self._get_fallback_error_response(cause, last_error)
+    
+    def _complete(self, model: str, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        """Send a chat completion through the shared rate limiter and return its text"""
+        response = guarded_call(self.provider, model, lambda: call_with_retries(
+            self.provider,
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=self._build_messages(prompt),
+                timeout=request_timeout(deadline),
+                **self.generation_params
+            ),
+            estimated_tokens=estimate_request_tokens(prompt),
+            deadline=deadline
+        ))
+        self._record_usage(model, getattr(response, 'usage', None), deadline)
+        return response.choices[0].message.content
+    
+    def _stream_completion(self, model: str, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Yield content deltas from a streaming chat completion"""
+        # Only opening the stream is retried; a failure mid-stream is reported to the caller
+        stream = guarded_call(self.provider, model, lambda: call_with_retries(
+            self.provider,
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=self._build_messages(prompt),
+                stream=True,
+                # Usage, including cached prompt tokens, arrives in a final chunk without choices
+                stream_options={"include_usage": True},
+                timeout=request_timeout(deadline),
+                **self.generation_params
+            ),
+            estimated_tokens=estimate_request_tokens(prompt),
+            deadline=deadline
+        ))
+        # Cancelling closes the response from the caller's thread, unblocking a pending read
+        unregister = deadline.on_cancel(stream.close) if deadline else None
+        try:
+            for chunk in stream:
+                if deadline:
+                    deadline.check()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, 'usage', None):
+                    self._record_usage(model, chunk.usage, deadline)
+        finally:
+            if unregister:
+                unregister()
+            # Release the HTTP connection even if the consumer stops early
+            stream.close()
+    
+    def _build_messages(self, prompt: str) -> list:
+        """Build the chat messages for a review request
+        
+        The system message is constant and prompts start with their shared instructions and
+        problem statement, so OpenAI's automatic prompt caching reuses that prefix across reviews.
+        """
+        return [
+            {"role": "system", "content": "You are a professional Python code reviewer. Provide detailed, constructive feedback."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _record_usage(self, model: str, usage, deadline: Optional[Deadline] = None) -> None:
+        """Record token usage, including prompt tokens served from OpenAI's prompt cache"""
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', None) or 0
+        record_usage(self.provider, model, usage.prompt_tokens, cached_tokens, usage.completion_tokens, deadline)
+    
+    def _should_fall_back(self, error: Exception) -> bool:
+        """Whether the fallback policy applies to this error"""
+        return bool(self.fallback_models) and (is_rate_limit_error(error) or isinstance(error, CircuitOpenError))
+    
+    def _get_fallback_notice(self, fallback_model: str, reason: Exception) -> str:
+        """Notice prefixed to reviews produced by a fallback model, naming why it was used"""
+        if isinstance(reason, CircuitOpenError):
+            return f"⚠️ {self.model_name} is temporarily unavailable. Falling back to {fallback_model}...\n\n"
+        return f"⚠️ {self.model_name} quota exceeded. Falling back to {fallback_model}...\n\n"
+    
+    def _get_fallback_error_response(self, cause: Exception, fallback_error: Exception) -> str:
+        """Build the error response when every fallback model also fails, worded by why the requested model was skipped"""
+        fallback_models = ", ".join(self.fallback_models)
+        if isinstance(cause, CircuitOpenError):
+            skipped = f"{self.model_name} is temporarily unavailable (circuit open, retrying in {cause.retry_in:.0f}s)"
+        else:
+            skipped = f"{self.model_name} quota exceeded"
+        if is_rate_limit_error(fallback_error):
+            return self._get_mock_response(f"❌ {skipped} and fallback to {fallback_models} failed: OpenAI API quota exceeded. Please try using the Gemini model instead, or wait until your quota resets.")
+        else:
+            return self._get_mock_response(f"❌ {skipped} and fallback to {fallback_models} failed: {str(fallback_error)}")
+    
+    def _get_error_response(self, error: Exception) -> str:
+        """Map an API error to a user-facing mock response"""
+        error_message = str(error)
+        status = get_status_code(error)
+        if isinstance(error, ReviewCancelledError):
+            return self._get_mock_response("⏹️ Review cancelled.")
+        elif isinstance(error, ReviewTimeoutError):
+            return self._get_mock_response("❌ OpenAI API did not finish the review before the deadline. Please try again or increase the review timeout.")
+        elif isinstance(error, CircuitOpenError):
+            return self._get_mock_response(f"❌ OpenAI API unavailable: {error_message}")
+        elif status in (401, 403):
+            return self._get_mock_response("❌ Authentication failed. Please check your OpenAI API key.")
+        elif is_rate_limit_error(error):
+            return self._get_mock_response("❌ OpenAI API quota exceeded. Please try using the Gemini model instead, or wait until your quota resets.")
+        elif status is not None:
+            return self._get_mock_response(f"❌ OpenAI API error: {error_message}")
+        else:
+            return self._get_mock_response(f"❌ Unexpected error: {error_message}")
     
     def _get_mock_response(self, error_message: str) -> str:
         """Return a mock response when API is not available"""
-        return f"""
+        return MockReview(f"""
 # Code Review Report
 
 {error_message}
@@ -112,4 +237,4 @@ Since the API is not configured, here's an example of what a code review might l
 - Review and implement the suggestions above
 - Test the code with various edge cases
 - Consider code formatting with tools like black or autopep8
-        """
\ No newline at end of file
+        """)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import os
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+# Environment variable and Streamlit secrets section for each provider's API key
+PROVIDER_KEYS = {
+    'openai': ('OPENAI_API_KEY', 'openai'),
+    'anthropic': ('ANTHROPIC_API_KEY', 'anthropic'),
+    'gemini': ('GEMINI_API_KEY', 'gemini'),
+}
+
+
+class ProviderRegistry:
+    """Process-wide registry that builds each provider client once and shares it across sessions
+
+    Streamlit runs every session's script on its own thread, so client construction
+    is guarded by a lock; the SDK clients themselves are safe to share between threads.
+    A client_factory(provider, api_key) replaces SDK client construction, e.g. in tests.
+    """
+
+    def __init__(self, client_factory: Optional[Callable[[str, str], Any]] = None):
+        self._client_factory = client_factory or self._build_client
+        self._lock = threading.RLock()
+        self._api_keys = {}
+        self._clients = {}
+        self._gemini_models = {}
+        self._gemini_configured = False
+
+    def get_api_key(self, provider: str) -> Optional[str]:
+        """Get a provider API key from the environment or Streamlit secrets, looked up once"""
+        with self._lock:
+            if provider not in self._api_keys:
+                self._api_keys[provider] = self._lookup_api_key(provider)
+            return self._api_keys[provider]
+
+    def get_client(self, provider: str):
+        """Get the shared SDK client for a provider, or None if no API key is configured"""
+        with self._lock:
+            if provider not in self._clients:
+                api_key = self.get_api_key(provider)
+                self._clients[provider] = self._client_factory(provider, api_key) if api_key else None
+            return self._clients[provider]
+
+    def get_gemini_model(self, model_name: str):
+        """Get a shared Gemini model, configuring the SDK on first use"""
+        with self._lock:
+            if model_name not in self._gemini_models:
+                api_key = self.get_api_key('gemini')
+                if not api_key:
+                    return None
+
+                import google.generativeai as genai
+                # genai.configure mutates module-global state, so only do it once per process
+                if not self._gemini_configured:
+                    genai.configure(api_key=api_key)
+                    self._gemini_configured = True
+                self._gemini_models[model_name] = genai.GenerativeModel(model_name)
+            return self._gemini_models[model_name]
+
+    def prewarm(self, providers: Optional[Iterable[str]] = None) -> dict:
+        """Build clients and open a keep-alive connection to each configured provider
+
+        Returns a mapping of provider name to True/False (warmed) or None (no key).
+        """
+        results = {}
+        for provider in providers or PROVIDER_KEYS:
+            if not self.get_api_key(provider):
+                results[provider] = None
+                continue
+            try:
+                self._open_connection(provider)
+                results[provider] = True
+            except Exception:
+                # Pre-warming is best effort; the first real request will retry the connection
+                results[provider] = False
+        return results
+
+    def prewarm_in_background(self, providers: Optional[Iterable[str]] = None) -> threading.Thread:
+        """Pre-warm provider connections without blocking the caller"""
+        thread = threading.Thread(target=self.prewarm, args=(providers,), name="provider-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def reset(self) -> None:
+        """Forget cached keys and clients, e.g. after rotating API keys"""
+        with self._lock:
+            for client in self._clients.values():
+                close = getattr(client, 'close', None)
+                if close:
+                    try:
+                        close()
+                    except Exception:
+                        pass
+            self._api_keys.clear()
+            self._clients.clear()
+            self._gemini_models.clear()
+            self._gemini_configured = False
+
+    def _lookup_api_key(self, provider: str) -> Optional[str]:
+        env_var, secrets_section = PROVIDER_KEYS[provider]
+        # Try to get from environment variable
+        api_key = os.getenv(env_var)
+
+        # If not in environment, try Streamlit secrets
+        if not api_key:
+            try:
+                import streamlit as st
+                api_key = st.secrets[secrets_section]["api_key"]
+            except Exception:
+                pass
+
+        return api_key
+
+    def _build_client(self, provider: str, api_key: str):
+        # Each SDK client owns a keep-alive connection pool, so one client per process
+        # means connections and TLS sessions are reused by every session. The SDKs' own
+        # retries are off so call_with_retries and the shared rate limiter own every retry
+        if provider == 'openai':
+            from openai import OpenAI
+            return OpenAI(api_key=api_key, max_retries=0)
+        if provider == 'anthropic':
+            import anthropic
+            return anthropic.Anthropic(api_key=api_key, max_retries=0)
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    def _open_connection(self, provider: str) -> None:
+        """Issue a cheap authenticated request so TLS is negotiated before the first review"""
+        if provider == 'gemini':
+            self.get_gemini_model('models/gemini-1.5-flash')
+            import google.generativeai as genai
+            next(iter(genai.list_models()), None)
+        elif provider == 'anthropic':
+            self.get_client(provider).models.list(limit=1)
+        else:
+            self.get_client(provider).models.list()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """Get the process-wide provider registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ProviderRegistry()
+    return _registry
@@ -0,0 +1,254 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+from api_handlers.deadline import Deadline, ReviewTimeoutError
+from utils.token_budget import estimate_tokens
+
+T = TypeVar('T')
+
+# Default request and token budgets per provider, overridable with
+# AI_REVIEWER_<PROVIDER>_RPM / AI_REVIEWER_<PROVIDER>_TPM
+DEFAULT_LIMITS = {
+    'openai': {'rpm': 500, 'tpm': 300000},
+    'anthropic': {'rpm': 50, 'tpm': 40000},
+    'gemini': {'rpm': 15, 'tpm': 1000000},
+}
+
+# HTTP statuses worth retrying: rate limited, overloaded or transient server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Exception class names (across the three SDKs) for network-level failures without a status
+RETRYABLE_ERROR_NAMES = {
+    'APIConnectionError', 'APITimeoutError', 'ConnectError', 'ReadTimeout', 'ConnectTimeout',
+    'DeadlineExceeded', 'ServiceUnavailable', 'InternalServerError', 'TooManyRequests', 'ResourceExhausted',
+}
+
+# Error codes meaning the account is out of credit; retrying cannot help
+NON_RETRYABLE_CODES = {'insufficient_quota', 'billing_hard_limit_reached'}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take amount tokens, returning how many seconds the caller must wait before using them
+
+        Tokens may go negative, which queues later callers behind this one instead
+        of letting them race for the same refill.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def wait_time(self, amount: float = 1) -> float:
+        """Seconds a reserve(amount) made now would have to wait, without taking any tokens"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            tokens = min(self.capacity, self._tokens + (time.monotonic() - self._updated_at) * self.rate)
+            tokens -= amount
+            return 0.0 if tokens >= 0 else -tokens / self.rate
+
+
+class ProviderRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by every caller of one provider"""
+
+    def __init__(self, provider: str, requests_per_minute: float, tokens_per_minute: float):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled_seconds': 0.0, 'retries': 0, 'backoffs': 0}
+
+    def acquire(self, estimated_tokens: int = 0, deadline: Optional[Deadline] = None) -> float:
+        """Block until a request of the given size may be sent; returns the time waited
+
+        With a deadline, raise ReviewTimeoutError without reserving anything if the wait
+        would outlast it, and stop waiting as soon as the review is cancelled.
+        """
+        with self._lock:
+            pause = max(0.0, self._blocked_until - time.monotonic())
+
+        if deadline:
+            remaining = deadline.remaining()
+            expected = max(pause, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+            if remaining is not None and expected > remaining:
+                raise ReviewTimeoutError()
+
+        with self._lock:
+            self.stats['requests'] += 1
+        wait = max(pause, self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            with self._lock:
+                self.stats['throttled_seconds'] += wait
+            if deadline:
+                deadline.sleep(wait)
+            else:
+                time.sleep(wait)
+        return wait
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.stats['retries'] += 1
+
+    def back_off(self, seconds: float) -> None:
+        """Pause every caller of this provider, e.g. after a 429 with Retry-After"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self.stats['backoffs'] += 1
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After when the provider sends one"""
+
+    def __init__(self, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """Get the HTTP status of an SDK error (openai/anthropic use status_code, google uses code)"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        code = getattr(error, 'code', None)
+        status = code if isinstance(code, int) else None
+    return status
+
+
+def get_error_code(error: Exception) -> Optional[str]:
+    """Get the provider's machine-readable error code, e.g. 'insufficient_quota'"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, str):
+        return code
+    body = getattr(error, 'body', None)
+    if isinstance(body, dict):
+        inner = body.get('error', body)
+        if isinstance(inner, dict):
+            code = inner.get('code') or inner.get('type')
+            return code if isinstance(code, str) else None
+    return None
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After delay (seconds or HTTP date) from an SDK error's response headers"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an SDK error means the provider is rate limiting or out of quota"""
+    return get_status_code(error) == 429 or type(error).__name__ in ('RateLimitError', 'ResourceExhausted', 'TooManyRequests')
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether an SDK error is transient and worth retrying"""
+    if get_error_code(error) in NON_RETRYABLE_CODES:
+        return False
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def estimate_request_tokens(prompt: str, max_output_tokens: int = 0) -> int:
+    """Token estimate used for tokens-per-minute budgeting"""
+    return estimate_tokens(prompt) + max_output_tokens
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> ProviderRateLimiter:
+    """Get the process-wide rate limiter for a provider, shared by all sessions and the batch CLI"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            defaults = DEFAULT_LIMITS.get(provider, {'rpm': 60, 'tpm': 100000})
+            prefix = f"AI_REVIEWER_{provider.upper()}"
+            _limiters[provider] = ProviderRateLimiter(
+                provider,
+                float(os.getenv(f"{prefix}_RPM", defaults['rpm'])),
+                float(os.getenv(f"{prefix}_TPM", defaults['tpm']))
+            )
+        return _limiters[provider]
+
+
+def call_with_retries(provider: str, request: Callable[[], T], estimated_tokens: int = 0,
+                      policy: Optional[RetryPolicy] = None, deadline: Optional[Deadline] = None) -> T:
+    """Send a request through the provider's rate limiter, retrying transient failures
+
+    Non-retryable errors, and retryable ones once retries are exhausted, are re-raised
+    so the handler can decide how to report them or which fallback model to use. With a
+    deadline, no retry is started that could not finish before it.
+    """
+    policy = policy or RetryPolicy()
+    limiter = get_rate_limiter(provider)
+
+    attempt = 0
+    while True:
+        if deadline:
+            deadline.check()
+        limiter.acquire(estimated_tokens, deadline)
+        if deadline:
+            deadline.check()
+        try:
+            return request()
+        except Exception as e:
+            if attempt >= policy.max_retries or not is_retryable_error(e):
+                raise
+
+            delay = policy.get_delay(attempt, e)
+            if deadline and (deadline.cancelled or (deadline.remaining() is not None and delay >= deadline.remaining())):
+                raise
+            limiter.record_retry()
+            if is_rate_limit_error(e):
+                # Everyone hitting this provider should slow down, not just this caller;
+                # the next acquire() waits out the pause, for as long as the deadline allows
+                limiter.back_off(delay)
+            elif deadline:
+                deadline.sleep(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
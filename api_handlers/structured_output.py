@@ -0,0 +1,42 @@
+from typing import Iterable, Optional
+
+from utils.review_schema import get_review_schema
+
+# Tool Claude is made to call; its input is the structured review
+REVIEW_TOOL_NAME = "submit_review"
+
+
+def get_structured_output_params(handler, fields: Optional[Iterable[str]] = None) -> dict:
+    """Generation parameters that make a provider reply with a JSON object instead of prose
+
+    OpenAI's JSON mode works for every model in its fallback chain, and Gemini takes a
+    response MIME type. Claude has no JSON mode, so it is given one tool whose input
+    schema is the review schema, limited to fields when given, and is forced to call it;
+    ClaudeHandler returns the tool input as the reply.
+    """
+    provider = getattr(handler, 'provider', None)
+    if provider == 'openai':
+        return {'response_format': {'type': 'json_object'}}
+    if provider == 'gemini':
+        return {'response_mime_type': 'application/json'}
+    if provider == 'anthropic':
+        return {
+            'tools': [{
+                'name': REVIEW_TOOL_NAME,
+                'description': "Submit the code review as structured data",
+                'input_schema': get_review_schema(fields),
+            }],
+            'tool_choice': {'type': 'tool', 'name': REVIEW_TOOL_NAME},
+        }
+    return {}
+
+
+def use_structured_output(handler, fields: Optional[Iterable[str]] = None):
+    """Switch a model handler to JSON output; wrap it for failover or hedging only afterwards
+
+    The parameters become part of the handler's generation_params, so structured and
+    markdown reviews of the same prompt never share a cache entry or an in-flight call.
+    """
+    handler.generation_params = {**getattr(handler, 'generation_params', {}),
+                                 **get_structured_output_params(handler, fields)}
+    return handler
@@ -0,0 +1,63 @@
+import threading
+from typing import Optional
+
+from api_handlers.deadline import Deadline
+
+
+class TokenUsage:
+    """Running token counters for one provider model, including prompt tokens served from the provider's cache"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.requests = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, input_tokens: int, cached_tokens: int = 0, output_tokens: int = 0) -> None:
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'key': self.key,
+                'requests': self.requests,
+                'input_tokens': self.input_tokens,
+                'cached_tokens': self.cached_tokens,
+                'output_tokens': self.output_tokens,
+                'cached_rate': round(self.cached_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+            }
+
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+def record_usage(provider: str, model_name: str, input_tokens: Optional[int], cached_tokens: Optional[int] = 0,
+                 output_tokens: Optional[int] = 0, deadline: Optional[Deadline] = None) -> None:
+    """Record the token usage a provider reported for one request
+
+    input_tokens counts every prompt token, including the cached_tokens that were read
+    from the provider's prompt cache. The usage is also added to the request's deadline,
+    if given, so the review it belongs to can report it.
+    """
+    if deadline is not None:
+        deadline.add_usage(model_name, input_tokens, output_tokens)
+    key = f"{provider}:{model_name}"
+    with _usage_lock:
+        if key not in _usage:
+            _usage[key] = TokenUsage(key)
+        usage = _usage[key]
+    usage.record(input_tokens or 0, cached_tokens or 0, output_tokens or 0)
+
+
+def get_usage_snapshots() -> list:
+    """Token usage of every provider model that has reported usage in this process"""
+    with _usage_lock:
+        usages = list(_usage.values())
+    return [usage.snapshot() for usage in usages]
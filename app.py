@@ -1,16 +1,40 @@
 import streamlit as st
 import os
 import tempfile
+import time
 from datetime import datetime
 import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
 
 # Import custom modules
 from api_handlers.openai_api import OpenAIHandler
 from api_handlers.gemini_api import GeminiHandler
+from api_handlers.chunked_review import ChunkedReview
+from api_handlers.coalescing import CoalescingHandler, get_coalescing_stats
 from api_handlers.claude_api import ClaudeHandler
+from api_handlers.failover import FailoverHandler
+from api_handlers.fanout import review_concurrently
+from api_handlers.health import get_health_snapshots
+from api_handlers.hedging import HedgedHandler, get_hedge_stats
+from api_handlers.mock_review import FallbackReview, MockReview, join_review_chunks
+from api_handlers.provider_registry import get_provider_registry
+from api_handlers.structured_output import use_structured_output
+from api_handlers.usage import get_usage_snapshots
 from utils.file_parser import FileParser
+from utils.ingest import UploadRejectedError, ingest_upload
+from utils.job_queue import JobQueue
+from utils.parse_pool import ParsePool
 from utils.prompt_builder import PromptBuilder
+from utils.token_budget import estimate_tokens, get_handler_input_budget
+from utils.parse_cache import ParseCache
+from utils.problem_registry import ProblemRegistry
+from utils.review_cache import ReviewCache
+from utils.review_history import ReviewHistory
+from utils.review_schema import SECTION_FIELDS, SECTION_HEADINGS, ReviewValidationError, parse_structured_review, render_review_markdown
+from utils.similarity_index import SimilarityIndex, get_reusable_review
 from styles.custom_css import load_css
 
 # Page configuration
@@ -24,6 +48,73 @@ st.set_page_config(
 # Load custom CSS
 load_css()
 
+# Models that can be compared side by side
+MODEL_HANDLERS = {
+    "Gemini": GeminiHandler,
+    "GPT-4": OpenAIHandler,
+    "Claude": ClaudeHandler,
+}
+
+# Alternate model used while the selected model's circuit breaker is open
+FAILOVER_MODELS = {
+    "Gemini": "Claude",
+    "GPT-4": "Gemini",
+    "Claude": "GPT-4",
+}
+
+# Default end-to-end time limit for one review, including retries and fallbacks
+DEFAULT_REVIEW_TIMEOUT = 180
+
+# Uploads parsed at once in the background, across every session
+PREPARE_WORKERS = int(os.getenv('AI_REVIEWER_PREPARE_WORKERS', '4'))
+
+@st.cache_resource
+def get_file_parser():
+    """Process-wide file parser; documents are parsed in a shared pool of worker processes"""
+    return FileParser(parse_pool=ParsePool())
+
+@st.cache_resource
+def get_review_cache():
+    """Process-wide review cache shared by every session"""
+    return ReviewCache()
+
+@st.cache_resource
+def get_parse_cache():
+    """Process-wide cache of parsed uploads, so a shared problem statement is parsed once"""
+    return ParseCache()
+
+@st.cache_resource
+def get_problem_registry():
+    """Process-wide registry of condensed problem statements"""
+    return ProblemRegistry()
+
+@st.cache_resource
+def get_similarity_index():
+    """Process-wide index of reviewed solutions, for spotting near-duplicate submissions"""
+    return SimilarityIndex()
+
+@st.cache_resource
+def get_review_history():
+    """Process-wide store of finished reviews, kept across restarts and searchable from the sidebar"""
+    return ReviewHistory()
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide queue of review jobs, run by a worker pool independent of script reruns"""
+    return JobQueue()
+
+@st.cache_resource
+def get_prepare_pool():
+    """Process-wide pool that parses uploads and pre-builds prompts before submit is clicked"""
+    return ThreadPoolExecutor(max_workers=PREPARE_WORKERS, thread_name_prefix="prepare-upload")
+
+@st.cache_resource
+def warm_up_providers():
+    """Optionally open provider connections once per process, before the first review"""
+    if os.getenv('AI_REVIEWER_PREWARM', '').lower() in ('1', 'true', 'yes'):
+        get_provider_registry().prewarm_in_background()
+    return True
+
 def main():
     # Header with modern styling
     st.markdown("""
@@ -33,6 +124,10 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    warm_up_providers()
+    # Start the parse workers before the first upload arrives
+    get_file_parser()
+    
     # Initialize session state
     if 'uploaded_files' not in st.session_state:
         st.session_state.uploaded_files = {'problem': None, 'solution': None}
@@ -40,6 +135,19 @@ def main():
         st.session_state.review_comments = None
     if 'selected_model' not in st.session_state:
         st.session_state.selected_model = 'Gemini'
+    if 'model_reviews' not in st.session_state:
+        st.session_state.model_reviews = None
+    if 'active_job_id' not in st.session_state:
+        # A reconnected session picks its review back up from the job id in the URL
+        st.session_state.active_job_id = st.query_params.get('job')
+    if 'applied_job_id' not in st.session_state:
+        st.session_state.applied_job_id = None
+    if 'prepared_uploads' not in st.session_state:
+        st.session_state.prepared_uploads = {}
+    if 'prepared_prompt' not in st.session_state:
+        st.session_state.prepared_prompt = None
+    if 'structured_review' not in st.session_state:
+        st.session_state.structured_review = None
     
     # Main container with glassmorphism effect
     with st.container():
@@ -61,12 +169,13 @@ def main():
                 "Select Problem Statement",
                 type=['pdf', 'txt', 'doc', 'docx'],
                 key="problem_uploader",
-                help="Upload problem statement in PDF, TXT, or DOC format"
+                help="Upload problem statement in PDF, TXT, or DOC format",
+                on_change=prepare_upload,
+                args=('problem',)
             )
             
             if problem_file:
-                st.session_state.uploaded_files['problem'] = problem_file
-                st.success(f"✅ Uploaded: {problem_file.name}")
+                st.session_state.uploaded_files['problem'] = render_upload('problem', problem_file)
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col2:
@@ -75,12 +184,13 @@ def main():
                 "Select Python Solution",
                 type=['py'],
                 key="solution_uploader",
-                help="Upload your Python solution file"
+                help="Upload your Python solution file",
+                on_change=prepare_upload,
+                args=('solution',)
             )
             
             if solution_file:
-                st.session_state.uploaded_files['solution'] = solution_file
-                st.success(f"✅ Uploaded: {solution_file.name}")
+                st.session_state.uploaded_files['solution'] = render_upload('solution', solution_file)
             st.markdown('</div>', unsafe_allow_html=True)
         
         # Submit button
@@ -92,6 +202,7 @@ def main():
                 disabled=not (st.session_state.uploaded_files['problem'] and st.session_state.uploaded_files['solution']),
                 use_container_width=True
             )
+            render_prepared_prompt()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -113,62 +224,94 @@ def main():
                 "Select AI Model:",
                 ["Gemini", "GPT-4", "Claude", "Copilot/Grok"],
                 horizontal=True,
-                key="model_selector"
+                key="model_selector",
+                on_change=prepare_prompt
             )
             st.session_state.selected_model = selected_model
+            
+            compare_mode = st.toggle(
+                "🔀 Compare models",
+                key="compare_mode",
+                on_change=prepare_prompt,
+                help="Send the same prompt to several models at once and compare their reviews"
+            )
+            if compare_mode:
+                compare_models = st.multiselect(
+                    "Models to compare:",
+                    list(MODEL_HANDLERS),
+                    default=list(MODEL_HANDLERS),
+                    key="compare_models",
+                    on_change=prepare_prompt
+                )
+                build_consensus = st.checkbox(
+                    "🤝 Merge into a consensus review",
+                    key="build_consensus",
+                    help="Ask the first selected model to merge all reviews into one report"
+                )
+            st.number_input(
+                "⏱️ Review timeout (seconds)",
+                min_value=10,
+                max_value=900,
+                value=DEFAULT_REVIEW_TIMEOUT,
+                step=10,
+                key="review_timeout",
+                help="Give up on a review that takes longer than this, including retries and fallbacks"
+            )
+            st.toggle(
+                "📚 Review large files in parts",
+                value=True,
+                key="large_file_mode",
+                help="Split solutions too large for one prompt into functions and classes, review them in parallel and merge the results, instead of truncating the code"
+            )
+            st.toggle(
+                "📋 Condense long problem statements",
+                value=True,
+                key="condense_problem",
+                on_change=prepare_prompt,
+                help="Summarize a long problem statement into its requirements once, and send that summary instead of the full text in every review of the same problem"
+            )
+            st.toggle(
+                "🧱 Structured review",
+                value=False,
+                key="structured_review_mode",
+                disabled=compare_mode,
+                help="Ask the model for each report section as a JSON field, so a weak section can be regenerated on its own for a fraction of the tokens of a full review"
+            )
+            st.toggle(
+                "♻️ Reuse reviews of near-identical solutions",
+                value=False,
+                key="reuse_similar_reviews",
+                help="If this model already reviewed a solution to the same problem that differs only in names, comments or formatting, show that review instead of asking the model again"
+            )
         
         # Fetch comments button
         fetch_col1, fetch_col2, fetch_col3 = st.columns([1, 2, 1])
         with fetch_col2:
             if submit_button and st.session_state.uploaded_files['problem'] and st.session_state.uploaded_files['solution']:
-                with st.spinner("🤖 AI is analyzing your code..."):
-                    try:
-                        # Parse files
-                        file_parser = FileParser()
-                        problem_text = file_parser.parse_file(st.session_state.uploaded_files['problem'])
-                        solution_code = file_parser.parse_file(st.session_state.uploaded_files['solution'])
-                        
-                        # Build prompt
-                        prompt_builder = PromptBuilder()
-                        prompt = prompt_builder.build_review_prompt(problem_text, solution_code)
-                        
-                        # Get AI review based on selected model
-                        if selected_model == "Gemini":
-                            handler = GeminiHandler()
-                            st.info("🤖 Using Gemini model for code review...")
-                        elif selected_model == "GPT-4":
-                            handler = OpenAIHandler()
-                            st.info("🤖 Using OpenAI GPT model for code review...")
-                        else:  # Claude
-                            handler = ClaudeHandler()
-                            st.info("🤖 Using Claude AI model for code review...")
-                        
-                        review_comments = handler.get_review(prompt)
-                        
-                        # Check for quota exceeded fallback message
-                        if "⚠️ GPT-4 quota exceeded. Falling back to GPT-3.5-Turbo..." in review_comments:
-                            st.warning("⚠️ GPT-4 quota exceeded. Falling back to GPT-3.5-Turbo...")
-                            st.success("✅ Code review completed using GPT-3.5-Turbo!")
-                        # Check if both GPT-4 and GPT-3.5 failed due to quota issues
-                        elif "❌ GPT-4 quota exceeded and GPT-3.5 fallback failed" in review_comments:
-                            st.error("OpenAI API quota exceeded. Please try using the Gemini model instead, or wait until your quota resets.")
-                            # Add a button to switch to Gemini
-                            if st.button("Switch to Gemini Model"):
-                                st.session_state.selected_model = "Gemini"
-                                st.experimental_rerun()
-                        # Check if the response contains other error messages
-                        elif "❌" in review_comments and ("API error" in review_comments or "quota exceeded" in review_comments or "insufficient_quota" in review_comments):
-                            st.error("There was an issue with the selected AI model. Consider trying a different model.")
+                try:
+                    if compare_mode and len(compare_models) < 2:
+                        st.warning("Select at least two models to compare.")
+                    else:
+                        if compare_mode:
+                            handlers = {label: CoalescingHandler(MODEL_HANDLERS[label](), label) for label in compare_models}
                         else:
-                            st.success("✅ Code review completed!")
-                            
-                        st.session_state.review_comments = review_comments
-                        
-                    except Exception as e:
-                        st.error(f"❌ Error during review: {str(e)}")
+                            handlers = {selected_model: create_review_handler(
+                                selected_model, st.session_state.get('structured_review_mode', False)
+                            )}
+                        submit_review_job(handlers, compare_mode, compare_mode and build_consensus)
+                except Exception as e:
+                    st.error(f"❌ Error during review: {str(e)}")
+            
+            job = get_active_job()
+            if job is not None:
+                render_review_job(job)
         
         st.markdown('</div>', unsafe_allow_html=True)
     
+    render_cache_stats()
+    render_provider_health()
+    render_review_history()
+    
     # Output Section
     if st.session_state.review_comments:
         with st.container():
@@ -185,7 +328,12 @@ def main():
             st.markdown('<div class="review-container">', unsafe_allow_html=True)
             
             # Display review with syntax highlighting
-            st.markdown(st.session_state.review_comments)
+            if st.session_state.model_reviews:
+                render_model_reviews(st.session_state.model_reviews)
+            else:
+                st.markdown(st.session_state.review_comments)
+            if st.session_state.structured_review:
+                render_section_regeneration()
             
             # Export options
             export_col1, export_col2, export_col3 = st.columns([1, 2, 1])
@@ -202,6 +350,803 @@ def main():
             st.markdown('</div>', unsafe_allow_html=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
+def submit_review_job(handlers, compare_mode, build_consensus):
+    """Queue a review of the uploaded files and remember its job id across reruns and reconnects
+    
+    Everything after the submit click runs on the shared worker pool, so changing a widget
+    while the review is in flight no longer throws the provider call away. A session
+    has one active review: submitting again cancels the previous one.
+    """
+    job_queue = get_job_queue()
+    job_queue.cancel(st.session_state.active_job_id)
+    
+    files = dict(st.session_state.uploaded_files)
+    caches = get_job_caches()
+    # Build prompt, sized for the smallest context among the models that will see it
+    max_input_tokens = min(map(get_handler_input_budget, handlers.values()), default=None)
+    condense_problem = st.session_state.get('condense_problem', True)
+    options = {
+        'compare_mode': compare_mode,
+        'build_consensus': build_consensus,
+        'max_input_tokens': max_input_tokens,
+        'prepared_prompt': take_prepared_prompt(files, max_input_tokens, condense_problem),
+        'condense_problem': condense_problem,
+        'large_file_mode': st.session_state.get('large_file_mode', True),
+        'reuse_similar_reviews': st.session_state.get('reuse_similar_reviews', False),
+        'structured_review': not compare_mode and st.session_state.get('structured_review_mode', False),
+    }
+    job_id = job_queue.submit(
+        lambda job: run_review_job(job, caches, handlers, files, options),
+        label=", ".join(handlers),
+        timeout=st.session_state.get('review_timeout', DEFAULT_REVIEW_TIMEOUT)
+    )
+    st.session_state.active_job_id = job_id
+    st.session_state.review_comments = None
+    st.session_state.model_reviews = None
+    st.session_state.structured_review = None
+    st.query_params['job'] = job_id
+
+def submit_section_job(field):
+    """Queue the regeneration of one section of the current structured review
+    
+    The review stays on screen meanwhile, and is kept unchanged if the job fails.
+    """
+    structured = st.session_state.structured_review
+    job_queue = get_job_queue()
+    job_queue.cancel(st.session_state.active_job_id)
+    handler = create_review_handler(structured['model'], structured=True, fields=[field])
+    caches = get_job_caches()
+    job_id = job_queue.submit(
+        lambda job: run_section_job(job, caches, handler, structured, field),
+        label=f"{structured['model']}: {field}",
+        timeout=st.session_state.get('review_timeout', DEFAULT_REVIEW_TIMEOUT)
+    )
+    st.session_state.active_job_id = job_id
+    st.query_params['job'] = job_id
+
+def get_job_caches():
+    """Process-wide caches and stores for a review job
+    
+    Resolved on the script thread: the worker thread has no script context to call cached getters from.
+    """
+    return SimpleNamespace(
+        file_parser=get_file_parser(),
+        review_cache=get_review_cache(),
+        parse_cache=get_parse_cache(),
+        problem_registry=get_problem_registry(),
+        similarity_index=get_similarity_index(),
+        review_history=get_review_history()
+    )
+
+def prepare_upload(slot):
+    """Uploader callback: ingest the new file and start parsing it in the background, before submit is clicked"""
+    prepared_uploads = st.session_state.setdefault('prepared_uploads', {})
+    uploaded_file = st.session_state.get(f"{slot}_uploader")
+    if uploaded_file is None:
+        prepared_uploads.pop(slot, None)
+    else:
+        get_ingested_upload(slot, uploaded_file)
+    prepare_prompt()
+
+def get_ingested_upload(slot, uploaded_file):
+    """Ingest an upload once, rejecting it early if it breaks a cap, and start its background parse
+    
+    Returns the slot's entry: the ingested file, or the reason it was rejected.
+    """
+    prepared_uploads = st.session_state.setdefault('prepared_uploads', {})
+    prepared = prepared_uploads.get(slot)
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if prepared is not None and file_id is not None and prepared['file_id'] == file_id:
+        return prepared
+    
+    try:
+        ingested, error = ingest_upload(uploaded_file, get_file_parser()), None
+    except UploadRejectedError as e:
+        ingested, error = None, str(e)
+    prepared_uploads[slot] = {
+        'file_id': file_id,
+        'file': ingested,
+        'error': error,
+        'future': get_prepare_pool().submit(parse_upload, get_parse_cache(), get_file_parser(), ingested) if ingested else None,
+    }
+    return prepared_uploads[slot]
+
+def prepare_prompt():
+    """Pre-build the review prompt in the background for the uploads and current options
+    
+    Runs again whenever an option that changes the prompt changes. The submitted job uses
+    the result only if the uploads, token budget and condensing setting still match.
+    """
+    prepared_uploads = st.session_state.setdefault('prepared_uploads', {})
+    st.session_state.prepared_prompt = None
+    if not all(prepared_uploads.get(slot, {}).get('file') for slot in ('problem', 'solution')):
+        return
+    max_input_tokens = get_review_input_budget()
+    if max_input_tokens is None:
+        return
+    condense_problem = st.session_state.get('condense_problem', True)
+    files = {slot: prepared['file'] for slot, prepared in prepared_uploads.items()}
+    st.session_state.prepared_prompt = {
+        'key': get_prepared_key(files, max_input_tokens, condense_problem),
+        'future': get_prepare_pool().submit(
+            build_prepared_prompt, get_parse_cache(), get_file_parser(), files, max_input_tokens,
+            get_problem_registry() if condense_problem else None
+        ),
+    }
+
+def get_review_input_budget():
+    """Prompt token budget of the handlers a review would use with the current options"""
+    if st.session_state.get('compare_mode', False):
+        models = st.session_state.get('compare_models', list(MODEL_HANDLERS))
+    else:
+        selected_model = st.session_state.get('model_selector', 'Gemini')
+        if selected_model not in MODEL_HANDLERS:
+            return None
+        models = [selected_model]
+        alternate_model = FAILOVER_MODELS.get(selected_model)
+        if alternate_model and (st.session_state.get('auto_failover', True) or st.session_state.get('hedge_requests', False)):
+            models.append(alternate_model)
+    return min((get_handler_input_budget(MODEL_HANDLERS[model]()) for model in models), default=None)
+
+def get_prepared_key(files, max_input_tokens, condense_problem):
+    return (
+        getattr(files['problem'], 'sha256', None),
+        getattr(files['solution'], 'sha256', None),
+        max_input_tokens,
+        condense_problem,
+    )
+
+def take_prepared_prompt(files, max_input_tokens, condense_problem):
+    """The background prompt build for exactly these uploads and options, if there is one"""
+    prepared = st.session_state.get('prepared_prompt')
+    key = get_prepared_key(files, max_input_tokens, condense_problem)
+    if not prepared or None in key[:2] or prepared['key'] != key:
+        return None
+    return prepared['future']
+
+def get_prepared_result(future):
+    """Wait for a background prompt build; None if there was none or it could not finish the job"""
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception:
+        # The review parses the files itself and reports the error properly
+        return None
+
+def parse_upload(parse_cache, file_parser, uploaded_file):
+    """Parse an upload into the shared parse cache and estimate its size in tokens"""
+    text = parse_cache.parse(file_parser, uploaded_file)
+    return {'text': text, 'tokens': estimate_tokens(text)}
+
+def build_prepared_prompt(parse_cache, file_parser, files, max_input_tokens, problem_registry=None):
+    """Parse both uploads and assemble the review prompt, unless condensing still needs a model call
+    
+    Parsing goes through the parse cache, so an upload still being parsed by prepare_upload
+    is waited for rather than parsed twice.
+    """
+    problem_text = parse_cache.parse(file_parser, files['problem'])
+    solution_code = parse_cache.parse(file_parser, files['solution'])
+    if problem_registry is not None:
+        problem_text = problem_registry.peek_problem_text(problem_text)
+        if problem_text is None:
+            return None
+    prompt = PromptBuilder(max_input_tokens=max_input_tokens).build_review_prompt(problem_text, solution_code)
+    return {
+        'problem_text': problem_text,
+        'solution_code': solution_code,
+        'prompt': prompt,
+        'prompt_tokens': estimate_tokens(prompt),
+    }
+
+def render_upload(slot, uploaded_file):
+    """Ingest an upload and show whether it was accepted, its size and its background parse
+    
+    Returns the ingested file, or None if the upload was rejected.
+    """
+    prepared = get_ingested_upload(slot, uploaded_file)
+    if prepared['error']:
+        st.error(f"❌ {prepared['error']}")
+        return None
+    
+    info = get_file_parser().get_file_info(prepared['file'])
+    st.success(f"✅ Uploaded: {info['name']} ({info['size_mb']} MB)")
+    future = prepared['future']
+    if not future.done():
+        st.caption("⏳ Parsing in the background...")
+    elif future.exception() is not None:
+        st.caption(f"⚠️ {future.exception()}")
+    else:
+        st.caption(f"📄 Parsed · ~{future.result()['tokens']:,} tokens")
+    return prepared['file']
+
+def render_prepared_prompt():
+    """Tell the user the review prompt is already assembled, so submit goes straight to the model"""
+    prepared = st.session_state.prepared_prompt
+    if prepared and prepared['future'].done() and prepared['future'].exception() is None:
+        result = prepared['future'].result()
+        if result is not None:
+            st.caption(f"⚡ Prompt ready · ~{result['prompt_tokens']:,} tokens")
+
+def get_active_job():
+    """The session's current review job, applying its result to the session once it finishes"""
+    job = get_job_queue().get(st.session_state.active_job_id)
+    if job is None:
+        return None
+    if job.finished and st.session_state.applied_job_id != job.id:
+        # A failed or cancelled job leaves the session as it was: a new review cleared it on submit,
+        # and a section regeneration keeps the review it was improving
+        if job.result is not None:
+            st.session_state.review_comments = job.result.get('review_comments')
+            st.session_state.model_reviews = job.result.get('model_reviews')
+            st.session_state.structured_review = job.result.get('structured_review')
+        st.session_state.applied_job_id = job.id
+    return job
+
+def cancel_active_review():
+    """Cancel button callback: stop the in-flight review and close its provider connections"""
+    get_job_queue().cancel(st.session_state.active_job_id)
+
+def run_review_job(job, caches, handlers, files, options):
+    """Parse, condense and review on a worker thread, reporting through the job instead of st
+    
+    Returns the review text and, when comparing models, the review of each model.
+    """
+    deadline = job.deadline
+    started_at = time.perf_counter()
+    prompt_builder = PromptBuilder(max_input_tokens=options['max_input_tokens'])
+    prepared = get_prepared_result(options['prepared_prompt'])
+    if prepared is not None:
+        # Parsed and assembled in the background while the user was still choosing options
+        problem_text, solution_code, prompt = prepared['problem_text'], prepared['solution_code'], prepared['prompt']
+    else:
+        problem_text, solution_code = load_review_inputs(
+            job, caches, next(iter(handlers.values())), files, options['condense_problem'], prompt_builder
+        )
+        prompt = prompt_builder.build_review_prompt(problem_text, solution_code)
+    # Tokens used so far went into condensing the problem, not into the review
+    usage_before = deadline.get_usage()
+    
+    if options['compare_mode']:
+        return run_model_comparison(job, caches, files, problem_text, solution_code, prompt, handlers,
+                                    options['build_consensus'], prompt_builder, started_at, usage_before)
+    
+    chunked_review = None
+    if options['large_file_mode'] and not prompt_builder.fits_single_prompt(problem_text, solution_code):
+        chunked_review = ChunkedReview(prompt_builder, problem_text, solution_code)
+    
+    label, handler = next(iter(handlers.items()))
+    solution_name = files['solution'].name
+    structured = options['structured_review'] and chunked_review is None
+    if options['structured_review'] and chunked_review:
+        job.notify('info', "🧱 Large solutions reviewed in parts get a regular report, not a structured one")
+    # The prompt may carry a condensed problem; the index is keyed on the statement as uploaded
+    problem_key = ProblemRegistry.make_key(caches.parse_cache.parse(caches.file_parser, files['problem']))
+    # A structured review is only cached as JSON, so there is no reusable report to take from a near-duplicate
+    review_comments, signature = review_near_duplicates(
+        job, caches, handler, problem_key, solution_code, solution_name,
+        options['reuse_similar_reviews'] and not structured
+    )
+    source = 'similar' if review_comments is not None else 'model'
+    sections = None
+    if structured:
+        prompt = prompt_builder.build_structured_review_prompt(problem_text, solution_code)
+        review_comments, sections = run_structured_review(job, caches, handler, prompt)
+        record_reviewed_solution(caches, handler, None, problem_key, solution_code, solution_name,
+                                 review_comments, signature)
+    elif review_comments is None:
+        review_comments = run_single_review(job, caches, handler, prompt, chunked_review)
+        record_reviewed_solution(caches, handler, prompt, problem_key, solution_code, solution_name,
+                                 review_comments, signature, chunked_review)
+    record_review_history(job, caches, files, prompt, started_at, {handler.model_name: review_comments}, source,
+                          get_usage_since(deadline, usage_before))
+    notify_review_outcome(job, review_comments)
+    return {
+        'review_comments': review_comments,
+        'model_reviews': None,
+        # What regenerating a section needs to rebuild the same prompt prefix
+        'structured_review': {
+            'sections': sections,
+            'model': label,
+            'files': files,
+            'max_input_tokens': options['max_input_tokens'],
+            'condense_problem': options['condense_problem'],
+        } if sections else None,
+    }
+
+def load_review_inputs(job, caches, handler, files, condense_problem, prompt_builder):
+    """Parse both uploads and, if enabled, condense the problem statement with handler"""
+    # Uploads parsed speculatively are served from the parse cache, or waited for if still in progress
+    job.set_phase("📄 Parsing files...")
+    problem_text = caches.parse_cache.parse(caches.file_parser, files['problem'])
+    solution_code = caches.parse_cache.parse(caches.file_parser, files['solution'])
+    
+    if condense_problem:
+        job.set_phase("📋 Condensing problem statement...")
+        problem_text = caches.problem_registry.get_problem_text(problem_text, handler, prompt_builder, deadline=job.deadline)
+    job.deadline.check()
+    return problem_text, solution_code
+
+def run_structured_review(job, caches, handler, prompt):
+    """Ask for the review as JSON sections, validate them and render the markdown report
+    
+    Returns the report and its sections. A reply that fails validation is shown as sent,
+    without sections, and is not cached.
+    """
+    review_cache = caches.review_cache
+    reply = review_cache.get(handler, prompt)
+    if reply is None:
+        job.set_phase("🤖 AI is analyzing your code...")
+        reply = handler.get_review(prompt, deadline=job.deadline)
+    else:
+        job.notify('info', "⚡ Served from review cache")
+    if isinstance(reply, MockReview):
+        return reply, None
+    
+    try:
+        sections = parse_structured_review(reply)
+    except ReviewValidationError as e:
+        job.notify('warning', f"⚠️ {str(e)}. Showing the model's reply as it was sent.")
+        return reply, None
+    review_cache.put(handler, prompt, reply)
+    review_comments = render_review_markdown(sections)
+    if isinstance(reply, FallbackReview):
+        # Keep the notice naming the model that actually wrote the review
+        review_comments = FallbackReview(reply[:reply.find('{')] + review_comments)
+    return review_comments, sections
+
+def run_section_job(job, caches, handler, structured, field):
+    """Regenerate one section of a structured review, asking the model for that field only
+    
+    The prompt shares its prefix with the full review's prompt, so the provider can serve
+    it from its prompt cache, and only one section is written instead of the whole report.
+    """
+    started_at = time.perf_counter()
+    files = structured['files']
+    prompt_builder = PromptBuilder(max_input_tokens=structured['max_input_tokens'])
+    problem_text, solution_code = load_review_inputs(
+        job, caches, handler, files, structured['condense_problem'], prompt_builder
+    )
+    prompt = prompt_builder.build_section_prompt(problem_text, solution_code, field, structured['sections'][field])
+    usage_before = job.deadline.get_usage()
+    
+    job.set_phase(f"🔄 Regenerating {SECTION_HEADINGS[field]}...")
+    # Not cached: asking again is meant to give a different answer
+    reply = handler.get_review(prompt, deadline=job.deadline)
+    if isinstance(reply, MockReview):
+        job.notify('error', f"❌ The section was not regenerated: {reply.strip().splitlines()[0]}")
+        return None
+    try:
+        value = parse_structured_review(reply, fields=[field])[field]
+    except ReviewValidationError as e:
+        job.notify('warning', f"⚠️ The section was not regenerated: {str(e)}")
+        return None
+    
+    sections = {**structured['sections'], field: value}
+    review_comments = render_review_markdown(sections)
+    record_review_history(job, caches, files, prompt, started_at, {handler.model_name: review_comments}, 'section',
+                          get_usage_since(job.deadline, usage_before))
+    job.notify('success', f"{SECTION_HEADINGS[field]} regenerated (~{estimate_tokens(reply):,} output tokens)")
+    return {
+        'review_comments': review_comments,
+        'model_reviews': None,
+        'structured_review': {**structured, 'sections': sections},
+    }
+
+def create_review_handler(selected_model, structured=False, fields=None):
+    """Build the handler for the selected model, wrapped for failover and hedging as configured
+    
+    With structured, every provider involved replies in JSON, holding only fields when
+    given. The outermost wrapper
+    coalesces identical reviews in flight from any session into one call.
+    """
+    # Get AI review based on selected model
+    if selected_model == "Gemini":
+        handler = GeminiHandler()
+        st.info("🤖 Using Gemini model for code review...")
+    elif selected_model == "GPT-4":
+        handler = OpenAIHandler()
+        st.info("🤖 Using OpenAI GPT model for code review...")
+    else:  # Claude
+        handler = ClaudeHandler()
+        st.info("🤖 Using Claude AI model for code review...")
+    
+    alternate_model = FAILOVER_MODELS.get(selected_model)
+    
+    def create_alternate():
+        alternate = MODEL_HANDLERS[alternate_model]()
+        return use_structured_output(alternate, fields) if structured else alternate
+    
+    if structured:
+        handler = use_structured_output(handler, fields)
+    if alternate_model and st.session_state.get('auto_failover', True):
+        handler = FailoverHandler(handler, create_alternate(), selected_model, alternate_model)
+    if alternate_model and st.session_state.get('hedge_requests', False):
+        handler = HedgedHandler(handler, create_alternate(), selected_model, alternate_model)
+    return CoalescingHandler(handler, selected_model)
+
+def review_near_duplicates(job, caches, handler, problem_key, solution_code, solution_name, reuse_similar=False):
+    """Flag earlier near-identical solutions to the same problem, reusing one's review if enabled
+    
+    problem_key is the ProblemRegistry key of the statement as uploaded, so whether it
+    was condensed does not change which earlier solutions it is compared with.
+    Returns the reused review (or None) and the solution's MinHash signature.
+    """
+    index = caches.similarity_index
+    signature = index.signature(solution_code)
+    matches = index.find_similar(problem_key, solution_code, signature=signature,
+                                 solution_name=solution_name)
+    if not matches:
+        return None, signature
+    
+    closest = matches[0]
+    job.notify('warning',
+        f"🔎 This solution is {closest['similarity']:.0%} similar to an earlier submission ({closest.get('solution', 'unknown')}). "
+        f"{len(matches)} earlier solution(s) to this problem are near-identical; this may indicate shared or copied work."
+    )
+    if reuse_similar:
+        reused = get_reusable_review(matches, caches.review_cache, handler.model_name)
+        if reused:
+            review, match = reused
+            job.notify('info', f"♻️ Reused the review of {match.get('solution', 'an earlier solution')} ({match['similarity']:.0%} similar); no model call was made")
+            return review, signature
+    return None, signature
+
+def record_reviewed_solution(caches, handler, prompt, problem_key, solution_code, solution_name, review, signature, chunked_review=None):
+    """Add a freshly reviewed solution to the near-duplicate index
+    
+    Pass prompt=None when no reusable review is cached under the prompt, e.g. a structured review.
+    """
+    if isinstance(review, (MockReview, FallbackReview)):
+        return
+    caches.similarity_index.add(problem_key, solution_code, {
+        'solution': solution_name,
+        'model': handler.model_name,
+        # A large file's merged review is cached under its reduce prompt, which is not rebuilt here
+        'review_key': None if chunked_review or prompt is None else caches.review_cache.key_for(handler, prompt),
+    }, signature=signature)
+
+def get_usage_since(deadline, usage_before):
+    """Tokens providers reported per model under the deadline since the usage_before snapshot
+    
+    Models whose review shared another caller's call keep their zero counts, so the
+    history does not estimate tokens nobody spent.
+    """
+    usage = {}
+    coalesced = deadline.get_coalesced()
+    for model, totals in deadline.get_usage().items():
+        earlier = usage_before.get(model, {})
+        tokens = {key: count - earlier.get(key, 0) for key, count in totals.items()}
+        if any(tokens.values()) or model in coalesced:
+            usage[model] = tokens
+    return usage
+
+def record_review_history(job, caches, files, prompt, started_at, reviews, source='model', usage=None):
+    """Save finished reviews, keyed on the uploaded problem and solution, to the review history
+    
+    Token counts are the ones providers reported for each model in usage; they are
+    estimated only for reviews no provider call reported usage for, e.g. cache hits.
+    A model review that shared an identical call in flight is saved as coalesced.
+    """
+    coalesced = job.deadline.get_coalesced()
+    # The prompt may carry a condensed problem; history is keyed on the statement as uploaded
+    problem_text = caches.parse_cache.parse(caches.file_parser, files['problem'])
+    solution_code = caches.parse_cache.parse(caches.file_parser, files['solution'])
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    try:
+        for model, review in reviews.items():
+            reported = (usage or {}).get(model)
+            caches.review_history.record(
+                problem_text, solution_code, model, review,
+                solution_name=files['solution'].name,
+                source='coalesced' if source == 'model' and model in coalesced else source,
+                elapsed_ms=elapsed_ms,
+                input_tokens=reported['input_tokens'] if reported else estimate_tokens(prompt),
+                output_tokens=reported['output_tokens'] if reported else estimate_tokens(str(review))
+            )
+    except sqlite3.Error as e:
+        # The review itself succeeded; only saving it for later failed
+        job.notify('warning', f"⚠️ Review not saved to history: {str(e)}")
+
+def run_single_review(job, caches, handler, prompt, chunked_review=None):
+    """Review the prompt with the given handler, streaming the output into the job"""
+    review_cache = caches.review_cache
+    started_at = time.perf_counter()
+    if chunked_review:
+        # Each part and the merged report go through the cache on their own
+        return run_chunked_review(job, caches, handler, chunked_review)
+    
+    review_comments = review_cache.get(handler, prompt)
+    if review_comments is not None:
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        job.notify('info', f"⚡ Served from review cache in {elapsed_ms:.0f} ms")
+    else:
+        job.set_phase("🤖 AI is analyzing your code...")
+        review_comments = stream_review(job, handler.get_review_stream(prompt, deadline=job.deadline))
+        review_cache.put(handler, prompt, review_comments)
+    return review_comments
+
+def notify_review_outcome(job, review_comments):
+    """Report whether the review succeeded, came from a fallback model or failed"""
+    # Check whether a fallback model or failover provider produced the review
+    if isinstance(review_comments, FallbackReview):
+        job.notify('warning', review_comments.strip().splitlines()[0])
+        job.notify('success', "✅ Code review completed using the fallback model!")
+    # Check if the requested model and its fallbacks all failed due to quota issues
+    elif "quota exceeded and fallback to" in review_comments:
+        job.notify('error', "OpenAI API quota exceeded. Please try using the Gemini model instead, or wait until your quota resets.")
+    # Or the requested model was skipped because its circuit breaker is open
+    elif "circuit open" in review_comments and "fallback to" in review_comments:
+        job.notify('error', "The selected model is temporarily unavailable and its fallback failed too. Please try a different model, or wait for it to recover.")
+    # Handlers return a MockReview whenever the model could not be used
+    elif isinstance(review_comments, MockReview):
+        job.notify('error', "There was an issue with the selected AI model. Consider trying a different model.")
+    else:
+        job.notify('success', "✅ Code review completed!")
+
+def run_chunked_review(job, caches, handler, chunked_review):
+    """Review a large solution part by part in parallel, then stream the merged report"""
+    review_cache = caches.review_cache
+    parts = len(chunked_review.chunks)
+    job.notify('info', f"📚 Large solution: reviewed in {parts} parts in parallel")
+    job.set_phase("📚 Reviewing the solution in parts...")
+    job.set_progress(0.0, f"Reviewed 0 of {parts} parts")
+    
+    chunk_reviews = {}
+    results = chunked_review.review_chunks(handler, review_fn=review_cache.get_review, deadline=job.deadline)
+    for title, review, elapsed in results:
+        chunk_reviews[title] = review
+        job.set_progress(len(chunk_reviews) / parts, f"Reviewed {len(chunk_reviews)} of {parts} parts · {title} took {elapsed:.1f}s")
+    
+    failed = chunked_review.get_failed_review(chunk_reviews)
+    if failed is not None:
+        return failed
+    
+    job.set_phase("🧩 Merging the part reviews into one report...")
+    reduce_prompt = chunked_review.build_reduce_prompt(chunk_reviews)
+    review_comments = stream_review(job, review_cache.get_review_stream(handler, reduce_prompt, deadline=job.deadline))
+    return chunked_review.mark_merged_review(review_comments, chunk_reviews)
+
+def run_model_comparison(job, caches, files, problem_text, solution_code, prompt, handlers, build_consensus, prompt_builder,
+                         review_started_at, usage_before):
+    """Review the same prompt with several models concurrently, publishing each result as it completes
+    
+    Each model's review is saved to the history before a consensus is built, so the
+    consensus call's tokens are not counted against the model that writes it.
+    """
+    labels = list(handlers)
+    review_cache = caches.review_cache
+    job.set_phase(f"🔀 Comparing {len(labels)} models...")
+    job.expect_parts(labels)
+    
+    reviews = {}
+    started_at = time.perf_counter()
+    for label, review, elapsed in review_concurrently(handlers, prompt, review_fn=review_cache.get_review, deadline=job.deadline):
+        reviews[label] = review
+        job.set_part(label, review, elapsed)
+    job.notify('success', f"✅ {len(reviews)} reviews completed in {time.perf_counter() - started_at:.1f}s")
+    
+    # Keep the user's model order rather than completion order
+    model_reviews = {label: reviews[label] for label in labels}
+    record_review_history(job, caches, files, prompt, review_started_at, {
+        handler.model_name: model_reviews[label] for label, handler in handlers.items()
+    }, usage=get_usage_since(job.deadline, usage_before))
+    
+    if build_consensus:
+        usable_reviews = {label: review for label, review in model_reviews.items() if not isinstance(review, MockReview)}
+        if len(usable_reviews) < 2:
+            job.notify('warning', "⚠️ A consensus needs at least two successful reviews.")
+        else:
+            consensus_label = next(iter(usable_reviews))
+            consensus_handler = handlers[consensus_label]
+            consensus_prompt = prompt_builder.build_consensus_prompt(problem_text, solution_code, usable_reviews)
+            job.set_phase(f"🤝 Merging reviews with {consensus_label}...")
+            consensus = stream_review(
+                job, review_cache.get_review_stream(consensus_handler, consensus_prompt, deadline=job.deadline)
+            )
+            model_reviews = {"🤝 Consensus": consensus, **model_reviews}
+    
+    return {
+        'review_comments': "\n\n---\n\n".join(f"# {label}\n\n{review}" for label, review in model_reviews.items()),
+        'model_reviews': model_reviews,
+    }
+
+def render_model_reviews(model_reviews):
+    """Show one tab per model review"""
+    for tab, (label, review) in zip(st.tabs(list(model_reviews)), model_reviews.items()):
+        with tab:
+            st.markdown(review)
+
+def stream_review(job, chunks):
+    """Publish streamed review text to the job's live preview and return the assembled review"""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        job.stream(chunk)
+    # The full review is shown in the output section, so drop the live preview
+    job.clear_preview()
+    return join_review_chunks(parts)
+
+def render_review_job(job):
+    """Show the active review: live progress while it runs, then its notices"""
+    if not job.finished:
+        render_job_progress(job.id)
+        return
+    
+    snapshot = job.snapshot()
+    for level, message in snapshot['notices']:
+        getattr(st, level)(message)
+    if snapshot['status'] == 'cancelled':
+        st.info("⏹️ Review cancelled.")
+    elif snapshot['status'] == 'failed':
+        st.error(f"❌ Error during review: {snapshot['error']}")
+    elif "quota exceeded and fallback to" in (st.session_state.review_comments or ""):
+        # Add a button to switch to Gemini
+        if st.button("Switch to Gemini Model"):
+            st.session_state.selected_model = "Gemini"
+            st.rerun()
+
+@st.fragment(run_every=0.5)
+def render_job_progress(job_id):
+    """Poll a running review job, redrawing only this fragment until it finishes"""
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        # Rerun the whole page so the output section shows the result
+        st.rerun()
+    
+    snapshot = job.snapshot()
+    for level, message in snapshot['notices']:
+        getattr(st, level)(message)
+    if snapshot['status'] == 'queued':
+        queued = get_job_queue().get_stats()['queued']
+        st.info(f"⏳ Waiting for a free review worker ({queued} review(s) queued)...")
+    else:
+        st.caption(f"{snapshot['phase'] or '🤖 Reviewing...'} ({snapshot['elapsed']:.0f}s)")
+    if snapshot['progress']:
+        fraction, text = snapshot['progress']
+        st.progress(fraction, text=text)
+    if snapshot['parts']:
+        for tab, (label, part) in zip(st.tabs(list(snapshot['parts'])), snapshot['parts'].items()):
+            with tab:
+                if part is None:
+                    st.info(f"⏳ Waiting for {label}...")
+                else:
+                    review, elapsed = part
+                    st.caption(f"⏱️ Completed in {elapsed:.1f}s")
+                    st.markdown(review)
+    if snapshot['preview']:
+        st.markdown(snapshot['preview'] + "▌")
+    st.button("⏹️ Cancel review", key="cancel_review", on_click=cancel_active_review)
+
+def render_cache_stats():
+    """Show review cache counters and provider prompt cache usage in the sidebar"""
+    stats = get_review_cache().get_stats()
+    with st.sidebar:
+        st.markdown("### ⚡ Review Cache")
+        st.caption(
+            f"Hits: {stats['hits']} (memory {stats['memory_hits']}, disk {stats['disk_hits']}) · "
+            f"Misses: {stats['misses']} · Hit rate: {stats['hit_rate']:.0%}"
+        )
+        coalescing = get_coalescing_stats()
+        if coalescing['coalesced']:
+            st.caption(
+                f"🔗 {coalescing['coalesced']} of {coalescing['requests']} review calls ({coalescing['coalesced_rate']:.0%}) "
+                f"joined an identical call already in flight"
+            )
+        jobs = get_job_queue().get_stats()
+        if jobs['running'] or jobs['queued']:
+            st.caption(f"🧵 Review jobs: {jobs['running']} running · {jobs['queued']} queued")
+        parsing = get_file_parser().parse_pool.get_stats()
+        if parsing['in_flight']:
+            st.caption(f"📄 Parsing {parsing['in_flight']} document task(s) on {parsing['workers']} worker processes")
+        for usage in get_usage_snapshots():
+            if usage['input_tokens']:
+                st.caption(
+                    f"🧠 {usage['key']}: {usage['cached_tokens']:,} of {usage['input_tokens']:,} prompt tokens "
+                    f"served from the provider's prompt cache ({usage['cached_rate']:.0%})"
+                )
+
+def render_provider_health():
+    """Show circuit breaker state and rolling latency per provider model in the sidebar"""
+    with st.sidebar:
+        st.markdown("### 🩺 Provider Health")
+        st.toggle(
+            "Automatic failover",
+            value=True,
+            key="auto_failover",
+            on_change=prepare_prompt,
+            help="Switch to an alternate provider instantly while the selected one is failing"
+        )
+        st.toggle(
+            "Hedge slow requests",
+            value=False,
+            key="hedge_requests",
+            on_change=prepare_prompt,
+            help="If the model has not started answering within its usual (p95) time, also ask an alternate model and keep the first complete answer"
+        )
+        hedge_stats = get_hedge_stats()
+        if hedge_stats['requests']:
+            st.caption(
+                f"🏁 Hedged {hedge_stats['hedged']} of {hedge_stats['requests']} ({hedge_stats['hedge_rate']:.0%}) · "
+                f"primary wins {hedge_stats['primary_wins']} · alternate wins {hedge_stats['secondary_wins']}"
+            )
+        snapshots = get_health_snapshots()
+        if not snapshots:
+            st.caption("No provider calls yet")
+        state_icons = {'closed': "🟢", 'half_open': "🟡", 'open': "🔴"}
+        for snapshot in snapshots:
+            p95 = f"{snapshot['p95_latency']:.1f}s" if snapshot['p95_latency'] is not None else "–"
+            st.caption(
+                f"{state_icons[snapshot['state']]} {snapshot['key']} · "
+                f"errors {snapshot['error_rate']:.0%} of {snapshot['calls']} · p95 {p95}"
+            )
+
+def render_section_regeneration():
+    """Let the user regenerate one section of a structured review"""
+    running = get_active_job()
+    section_col, button_col = st.columns([3, 1])
+    with section_col:
+        field = st.selectbox(
+            "Section to regenerate",
+            SECTION_FIELDS,
+            format_func=SECTION_HEADINGS.get,
+            key="regenerate_section",
+            label_visibility="collapsed"
+        )
+    with button_col:
+        if st.button("🔄 Regenerate section", use_container_width=True, disabled=running is not None and not running.finished):
+            submit_section_job(field)
+            st.rerun()
+
+def render_review_history():
+    """Sidebar panel to search past reviews and load one without calling a model"""
+    history = get_review_history()
+    with st.sidebar:
+        st.markdown("### 📜 Review History")
+        query = st.text_input("Search past reviews", key="history_query", placeholder="e.g. recursion, off-by-one")
+        if query.strip():
+            sections = [(None, history.search(query, limit=10))]
+        else:
+            parsed = get_parsed_uploads()
+            matches = history.find(parsed['problem'], parsed['solution'], limit=5) if parsed else []
+            sections = [("📌 Past reviews of these files", matches), ("🕘 Recent reviews", history.recent(5))]
+        
+        shown = set()
+        for title, entries in sections:
+            entries = [entry for entry in entries if entry['id'] not in shown]
+            if title and entries:
+                st.caption(title)
+            for entry in entries:
+                shown.add(entry['id'])
+                reviewed_at = datetime.fromtimestamp(entry['created_at']).strftime('%Y-%m-%d %H:%M')
+                st.button(
+                    f"{entry['solution_name'] or 'solution'} · {entry['model']} · {reviewed_at}",
+                    key=f"history_{entry['id']}",
+                    on_click=load_history_entry,
+                    args=(entry['id'],),
+                    use_container_width=True
+                )
+        if not shown:
+            st.caption("No matching reviews yet" if query.strip() else "Finished reviews are saved here")
+
+def get_parsed_uploads():
+    """Parsed text of both current uploads, if their background parses have finished"""
+    parsed = {}
+    for slot in ('problem', 'solution'):
+        future = (st.session_state.get('prepared_uploads', {}).get(slot) or {}).get('future')
+        if future is None or not future.done() or future.exception() is not None:
+            return None
+        parsed[slot] = future.result()['text']
+    return parsed
+
+def load_history_entry(entry_id):
+    """History button callback: show a stored review as the current review"""
+    entry = get_review_history().get(entry_id)
+    if entry is not None:
+        st.session_state.review_comments = entry['review']
+        st.session_state.model_reviews = None
+        st.session_state.structured_review = None
+
 def export_review_as_txt(review_text):
     """Export review comments as TXT file"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Headless batch review for AI Code Reviewer
+
+Reviews many (problem, solution) pairs without the Streamlit UI, reusing the
+same file parser, prompt builder, handlers and review and parse caches as the web app.
+Results are appended to a JSONL file as each review finishes, and pairs that
+already have a successful result in that file are skipped, so an interrupted
+run can simply be restarted.
+
+Usage:
+    # One problem statement against every .py file in a directory
+    python batch_review.py --problem spec.pdf --solutions submissions/ --output results.jsonl
+
+    # Explicit pairs from a manifest (JSONL or CSV with "problem" and "solution" columns)
+    python batch_review.py --manifest pairs.csv --model claude --concurrency 16
+"""
+
+import argparse
+import csv
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+from api_handlers.chunked_review import ChunkedReview
+from api_handlers.claude_api import ClaudeHandler
+from api_handlers.coalescing import CoalescingHandler
+from api_handlers.deadline import Deadline
+from api_handlers.gemini_api import GeminiHandler
+from api_handlers.mock_review import FallbackReview, MockReview
+from api_handlers.openai_api import OpenAIHandler
+from utils.file_parser import FileParser
+from utils.ingest import ingest_upload
+from utils.parse_pool import ParsePool
+from utils.parse_cache import ParseCache
+from utils.problem_registry import ProblemRegistry
+from utils.similarity_index import SimilarityIndex, get_reusable_review
+from utils.prompt_builder import PromptBuilder
+from utils.review_cache import ReviewCache
+from utils.review_history import ReviewHistory
+from utils.token_budget import estimate_tokens, get_handler_input_budget
+
+MODEL_HANDLERS = {
+    'gemini': GeminiHandler,
+    'gpt-4': OpenAIHandler,
+    'claude': ClaudeHandler,
+}
+
+
+def collect_pairs(problem=None, solutions=None, manifest=None):
+    """Build the list of review pairs from a problem + solutions directory or a manifest"""
+    pairs = []
+
+    if manifest:
+        manifest = Path(manifest)
+        base_dir = manifest.parent
+        with open(manifest, 'r', encoding='utf-8', newline='') as f:
+            if manifest.suffix.lower() == '.csv':
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+        for row in rows:
+            problem_path = base_dir / row['problem']
+            solution_path = base_dir / row['solution']
+            pairs.append({
+                'id': row.get('id') or f"{problem_path}::{solution_path}",
+                'problem': str(problem_path),
+                'solution': str(solution_path),
+            })
+    else:
+        solutions = Path(solutions)
+        solution_paths = sorted(solutions.rglob('*.py')) if solutions.is_dir() else [solutions]
+        for solution_path in solution_paths:
+            pairs.append({
+                'id': f"{problem}::{solution_path}",
+                'problem': str(problem),
+                'solution': str(solution_path),
+            })
+
+    return pairs
+
+
+def load_completed(output_path, model):
+    """Return the ids of pairs that already have a successful review for this model"""
+    completed = set()
+    output_path = Path(output_path)
+    if not output_path.exists():
+        return completed
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if record.get('status') == 'ok' and record.get('model') == model:
+                completed.add(record['id'])
+    return completed
+
+
+def run_batch(pairs, handler_factory, output_path, model, concurrency=4, review_cache=None, progress=None,
+              timeout=None, parse_cache=None, problem_registry=None, similarity_index=None, reuse_similar=False,
+              file_parser=None, review_history=None):
+    """Review pairs with a bounded worker pool, appending one JSONL record per finished review
+
+    Each review gets its own end-to-end deadline of ``timeout`` seconds when one is given.
+    With a problem_registry, long problem statements are condensed once and the summary
+    is sent in every review of that problem. With a similarity_index, records list
+    near-duplicate earlier solutions, and reuse_similar takes the cached review of the
+    closest one instead of calling the model. With a review_history, every successful
+    review is also saved there, searchable and reloadable from the web app.
+    Returns a summary dict with ok/error/skipped counts.
+    """
+    completed = load_completed(output_path, model)
+    pending = [pair for pair in pairs if pair['id'] not in completed]
+    summary = {'total': len(pairs), 'skipped': len(pairs) - len(pending), 'ok': 0, 'error': 0}
+
+    file_parser = file_parser or FileParser()
+    # Duplicate submissions reviewed at the same time share one provider call
+    handler = CoalescingHandler(handler_factory())
+    prompt_builder = PromptBuilder(max_input_tokens=get_handler_input_budget(handler))
+
+    def parse(path):
+        # Oversized or mislabeled files are rejected before parsing, and recorded as errors
+        with open(path, 'rb') as f:
+            ingested = ingest_upload(f, file_parser)
+        try:
+            if parse_cache:
+                return parse_cache.parse(file_parser, ingested)
+            return file_parser.parse_file(ingested)
+        finally:
+            ingested.close()
+
+    # Many solutions share one problem statement, so parse each problem only once
+    problem_texts = {}
+    problem_locks = {}
+    problem_lock = threading.Lock()
+    write_lock = threading.Lock()
+
+    def get_problem_text(problem_path):
+        """The problem statement as uploaded, and the text to put in prompts"""
+        # The global lock only hands out per-problem locks, so condensing one problem
+        # never blocks workers reviewing solutions to another
+        with problem_lock:
+            path_lock = problem_locks.setdefault(problem_path, threading.Lock())
+        with path_lock:
+            if problem_path not in problem_texts:
+                statement = problem_text = parse(problem_path)
+                if problem_registry:
+                    problem_text = problem_registry.get_problem_text(problem_text, handler, prompt_builder, deadline=Deadline(timeout))
+                problem_texts[problem_path] = (statement, problem_text)
+            return problem_texts[problem_path]
+
+    def review_pair(pair):
+        started_at = time.perf_counter()
+        record = {'id': pair['id'], 'problem': pair['problem'], 'solution': pair['solution'], 'model': model}
+        try:
+            statement, problem_text = get_problem_text(pair['problem'])
+            solution_code = parse(pair['solution'])
+            deadline = Deadline(timeout)
+            review_key = None
+            reused = None
+            prompt = None
+            if similarity_index is not None:
+                # Keyed on the statement as uploaded, whether or not it was condensed
+                problem_key = ProblemRegistry.make_key(statement)
+                signature = similarity_index.signature(solution_code)
+                matches = similarity_index.find_similar(problem_key, solution_code, signature=signature,
+                                                        solution_name=str(pair['solution']))
+                if matches:
+                    record['near_duplicates'] = [{'solution': m.get('solution'), 'similarity': m['similarity']} for m in matches]
+                if reuse_similar and review_cache:
+                    reused = get_reusable_review(matches, review_cache, handler.model_name)
+
+            if reused:
+                review, match = reused
+                record['reused_from'] = match.get('solution')
+            elif prompt_builder.fits_single_prompt(problem_text, solution_code):
+                prompt = prompt_builder.build_review_prompt(problem_text, solution_code)
+                if review_cache:
+                    review = review_cache.get_review(handler, prompt, deadline=deadline)
+                    review_key = review_cache.key_for(handler, prompt)
+                else:
+                    review = handler.get_review(prompt, deadline=deadline)
+            else:
+                # Too large for one prompt: review it part by part instead of truncating
+                chunked_review = ChunkedReview(prompt_builder, problem_text, solution_code)
+                review_fn = review_cache.get_review if review_cache else None
+                review = chunked_review.get_review(handler, review_fn=review_fn, deadline=deadline)
+                record['parts'] = len(chunked_review.chunks)
+
+            record['status'] = 'error' if isinstance(review, MockReview) else 'ok'
+            record['fallback_model_used'] = isinstance(review, FallbackReview)
+            record['review'] = str(review)
+            if similarity_index is not None and not reused and record['status'] == 'ok':
+                similarity_index.add(problem_key, solution_code, {
+                    'solution': str(pair['solution']),
+                    'model': handler.model_name,
+                    # Fallback reviews are not cached, so they cannot be reused
+                    'review_key': None if record['fallback_model_used'] else review_key,
+                }, signature=signature)
+            if review_history and record['status'] == 'ok':
+                # Token counts the provider reported; estimated only when no call reported any, e.g. a cache hit
+                reported = deadline.get_usage().get(handler.model_name)
+                review_history.record(
+                    statement, solution_code, handler.model_name, review,
+                    solution_name=Path(pair['solution']).name,
+                    source='similar' if reused else ('coalesced' if handler.model_name in deadline.get_coalesced() else 'model'),
+                    elapsed_ms=(time.perf_counter() - started_at) * 1000,
+                    input_tokens=reported['input_tokens'] if reported else (estimate_tokens(prompt) if prompt else None),
+                    output_tokens=reported['output_tokens'] if reported else estimate_tokens(str(review))
+                )
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+
+        record['model_name'] = handler.model_name
+        record['elapsed_seconds'] = round(time.perf_counter() - started_at, 3)
+        record['reviewed_at'] = datetime.now(timezone.utc).isoformat()
+        return record
+
+    with open(output_path, 'a', encoding='utf-8') as output_file:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-review") as executor:
+            futures = [executor.submit(review_pair, pair) for pair in pending]
+            for done, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                summary[record['status']] += 1
+                with write_lock:
+                    output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output_file.flush()
+                if progress:
+                    progress(done, len(pending), record)
+
+    return summary
+
+
+def print_progress(done, total, record):
+    status = "✅" if record['status'] == 'ok' else "❌"
+    print(f"[{done}/{total}] {status} {record['solution']} ({record['elapsed_seconds']:.1f}s)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Review many Python solutions without the web UI")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--solutions', help="Solution .py file or directory of .py files (requires --problem)")
+    source.add_argument('--manifest', help="JSONL or CSV manifest with 'problem' and 'solution' columns")
+    parser.add_argument('--problem', help="Problem statement file (PDF, TXT, DOC, DOCX)")
+    parser.add_argument('--model', choices=sorted(MODEL_HANDLERS), default='gemini', help="Model to review with")
+    parser.add_argument('--output', default='review_results.jsonl', help="JSONL file results are appended to")
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum number of reviews in flight")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the shared review, parse and similarity caches")
+    parser.add_argument('--reuse-similar', action='store_true',
+                        help="Reuse the cached review of a near-identical earlier solution instead of calling the model")
+    parser.add_argument('--no-history', action='store_true', help="Do not save reviews to the review history database")
+    parser.add_argument('--full-problem', action='store_true', help="Send full problem statements instead of condensed summaries")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds each review may take, including retries")
+    args = parser.parse_args(argv)
+
+    if args.solutions and not args.problem:
+        parser.error("--solutions requires --problem")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.timeout <= 0:
+        parser.error("--timeout must be positive")
+
+    pairs = collect_pairs(problem=args.problem, solutions=args.solutions, manifest=args.manifest)
+    review_cache = None if args.no_cache else ReviewCache()
+    parse_cache = None if args.no_cache else ParseCache()
+    problem_registry = None if args.full_problem else ProblemRegistry()
+    similarity_index = None if args.no_cache else SimilarityIndex()
+    review_history = None if args.no_history else ReviewHistory()
+    # Documents are parsed in worker processes, leaving the GIL to the review threads
+    parse_pool = ParsePool()
+
+    started_at = time.perf_counter()
+    try:
+        summary = run_batch(
+            pairs,
+            MODEL_HANDLERS[args.model],
+            args.output,
+            args.model,
+            concurrency=args.concurrency,
+            review_cache=review_cache,
+            progress=print_progress,
+            timeout=args.timeout,
+            parse_cache=parse_cache,
+            problem_registry=problem_registry,
+            similarity_index=similarity_index,
+            reuse_similar=args.reuse_similar,
+            file_parser=FileParser(parse_pool=parse_pool),
+            review_history=review_history
+        )
+    finally:
+        parse_pool.close()
+        if review_history:
+            review_history.close()
+    elapsed = time.perf_counter() - started_at
+
+    print(
+        f"Reviewed {summary['ok'] + summary['error']} of {summary['total']} pairs in {elapsed:.1f}s: "
+        f"{summary['ok']} ok, {summary['error']} failed, {summary['skipped']} already done",
+        file=sys.stderr
+    )
+    return 0 if summary['error'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for AI Code Reviewer
+
+Runs the application's module imports in a fresh interpreter under
+``python -X importtime`` and reports cumulative import cost, so cold-start
+regressions (e.g. a provider SDK imported at module load) are caught early.
+
+Usage:
+    python bench_imports.py                 # report import times
+    python bench_imports.py --max-ms 400    # fail if total import time exceeds 400 ms
+    python bench_imports.py --json          # machine-readable output
+"""
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_app_modules(path=os.path.join(PROJECT_ROOT, 'app.py')):
+    """Project modules app.py imports at startup, read from its module-level import statements
+
+    Importing app itself would run the Streamlit script, so its imports are found with ast
+    instead; the list stays in step with app.py without being maintained by hand.
+    """
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            package = name.split('.')[0]
+            is_project_module = (os.path.isdir(os.path.join(PROJECT_ROOT, package))
+                                 or os.path.isfile(os.path.join(PROJECT_ROOT, f"{package}.py")))
+            if is_project_module and name not in modules:
+                modules.append(name)
+    return modules
+
+
+# Modules app.py imports at startup
+APP_MODULES = get_app_modules()
+
+# Heavy dependencies that must only be imported when actually used
+LAZY_MODULES = [
+    'openai',
+    'anthropic',
+    'google.generativeai',
+    'fitz',
+    'docx',
+    'reportlab',
+]
+
+
+def run_importtime(modules):
+    """Import modules in a fresh interpreter and return (timings, loaded lazy modules)"""
+    code = "\n".join(
+        [f"import {module}" for module in modules]
+        + ["import sys", f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"]
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        # The traceback follows the import timings on stderr; its last line names what failed
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"
+        raise RuntimeError(f"Import failed: {error}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package", nesting shown by indentation
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name[1:].rstrip()
+        timings[name.strip()] = {
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'top_level': not name.startswith(' ')
+        }
+
+    loaded_lazy = [module for module in result.stdout.strip().split(',') if module]
+    return timings, loaded_lazy
+
+
+def summarize(timings, modules, top):
+    """Build the benchmark report"""
+    # Interpreter startup imports are constant, so only count the project's own top-level imports
+    project_packages = {module.split('.')[0] for module in modules}
+    total_ms = sum(
+        t['cumulative_us'] for name, t in timings.items()
+        if t['top_level'] and name.split('.')[0] in project_packages
+    ) / 1000
+
+    slowest = sorted(timings.items(), key=lambda item: item[1]['cumulative_us'], reverse=True)[:top]
+    return {
+        'total_ms': round(total_ms, 1),
+        'app_modules': {
+            module: round(timings[module]['cumulative_us'] / 1000, 1)
+            for module in modules if module in timings
+        },
+        'slowest': [
+            {'module': name, 'cumulative_ms': round(t['cumulative_us'] / 1000, 1)}
+            for name, t in slowest
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time of AI Code Reviewer")
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest imports to show")
+    parser.add_argument('--max-ms', type=float, help="Fail if total import time exceeds this many milliseconds")
+    parser.add_argument('--runs', type=int, default=3, help="Take the best of this many runs")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    reports = []
+    loaded_lazy = []
+    for _ in range(args.runs):
+        try:
+            timings, loaded_lazy = run_importtime(APP_MODULES)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            print("Install the app's dependencies first: pip install -r requirements.txt")
+            return 1
+        reports.append(summarize(timings, APP_MODULES, args.top))
+    report = min(reports, key=lambda r: r['total_ms'])
+    report['eagerly_loaded_sdks'] = loaded_lazy
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("⏱️ AI Code Reviewer import-time benchmark")
+        print("=" * 50)
+        print(f"Total import time (best of {args.runs}): {report['total_ms']} ms\n")
+        print("App modules (cumulative):")
+        for module, ms in report['app_modules'].items():
+            print(f"  {ms:8.1f} ms  {module}")
+        print(f"\nSlowest {args.top} imports (cumulative):")
+        for entry in report['slowest']:
+            print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+
+    failed = False
+    if loaded_lazy:
+        print(f"\n❌ Heavy dependencies imported at startup: {', '.join(loaded_lazy)}")
+        failed = True
+    if args.max_ms is not None and report['total_ms'] > args.max_ms:
+        print(f"\n❌ Import time {report['total_ms']} ms exceeds budget of {args.max_ms} ms")
+        failed = True
+    if not failed and not args.json:
+        print("\n✅ Import time within budget")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
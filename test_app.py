@@ -5,10 +5,23 @@ Test script for AI Code Reviewer application
 
 import sys
 import os
+from contextlib import contextmanager
 
 # Add the project root to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+@contextmanager
+def stub_provider_clients():
+    """Give handlers built inside the block placeholder clients instead of real SDK clients"""
+    from api_handlers import provider_registry
+    
+    previous = provider_registry._registry
+    provider_registry._registry = provider_registry.ProviderRegistry(client_factory=lambda provider, api_key: object())
+    try:
+        yield
+    finally:
+        provider_registry._registry = previous
+
 def test_imports():
     """Test that all modules can be imported"""
     print("Testing imports...")
@@ -133,6 +146,1676 @@ def test_mock_reviews():
     except Exception as e:
         print(f"❌ Mock review failed: {e}")
 
+def test_review_cache():
+    """Test review cache functionality"""
+    print("\nTesting review cache...")
+    
+    import tempfile
+    from utils.review_cache import ReviewCache
+    from api_handlers.mock_review import MockReview
+    
+    class CountingHandler:
+        model_name = "test-model"
+        generation_params = {'temperature': 0.0}
+        
+        def __init__(self):
+            self.calls = 0
+        
+        def get_review(self, prompt, deadline=None):
+            self.calls += 1
+            return f"Review of: {prompt}"
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        handler = CountingHandler()
+        cache = ReviewCache(cache_dir=cache_dir)
+        cache.get_review(handler, "prompt")
+        cache.get_review(handler, "prompt")
+        if handler.calls == 1 and cache.get_stats()['memory_hits'] == 1:
+            print("✅ Review cache serving repeated prompts from memory")
+        else:
+            print("❌ Review cache not serving repeated prompts")
+        
+        # A fresh instance on the same directory simulates a restart
+        restarted = ReviewCache(cache_dir=cache_dir)
+        if restarted.get(handler, "prompt") == "Review of: prompt" and restarted.get_stats()['disk_hits'] == 1:
+            print("✅ Review cache survives restarts")
+        else:
+            print("❌ Review cache lost entries on restart")
+        
+        handler.generation_params = {'temperature': 0.7}
+        restarted.put(handler, "prompt", MockReview("fallback"))
+        if restarted.get(handler, "prompt") is None:
+            print("✅ Review cache keys on generation parameters and skips mock reviews")
+        else:
+            print("❌ Review cache returned a review for different parameters")
+
+    from utils.cache import DISK_LOW_WATER_RATIO, TwoTierCache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = TwoTierCache(cache_dir, max_disk_bytes=10000)
+        written = 0
+        while cache.get_stats()['evictions'] == 0:
+            cache.set(f"{written:02d}-entry", "x" * 200)
+            written += 1
+        stats = cache.get_stats()
+        # One eviction frees a batch of entries, so the following writes need no rescan
+        if stats['disk_bytes'] <= 10000 * DISK_LOW_WATER_RATIO and stats['evictions'] > 1:
+            print("✅ Disk tier evicts down to its low-water mark")
+        else:
+            print(f"❌ Disk tier eviction did not free space in batches: {stats}")
+
+def test_review_streaming():
+    """Test streaming review functionality"""
+    print("\nTesting review streaming...")
+    
+    import tempfile
+    from utils.review_cache import ReviewCache
+    from api_handlers.openai_api import OpenAIHandler
+    from api_handlers.claude_api import ClaudeHandler
+    from api_handlers.gemini_api import GeminiHandler
+    
+    for handler_class in (OpenAIHandler, ClaudeHandler, GeminiHandler):
+        if hasattr(handler_class, 'get_review_stream'):
+            print(f"✅ {handler_class.__name__} supports streaming")
+        else:
+            print(f"❌ {handler_class.__name__} does not support streaming")
+    
+    class StreamingHandler:
+        model_name = "stream-model"
+        generation_params = {}
+        
+        def get_review_stream(self, prompt, deadline=None):
+            yield "## Code "
+            yield "Review"
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ReviewCache(cache_dir=cache_dir)
+        handler = StreamingHandler()
+        chunks = list(cache.get_review_stream(handler, "prompt"))
+        cached_chunks = list(cache.get_review_stream(handler, "prompt"))
+        if chunks == ["## Code ", "Review"] and cached_chunks == ["## Code Review"]:
+            print("✅ Streamed reviews are cached once complete")
+        else:
+            print("❌ Streamed reviews not cached correctly")
+
+def test_provider_registry():
+    """Test provider registry functionality"""
+    print("\nTesting provider registry...")
+    
+    import threading
+    from api_handlers.provider_registry import ProviderRegistry
+    
+    previous_key = os.environ.get('OPENAI_API_KEY')
+    os.environ['OPENAI_API_KEY'] = 'sk-test'
+    try:
+        built = []
+        def build_client(provider, api_key):
+            built.append((provider, api_key))
+            return object()
+        
+        registry = ProviderRegistry(client_factory=build_client)
+        clients = []
+        errors = []
+        def get_client():
+            try:
+                clients.append(registry.get_client('openai'))
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=get_client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if (not errors and len(clients) == 8 and clients[0] is not None
+                and all(client is clients[0] for client in clients) and built == [('openai', 'sk-test')]):
+            print("✅ Provider registry shares one client across threads")
+        else:
+            print(f"❌ Provider registry built {len(built)} clients for {len(clients)} threads, errors: {errors}")
+    except Exception as e:
+        print(f"❌ Provider registry failed: {e}")
+    finally:
+        if previous_key is None:
+            os.environ.pop('OPENAI_API_KEY', None)
+        else:
+            os.environ['OPENAI_API_KEY'] = previous_key
+
+def test_lazy_imports():
+    """Test that provider SDKs and heavy parsers are not imported at startup"""
+    print("\nTesting lazy imports...")
+    
+    from bench_imports import APP_MODULES, run_importtime
+    
+    try:
+        _, loaded_lazy = run_importtime(APP_MODULES)
+        if not loaded_lazy:
+            print("✅ No provider SDKs or heavy parsers imported at startup")
+        else:
+            print(f"❌ Imported at startup: {', '.join(loaded_lazy)}")
+    except Exception as e:
+        print(f"❌ Import-time benchmark failed: {e}")
+
+def test_fanout_review():
+    """Test concurrent multi-model review functionality"""
+    print("\nTesting multi-model fan-out...")
+    
+    import time
+    from api_handlers.fanout import review_concurrently
+    from utils.prompt_builder import PromptBuilder
+    
+    class SlowHandler:
+        def __init__(self, delay):
+            self.delay = delay
+        
+        def get_review(self, prompt, deadline=None):
+            time.sleep(self.delay)
+            return f"Review after {self.delay}s"
+    
+    handlers = {"slow": SlowHandler(0.3), "fast": SlowHandler(0.1), "medium": SlowHandler(0.2)}
+    started_at = time.perf_counter()
+    results = list(review_concurrently(handlers, "prompt"))
+    elapsed = time.perf_counter() - started_at
+    
+    if [label for label, _, _ in results] == ["fast", "medium", "slow"]:
+        print("✅ Fan-out yields reviews in completion order")
+    else:
+        print("❌ Fan-out did not yield reviews in completion order")
+    
+    if elapsed < 0.5:
+        print(f"✅ Fan-out took {elapsed:.2f}s (slowest model, not the sum)")
+    else:
+        print(f"❌ Fan-out took {elapsed:.2f}s, reviews ran sequentially")
+    
+    prompt = PromptBuilder().build_consensus_prompt("Problem", "def f(): pass", {"A": "Review A", "B": "Review B"})
+    if "Review from A" in prompt and "Review from B" in prompt:
+        print("✅ Consensus prompt includes every review")
+    else:
+        print("❌ Consensus prompt missing reviews")
+
+def test_batch_review():
+    """Test headless batch review functionality"""
+    print("\nTesting batch review...")
+    
+    import json
+    import tempfile
+    import threading
+    import time
+    from pathlib import Path
+    from batch_review import collect_pairs, run_batch
+    from api_handlers.usage import record_usage
+    from utils.review_history import ReviewHistory
+    
+    class EchoHandler:
+        model_name = "echo-model"
+        generation_params = {}
+        calls = 0
+        
+        def get_review(self, prompt, deadline=None):
+            EchoHandler.calls += 1
+            record_usage("echo", self.model_name, 120, 0, 7, deadline)
+            return "Looks good"
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        (tmp_dir / "problem.txt").write_text("Add two numbers")
+        (tmp_dir / "solutions").mkdir()
+        for i in range(5):
+            (tmp_dir / "solutions" / f"student{i}.py").write_text(f"def add(a, b):\n    return a + b  # {i}\n")
+        
+        pairs = collect_pairs(problem=tmp_dir / "problem.txt", solutions=tmp_dir / "solutions")
+        output_path = tmp_dir / "results.jsonl"
+        history = ReviewHistory(tmp_dir / "history.sqlite3")
+        summary = run_batch(pairs, EchoHandler, output_path, "echo", concurrency=3, review_history=history)
+        records = [json.loads(line) for line in output_path.read_text().splitlines()]
+        if summary['ok'] == 5 and len(records) == 5 and all(r['status'] == 'ok' for r in records):
+            print("✅ Batch review wrote one result per pair")
+        else:
+            print(f"❌ Batch review results incomplete: {summary}")
+        
+        entries = history.find("Add two numbers", "def add(a, b):\n    return a + b  # 3\n")
+        if len(entries) == 1 and history.get_stats()['reviews'] == 5:
+            print("✅ Batch reviews saved to the review history")
+        else:
+            print(f"❌ Batch reviews missing from history: {history.get_stats()}")
+        if entries and (entries[0]['input_tokens'], entries[0]['output_tokens']) == (120, 7):
+            print("✅ History stores the token counts the provider reported")
+        else:
+            print(f"❌ History stored estimated token counts: {entries}")
+        history.close()
+        
+        resumed = run_batch(pairs, EchoHandler, output_path, "echo", concurrency=3)
+        if resumed['skipped'] == 5 and EchoHandler.calls == 5:
+            print("✅ Batch review resumes without repeating finished pairs")
+        else:
+            print(f"❌ Batch review repeated finished pairs: {resumed}")
+
+        class SlowRegistry:
+            """Condenses each problem slowly, tracking how many condense at once"""
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.active = 0
+                self.peak = 0
+
+            def get_problem_text(self, problem_statement, handler, prompt_builder, deadline=None):
+                with self.lock:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                time.sleep(0.2)
+                with self.lock:
+                    self.active -= 1
+                return problem_statement
+
+        (tmp_dir / "other_problem.txt").write_text("Multiply two numbers")
+        two_problems = [
+            {'id': f"p{i}", 'problem': str(tmp_dir / name), 'solution': str(tmp_dir / "solutions" / "student0.py")}
+            for i, name in enumerate(["problem.txt", "other_problem.txt"])
+        ]
+        registry = SlowRegistry()
+        run_batch(two_problems, EchoHandler, tmp_dir / "two_problems.jsonl", "echo", concurrency=2,
+                  problem_registry=registry)
+        if registry.peak == 2:
+            print("✅ Different problems are condensed concurrently")
+        else:
+            print("❌ Condensing one problem blocked another")
+
+        class SummaryRegistry:
+            def get_problem_text(self, problem_statement, handler, prompt_builder, deadline=None):
+                return "Summary: " + problem_statement
+
+        from utils.similarity_index import SimilarityIndex
+        index = SimilarityIndex(tmp_dir / "similarity")
+        first, second = pairs[0], dict(pairs[1], id="full-problem")
+        run_batch([first], EchoHandler, tmp_dir / "condensed.jsonl", "echo", problem_registry=SummaryRegistry(),
+                  similarity_index=index)
+        run_batch([second], EchoHandler, tmp_dir / "full.jsonl", "echo", similarity_index=index)
+        record = json.loads((tmp_dir / "full.jsonl").read_text())
+        if record.get('near_duplicates'):
+            print("✅ Near-duplicates found whether or not the problem was condensed")
+        else:
+            print("❌ Condensing the problem hid a near-duplicate")
+
+def test_rate_limiter():
+    """Test rate limiting and retry functionality"""
+    print("\nTesting rate limiter...")
+    
+    import time
+    from types import SimpleNamespace
+    from api_handlers.rate_limiter import TokenBucket, RetryPolicy, call_with_retries, get_rate_limiter
+    from api_handlers.openai_api import OpenAIHandler
+    from api_handlers.mock_review import FallbackReview, MockReview
+    
+    bucket = TokenBucket(per_minute=600, capacity=2)
+    waits = [bucket.reserve() for _ in range(3)]
+    if waits[0] == 0 and waits[1] == 0 and 0.05 < waits[2] <= 0.11:
+        print("✅ Token bucket queues requests beyond its capacity")
+    else:
+        print(f"❌ Token bucket waits incorrect: {waits}")
+    
+    class FakeAPIError(Exception):
+        def __init__(self, status_code, code=None, retry_after=None):
+            super().__init__(f"Error code: {status_code}")
+            self.status_code = status_code
+            self.code = code
+            self.response = SimpleNamespace(headers={'retry-after': retry_after} if retry_after else {})
+    
+    attempts = []
+    def flaky_request():
+        attempts.append(time.perf_counter())
+        if len(attempts) < 3:
+            raise FakeAPIError(429, retry_after="0.05")
+        return "ok"
+    
+    result = call_with_retries('test-provider', flaky_request, policy=RetryPolicy(max_retries=3))
+    if result == "ok" and len(attempts) == 3 and get_rate_limiter('test-provider').stats['backoffs'] == 2:
+        print("✅ Rate-limited requests retried after Retry-After")
+    else:
+        print(f"❌ Retry scheduler failed: {result}, {len(attempts)} attempts")
+    
+    attempts.clear()
+    def out_of_credit():
+        attempts.append(time.perf_counter())
+        raise FakeAPIError(429, code='insufficient_quota')
+    try:
+        call_with_retries('test-provider', out_of_credit)
+        print("❌ Quota exhaustion did not raise")
+    except FakeAPIError:
+        if len(attempts) == 1:
+            print("✅ Quota exhaustion fails fast without retries")
+        else:
+            print("❌ Quota exhaustion was retried")
+    
+    def create(model, messages, **kwargs):
+        if model == "gpt-4o":
+            raise FakeAPIError(429, code='insufficient_quota')
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"Review by {model}"))])
+    
+    handler = OpenAIHandler(fallback_models=["gpt-4o-mini"])
+    handler.api_key = "sk-test"
+    handler.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    review = handler.get_review("prompt")
+    if isinstance(review, FallbackReview) and review.endswith("Review by gpt-4o-mini"):
+        print("✅ OpenAI handler applies explicit fallback policy")
+    else:
+        print("❌ OpenAI handler fallback policy not applied")
+
+    from api_handlers.health import get_circuit_breaker
+    handler.model_name = "gpt-4o-unavailable"
+    breaker = get_circuit_breaker("openai", handler.model_name)
+    for _ in range(breaker.min_calls):
+        breaker.record_failure(1.0)
+    review = handler.get_review("prompt")
+    if isinstance(review, FallbackReview) and "temporarily unavailable" in review and "quota" not in review:
+        print("✅ Fallback notice names an open circuit instead of an exceeded quota")
+    else:
+        print("❌ Fallback notice misreports an open circuit as an exceeded quota")
+    
+    def broken_fallback(model, messages, **kwargs):
+        raise FakeAPIError(400)
+    handler.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=broken_fallback)))
+    review = handler.get_review("prompt")
+    if isinstance(review, MockReview) and "circuit open, retrying in" in review and "quota" not in review:
+        print("✅ Failed fallback after an open circuit is not reported as an exceeded quota")
+    else:
+        print(f"❌ Failed fallback after an open circuit misreported: {review!r}")
+    handler.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    handler.model_name = "gpt-4o"
+
+    handler.fallback_models = []
+    if "quota exceeded" in handler.get_review("prompt"):
+        print("✅ OpenAI handler does not downgrade when no fallback is configured")
+    else:
+        print("❌ OpenAI handler downgraded without a fallback policy")
+
+def test_circuit_breaker():
+    """Test circuit breaker and failover functionality"""
+    print("\nTesting circuit breaker...")
+    
+    import time
+    from api_handlers.health import CircuitBreaker, get_circuit_breaker
+    from api_handlers.failover import FailoverHandler
+    from api_handlers.mock_review import FallbackReview, MockReview
+    
+    breaker = CircuitBreaker("test:model", min_calls=3, open_seconds=0.1)
+    for _ in range(3):
+        breaker.record_failure(1.0)
+    if breaker.state == 'open' and not breaker.allow_request():
+        print("✅ Circuit breaker opens after repeated failures")
+    else:
+        print("❌ Circuit breaker did not open")
+    
+    time.sleep(0.15)
+    first_probe = breaker.allow_request()
+    second_probe = breaker.allow_request()
+    breaker.record_success(0.5)
+    if first_probe and not second_probe and breaker.state == 'closed':
+        print("✅ Circuit breaker closes after a successful half-open probe")
+    else:
+        print("❌ Circuit breaker half-open probing failed")
+    
+    class StubHandler:
+        generation_params = {}
+        
+        def __init__(self, provider, model_name):
+            self.provider = provider
+            self.model_name = model_name
+            self.calls = 0
+        
+        def get_review(self, prompt, deadline=None):
+            self.calls += 1
+            return f"Review by {self.model_name}"
+    
+    primary = StubHandler("failing-provider", "primary-model")
+    alternate = StubHandler("healthy-provider", "alternate-model")
+    primary_breaker = get_circuit_breaker("failing-provider", "primary-model")
+    for _ in range(primary_breaker.min_calls):
+        primary_breaker.record_failure(1.0)
+    
+    review = FailoverHandler(primary, alternate).get_review("prompt")
+    if isinstance(review, FallbackReview) and review.endswith("Review by alternate-model") and primary.calls == 0:
+        print("✅ Failover skips a provider with an open breaker")
+    else:
+        print("❌ Failover did not route around the open breaker")
+
+    probing = StubHandler("probing-provider", "primary-model")
+    probing_alternate = StubHandler("healthy-provider", "alternate-model")
+    probing_breaker = get_circuit_breaker("probing-provider", "primary-model")
+    for _ in range(probing_breaker.min_calls):
+        probing_breaker.record_failure(1.0)
+    probing_breaker._opened_at -= probing_breaker.open_seconds
+    # Another request holds the only half-open probe slot while this one arrives
+    probe_claimed = probing_breaker.allow_request()
+    review = FailoverHandler(probing, probing_alternate).get_review("prompt")
+    if (probe_claimed and probing_breaker.state == 'half_open' and isinstance(review, FallbackReview)
+            and probing.calls == 0 and probing_alternate.calls == 1):
+        print("✅ Failover routes around a half-open breaker whose probe slot is taken")
+    else:
+        print("❌ Failover sent a request to a half-open breaker with no free probe slot")
+    
+    from api_handlers.deadline import ReviewCancelledError
+    from api_handlers.health import guarded_call
+    
+    def cancelled_request():
+        raise ReviewCancelledError()
+    
+    def abandoned_request():
+        # What a streamed probe sees when its consumer stops reading
+        raise GeneratorExit()
+    
+    cancel_breaker = get_circuit_breaker("cancel-provider", "probe-model")
+    for _ in range(cancel_breaker.min_calls):
+        cancel_breaker.record_failure(1.0)
+    cancel_breaker._opened_at -= cancel_breaker.open_seconds
+    outcomes = []
+    for request in (cancelled_request, abandoned_request):
+        try:
+            guarded_call("cancel-provider", "probe-model", request)
+        except (ReviewCancelledError, GeneratorExit) as e:
+            outcomes.append((type(e).__name__, cancel_breaker.state))
+    if outcomes == [('ReviewCancelledError', 'half_open'), ('GeneratorExit', 'half_open')] and cancel_breaker.can_accept():
+        print("✅ A cancelled or abandoned probe frees its slot without closing the breaker")
+    else:
+        print(f"❌ Cancelled probes changed the breaker: {outcomes}, state {cancel_breaker.state}")
+
+def test_hedged_requests():
+    """Test hedged request functionality"""
+    print("\nTesting hedged requests...")
+    
+    import time
+    from api_handlers.deadline import Deadline
+    from api_handlers.hedging import HedgedHandler
+    from api_handlers.mock_review import FallbackReview, MockReview
+    
+    class DelayedHandler:
+        generation_params = {}
+        
+        def __init__(self, model_name, first_token_delay):
+            self.provider = "hedge-test"
+            self.model_name = model_name
+            self.first_token_delay = first_token_delay
+            self.closed = False
+        
+        def get_review_stream(self, prompt, deadline=None):
+            try:
+                time.sleep(self.first_token_delay)
+                yield f"Review by {self.model_name}"
+                time.sleep(0.05)
+                yield " (done)"
+            finally:
+                self.closed = True
+    
+    fast_primary = HedgedHandler(DelayedHandler("fast", 0.01), DelayedHandler("backup", 0.01), default_deadline=0.5)
+    review = fast_primary.get_review("prompt")
+    if review == "Review by fast (done)" and not fast_primary.secondary.closed:
+        print("✅ Fast primary is streamed without hedging")
+    else:
+        print(f"❌ Fast primary was hedged: {review!r}")
+    
+    slow_primary = DelayedHandler("slow", 0.6)
+    hedged = HedgedHandler(slow_primary, DelayedHandler("backup", 0.01), default_deadline=0.1)
+    review = hedged.get_review("prompt")
+    time.sleep(0.7)
+    if isinstance(review, FallbackReview) and review.endswith("Review by backup (done)") and slow_primary.closed:
+        print("✅ Slow primary is hedged and the losing stream is cancelled")
+    else:
+        print(f"❌ Hedging did not pick the faster answer: {review!r}")
+    
+    class TimingOutHandler(DelayedHandler):
+        def get_review_stream(self, prompt, deadline=None):
+            time.sleep(self.first_token_delay)
+            yield MockReview("❌ Review deadline exceeded")
+    
+    backup = DelayedHandler("backup", 0.01)
+    late = HedgedHandler(TimingOutHandler("late", 0.5), backup, default_deadline=0.3)
+    try:
+        review = late.get_review("prompt", deadline=Deadline(0.1))
+        if isinstance(review, MockReview) and "deadline" in review and not backup.closed:
+            print("✅ Hedge skipped once the deadline has passed, and the timeout reported")
+        else:
+            print(f"❌ Unexpected review after the deadline passed: {review!r}")
+    except Exception as e:
+        print(f"❌ Hedging raised after the deadline passed: {type(e).__name__}: {e}")
+    
+    class FailingHandler(DelayedHandler):
+        def get_review_stream(self, prompt, deadline=None):
+            yield MockReview("❌ Provider error")
+    
+    failing = HedgedHandler(FailingHandler("failing", 0), DelayedHandler("backup", 0.01), default_deadline=5)
+    started_at = time.perf_counter()
+    review = failing.get_review("prompt")
+    if (isinstance(review, FallbackReview) and review.endswith("Review by backup (done)")
+            and time.perf_counter() - started_at < 1 and len(failing.tracker) == 0):
+        print("✅ A failing primary is hedged at once and not counted as a first token")
+    else:
+        print(f"❌ Failing primary not hedged right away: {review!r}, {len(failing.tracker)} latency samples")
+    
+    class FallingBackHandler(DelayedHandler):
+        def get_review_stream(self, prompt, deadline=None):
+            yield FallbackReview("⚠️ Falling back...\n\n")
+            time.sleep(self.first_token_delay)
+            yield "Review by fallback"
+    
+    falling_back = HedgedHandler(FallingBackHandler("falling-back", 0.1), DelayedHandler("backup", 0.01), default_deadline=5)
+    review = falling_back.get_review("prompt")
+    if review == "⚠️ Falling back...\n\nReview by fallback" and falling_back.tracker.percentile(0.5) >= 0.1:
+        print("✅ Time to first token measured from the review text, not an early notice")
+    else:
+        print(f"❌ Early notice counted as the first token: {review!r}")
+
+def test_deadlines():
+    """Test review deadline and cancellation functionality"""
+    print("\nTesting review deadlines...")
+    
+    import threading
+    import time
+    from api_handlers.deadline import Deadline, ReviewCancelledError, ReviewTimeoutError
+    from api_handlers.rate_limiter import RetryPolicy, call_with_retries, get_rate_limiter
+    
+    deadline = Deadline(0.05)
+    closed = []
+    deadline.on_cancel(lambda: closed.append("stream"))
+    time.sleep(0.15)
+    try:
+        deadline.check()
+        print("❌ Expired deadline did not raise")
+    except ReviewTimeoutError:
+        if closed == ["stream"]:
+            print("✅ Expired deadline closes in-flight requests")
+        else:
+            print("❌ Expired deadline did not close in-flight requests")
+    
+    threads_before = threading.active_count()
+    for _ in range(50):
+        unregister = Deadline(60).on_cancel(lambda: None)
+        unregister()
+    time.sleep(0.1)
+    if threading.active_count() <= threads_before:
+        print("✅ Finished requests leave no deadline timer threads behind")
+    else:
+        print(f"❌ {threading.active_count() - threads_before} deadline timer threads left behind")
+    
+    parent = Deadline(60)
+    child = parent.child()
+    child_closed = []
+    child.on_cancel(lambda: child_closed.append("stream"))
+    parent.cancel()
+    if child.cancelled and child_closed == ["stream"]:
+        print("✅ Cancelling a review cancels its child requests")
+    else:
+        print("❌ Cancellation did not reach child requests")
+    
+    expiring_review = Deadline(0.05)
+    expiring = expiring_review.child()
+    # The review's expiry timer fires its callbacks while this sleeps
+    time.sleep(0.1)
+    if expiring.expired() and not expiring.cancelled:
+        print("✅ A child request past the deadline times out rather than being cancelled")
+    else:
+        print("❌ Parent expiry reported as a cancellation of its child")
+    
+    hedged_review = Deadline(60)
+    for _ in range(3):
+        hedged_review.child().detach()
+    if not hedged_review._callbacks and hedged_review._timer is None:
+        print("✅ Detached child requests leave nothing registered on the review deadline")
+    else:
+        print(f"❌ {len(hedged_review._callbacks)} child callbacks left on the review deadline")
+    
+    class Overloaded(Exception):
+        status_code = 503
+    
+    class FixedDelayPolicy(RetryPolicy):
+        # Full jitter can draw a delay short enough to fit before the deadline
+        def get_delay(self, attempt, error):
+            return 5
+    
+    attempts = []
+    
+    def failing_request():
+        attempts.append(time.monotonic())
+        raise Overloaded("overloaded")
+    
+    started_at = time.perf_counter()
+    try:
+        call_with_retries("deadline-test", failing_request, policy=FixedDelayPolicy(max_retries=10),
+                          deadline=Deadline(0.5))
+    except Overloaded:
+        pass
+    elapsed = time.perf_counter() - started_at
+    if elapsed < 0.5 and len(attempts) == 1:
+        print("✅ Retries that cannot finish before the deadline are skipped")
+    else:
+        print(f"❌ Retries ignored the deadline ({len(attempts)} attempts in {elapsed:.2f}s)")
+    
+    try:
+        call_with_retries("deadline-test", failing_request, deadline=parent)
+        print("❌ Cancelled review still sent a request")
+    except ReviewCancelledError:
+        print("✅ Cancelled reviews send no further requests")
+    
+    limiter = get_rate_limiter("deadline-pause-test")
+    limiter.back_off(5)
+    started_at = time.perf_counter()
+    try:
+        limiter.acquire(deadline=Deadline(0.2))
+        print("❌ Rate limiter waited past the deadline")
+    except ReviewTimeoutError:
+        if time.perf_counter() - started_at < 0.1:
+            print("✅ Rate limiter pauses longer than the deadline fail fast")
+        else:
+            print("❌ Rate limiter slept before reporting the deadline")
+    
+    cancelled = Deadline(60)
+    threading.Timer(0.05, cancelled.cancel).start()
+    started_at = time.perf_counter()
+    limiter.acquire(deadline=cancelled)
+    if time.perf_counter() - started_at < 1:
+        print("✅ Cancelling a review wakes it from a rate limiter pause")
+    else:
+        print("❌ Cancelled review stayed blocked in the rate limiter")
+    
+    review_deadline = Deadline()
+    side_deadline = review_deadline.child()
+    side_deadline.add_usage("usage-model", 100, 20)
+    review_deadline.add_usage("usage-model", 50, None)
+    if review_deadline.get_usage() == {"usage-model": {"input_tokens": 150, "output_tokens": 20}}:
+        print("✅ Reported token usage adds up from child deadlines")
+    else:
+        print(f"❌ Deadline usage not added up: {review_deadline.get_usage()}")
+
+def test_token_budget():
+    """Test token-aware prompt budgeting functionality"""
+    print("\nTesting prompt token budget...")
+    
+    import ast
+    from utils.prompt_builder import PromptBuilder
+    from utils.token_budget import estimate_tokens, get_handler_input_budget, truncate_code
+    
+    code = "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def push(self, item):\n        self.items.append(item)\n"
+    prompt = PromptBuilder().build_review_prompt("Implement a stack.", code)
+    if code.strip() in prompt:
+        print("✅ Prompt keeps code indentation")
+    else:
+        print("❌ Prompt flattened code indentation")
+    
+    functions = "".join(f"def function_{i}(a, b):\n    total = a + b\n    return total * {i}\n\n\n" for i in range(200))
+    truncated = truncate_code(functions, 500)
+    kept = truncated.rsplit("\n\n# ... [truncated", 1)[0]
+    try:
+        ast.parse(kept)
+        parses = True
+    except SyntaxError:
+        parses = False
+    if parses and estimate_tokens(truncated) <= 500 and "[truncated:" in truncated:
+        print("✅ Code truncated at a statement boundary within budget")
+    else:
+        print("❌ Code truncation broke statements or exceeded the budget")
+    
+    builder = PromptBuilder(max_input_tokens=4000)
+    prompt = builder.build_review_prompt("Add numbers. " * 2000, functions)
+    if estimate_tokens(prompt) <= 4000:
+        print(f"✅ Prompt fits its token budget ({estimate_tokens(prompt)} of 4000 tokens)")
+    else:
+        print(f"❌ Prompt exceeds its token budget ({estimate_tokens(prompt)} of 4000 tokens)")
+    
+    class SmallModelHandler:
+        model_name = "gpt-3.5-turbo"
+        generation_params = {}
+    
+    class LargeModelHandler:
+        model_name = "models/gemini-1.5-flash"
+        generation_params = {}
+        fallback_models = ["gpt-3.5-turbo"]
+    
+    if get_handler_input_budget(LargeModelHandler()) == get_handler_input_budget(SmallModelHandler()):
+        print("✅ Prompt budget covers fallback models")
+    else:
+        print("❌ Prompt budget ignores fallback models")
+
+def test_chunked_review():
+    """Test large-file map-reduce review functionality"""
+    print("\nTesting chunked review...")
+    
+    import threading
+    import time
+    from api_handlers.chunked_review import ChunkedReview
+    from utils.code_chunker import split_code, summarize_symbols
+    from utils.prompt_builder import PromptBuilder
+    from utils.token_budget import estimate_tokens
+    
+    methods = "".join(f"    def method_{i}(self, value):\n        result = value * {i}\n        return result + {i}\n\n" for i in range(150))
+    functions = "".join(f"def helper_{i}(items):\n    return [item + {i} for item in items]\n\n\n" for i in range(150))
+    code = f"import math\n\n\nclass Calculator:\n{methods}\n{functions}"
+    
+    chunks = split_code(code, 800)
+    if "\n".join(chunk.code for chunk in chunks) == code and max(estimate_tokens(chunk.code) for chunk in chunks) <= 820:
+        print(f"✅ Code split into {len(chunks)} parts along ast boundaries without dropping lines")
+    else:
+        print("❌ Code splitting dropped lines or exceeded the part budget")
+    
+    outline = summarize_symbols(code)
+    if "class Calculator" in outline and "def method_0(self, value)" in outline and "def helper_149(items)" in outline:
+        print("✅ Symbol outline lists classes, methods and functions")
+    else:
+        print("❌ Symbol outline incomplete")
+    
+    class SlowHandler:
+        model_name = "chunk-model"
+        generation_params = {}
+        
+        def __init__(self):
+            self.prompts = []
+            self.lock = threading.Lock()
+        
+        def get_review(self, prompt, deadline=None):
+            with self.lock:
+                self.prompts.append(prompt)
+            time.sleep(0.2)
+            return "### Strengths\n- Clear structure"
+    
+    builder = PromptBuilder(max_input_tokens=3000)
+    if builder.fits_single_prompt("Build a calculator.", code):
+        print("❌ Large solution reported as fitting a single prompt")
+        return
+    
+    chunked_review = ChunkedReview(builder, "Build a calculator.", code)
+    handler = SlowHandler()
+    started_at = time.perf_counter()
+    review = chunked_review.get_review(handler)
+    elapsed = time.perf_counter() - started_at
+    parts = len(chunked_review.chunks)
+    
+    if len(handler.prompts) == parts + 1 and "Reviews of Each Part" in handler.prompts[-1] and review.startswith("### Strengths"):
+        print(f"✅ {parts} part reviews merged into one report")
+    else:
+        print("❌ Part reviews were not merged into one report")
+    
+    if parts > 2 and elapsed < 0.2 * parts:
+        print(f"✅ Parts reviewed in parallel ({elapsed:.2f}s for {parts} parts)")
+    else:
+        print(f"❌ Parts reviewed sequentially ({elapsed:.2f}s for {parts} parts)")
+    
+    if max(estimate_tokens(prompt) for prompt in handler.prompts) <= 3000:
+        print("✅ Every part prompt fits the token budget")
+    else:
+        print("❌ A part prompt exceeds the token budget")
+
+def test_pdf_parsing():
+    """Test in-memory PDF parsing functionality"""
+    print("\nTesting PDF parsing...")
+    
+    try:
+        import fitz
+    except ImportError:
+        print("⚠️ PyMuPDF not installed, skipping PDF parsing tests")
+        return
+    
+    from utils.file_parser import FileParser, PARALLEL_PDF_MIN_PAGES
+    import io
+    
+    doc = fitz.open()
+    for page_num in range(PARALLEL_PDF_MIN_PAGES + 6):
+        doc.new_page().insert_text((72, 72), f"Requirement {page_num}: return the sorted list.")
+    upload = io.BytesIO(doc.tobytes())
+    upload.name = "spec.pdf"
+    doc.close()
+    
+    text = FileParser(pdf_workers=0).parse_file(upload)
+    if text.startswith("Requirement 0:") and f"Requirement {PARALLEL_PDF_MIN_PAGES + 5}:" in text and upload.tell() == 0:
+        print("✅ PDF parsed from memory")
+    else:
+        print("❌ PDF text missing pages")
+    
+    if FileParser(pdf_workers=2).parse_file(upload) == text:
+        print("✅ Process-pool extraction matches sequential extraction")
+    else:
+        print("❌ Process-pool extraction differs from sequential extraction")
+    
+    capped = FileParser(max_pdf_pages=3).parse_file(upload)
+    if "Requirement 2:" in capped and "Requirement 3:" not in capped and "more pages not included" in capped:
+        print("✅ Page cap limits extracted pages")
+    else:
+        print("❌ Page cap not applied")
+    
+    pages = FileParser(max_pdf_pages=3).iter_pdf_pages(upload)
+    if next(pages).startswith("Requirement 0:") and len(list(pages)) == 2:
+        print("✅ Pages iterated lazily up to the page cap")
+    else:
+        print("❌ Lazy page iteration failed")
+    pages.close()
+
+def test_word_parsing():
+    """Test in-memory DOCX and legacy DOC parsing functionality"""
+    print("\nTesting Word parsing...")
+    
+    try:
+        import docx
+    except ImportError:
+        print("⚠️ python-docx not installed, skipping Word parsing tests")
+        return
+    
+    from utils.file_parser import FileParser
+    import io
+    
+    document = docx.Document()
+    document.add_paragraph("Write a function that adds two numbers.")
+    table = document.add_table(rows=2, cols=3)
+    table.cell(0, 0).merge(table.cell(0, 1)).text = "Input"
+    table.cell(0, 2).text = "Output"
+    for column, value in enumerate(["1", "2", "3"]):
+        table.cell(1, column).text = value
+    document.add_paragraph("Return the sum.")
+    upload = io.BytesIO()
+    document.save(upload)
+    upload.name = "spec.docx"
+    upload.seek(0)
+    
+    parser = FileParser()
+    text = parser.parse_file(upload)
+    expected = "Write a function that adds two numbers.\nInput | Output\n1 | 2 | 3\nReturn the sum."
+    if text == expected and upload.tell() == 0:
+        print("✅ DOCX paragraphs and tables parsed in document order")
+    else:
+        print(f"❌ Unexpected DOCX text: {text!r}")
+    
+    upload.name = "spec.doc"
+    if parser.parse_file(upload) == expected:
+        print("✅ DOCX saved with a .doc name detected from its content")
+    else:
+        print("❌ DOCX saved as .doc not parsed")
+
+def build_word97_document(paragraphs):
+    """Build a Word 97 .doc file from (text, row_end, unicode) paragraphs, laid out as Word writes it
+
+    Each paragraph is one run of paragraph properties; row_end paragraphs get the table-row
+    flag. Consecutive paragraphs with the same encoding share a piece of the piece table.
+    """
+    import struct
+    
+    text_offset, fkp_page = 1024, 8
+    word_document = bytearray(4608)
+    table = bytearray(4096)
+    
+    pieces, runs = [], []
+    cp, fc = 0, text_offset
+    for text, row_end, unicode in paragraphs:
+        if not pieces or pieces[-1][2] != unicode:
+            fc = (fc + 511) // 512 * 512 if pieces else fc
+            pieces.append([cp, cp, unicode, fc])
+        encoded = text.encode('utf-16-le' if unicode else 'cp1252')
+        word_document[fc:fc + len(encoded)] = encoded
+        runs.append((fc, fc + len(encoded), row_end))
+        cp += len(text)
+        fc += len(encoded)
+        pieces[-1][1] = cp
+    
+    # Piece table: character positions, then one piece descriptor per piece
+    plc = b"".join(struct.pack('<I', start) for start, _, _, _ in pieces) + struct.pack('<I', cp)
+    for _, _, unicode, piece_fc in pieces:
+        plc += struct.pack('<HIH', 0, piece_fc if unicode else (piece_fc * 2) | 0x40000000, 0)
+    clx = b"\x02" + struct.pack('<I', len(plc)) + plc
+    table[0:len(clx)] = clx
+    
+    # One page of paragraph properties; row ends carry sprmPFInTable, a sprmTDefTable and sprmPFTtp
+    page = bytearray(512)
+    struct.pack_into(f'<{len(runs) + 1}I', page, 0, *[start for start, _, _ in runs], runs[-1][1])
+    in_table = struct.pack('<HHB', 0, 0x2416, 1)
+    row_end = struct.pack('<HHBHHB2xHB', 0, 0x2416, 1, 0xD608, 4, 1, 0x2417, 1)
+    free = 511
+    for index, (_, _, is_row_end) in enumerate(runs):
+        grpprl = row_end if is_row_end else in_table
+        # Both grpprls are an odd number of bytes, which the size byte stores as (length + 1) / 2
+        papx = bytes([(len(grpprl) + 1) // 2]) + grpprl
+        free = (free - len(papx)) // 2 * 2
+        page[free:free + len(papx)] = papx
+        page[(len(runs) + 1) * 4 + index * 13] = free // 2
+    page[511] = len(runs)
+    word_document[fkp_page * 512:(fkp_page + 1) * 512] = page
+    plc_bte_papx = struct.pack('<III', runs[0][0], runs[-1][1], fkp_page)
+    table[len(clx):len(clx) + len(plc_bte_papx)] = plc_bte_papx
+    
+    # File information block: 1Table stream, main text length, PlcBtePapx and Clx locations
+    struct.pack_into('<HH6xH', word_document, 0, 0xA5EC, 0x00C1, 0x0200)
+    struct.pack_into('<H', word_document, 32, 14)
+    struct.pack_into('<H', word_document, 62, 22)
+    struct.pack_into('<i', word_document, 64 + 12, cp)
+    struct.pack_into('<H', word_document, 152, 93)
+    struct.pack_into('<II', word_document, 154 + 13 * 8, len(clx), len(plc_bte_papx))
+    struct.pack_into('<II', word_document, 154 + 33 * 8, 0, len(clx))
+    
+    # Compound file: FAT in sector 0, then WordDocument, 1Table and the directory
+    end_of_chain, free_sector = 0xFFFFFFFE, 0xFFFFFFFF
+    fat = [0xFFFFFFFD]
+    for length in (len(word_document), len(table)):
+        first = len(fat)
+        sectors = length // 512
+        fat.extend(list(range(first + 1, first + sectors)) + [end_of_chain])
+    directory_sector = len(fat)
+    fat.append(end_of_chain)
+    fat += [free_sector] * (128 - len(fat))
+    
+    def entry(name, entry_type, left, right, child, start, size):
+        encoded = (name + "\x00").encode('utf-16-le')
+        return (encoded.ljust(64, b"\x00") + struct.pack('<HBB3I', len(encoded), entry_type, 1, left, right, child)
+                + bytes(36) + struct.pack('<IQ', start, size))
+    
+    directory = (entry("Root Entry", 5, free_sector, free_sector, 1, end_of_chain, 0)
+                 + entry("WordDocument", 2, 2, free_sector, free_sector, 1, len(word_document))
+                 + entry("1Table", 2, free_sector, free_sector, free_sector, 1 + len(word_document) // 512, len(table))
+                 + bytes(128))
+    header = bytearray(512)
+    header[0:8] = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+    struct.pack_into('<HHHHH6xIIIIIIIII', header, 0x18, 0x3E, 3, 0xFFFE, 9, 6,
+                     0, 1, directory_sector, 0, 4096, end_of_chain, 0, end_of_chain, 0)
+    struct.pack_into('<109I', header, 0x4C, 0, *[free_sector] * 108)
+    return bytes(header) + struct.pack('<128I', *fat) + bytes(word_document) + bytes(table) + directory
+
+def test_legacy_doc_parsing():
+    """Test in-memory Word 97-2003 DOC parsing functionality"""
+    print("\nTesting legacy DOC parsing...")
+    
+    import io
+    import time
+    from utils.file_parser import FileParser
+    
+    parser = FileParser()
+    legacy = io.BytesIO(build_word97_document([
+        ("Add two numbers.\r", False, False),
+        ("Input\x07", False, False), ("\x07", False, False), ("Output\x07", False, False), ("\x07", True, False),
+        ("1\x07", False, False), ("2\x07", False, False), ("3\x07", False, False), ("\x07", True, False),
+        ("Sum: \x13 = 1 + 2 \x143\x15 \u2013 no carry\r", False, True),
+        ("Return the sum.\r", False, True),
+    ]))
+    legacy.name = "spec.doc"
+    text = parser.parse_file(legacy)
+    expected = "Add two numbers.\nInput\t\tOutput\n1\t2\t3\nSum: 3 \u2013 no carry\nReturn the sum."
+    if text == expected:
+        print("✅ Word 97 text, table rows with empty cells and field results parsed")
+    else:
+        print(f"❌ Unexpected Word 97 text: {text!r}")
+    
+    # Point the WordDocument stream's first sector (sector 1) back at itself in the FAT
+    looping = bytearray(build_word97_document([("Loop.\r", False, False)]))
+    looping[512 + 4:512 + 8] = (1).to_bytes(4, 'little')
+    legacy = io.BytesIO(bytes(looping))
+    legacy.name = "looping.doc"
+    started_at = time.perf_counter()
+    try:
+        parser.parse_file(legacy)
+        print("❌ Legacy DOC with a looping sector chain parsed without an error")
+    except Exception as e:
+        if "loops" in str(e) and time.perf_counter() - started_at < 1:
+            print("✅ Looping sector chain in a legacy DOC rejected right away")
+        else:
+            print(f"❌ Unexpected handling of a looping sector chain: {e}")
+    
+    legacy = io.BytesIO(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(1024))
+    legacy.name = "broken.doc"
+    try:
+        parser.parse_file(legacy)
+        print("❌ Broken legacy DOC parsed without an error")
+    except Exception as e:
+        if "Error parsing DOC" in str(e):
+            print("✅ Broken legacy DOC rejected with a clear error")
+        else:
+            print(f"❌ Unexpected error for a broken legacy DOC: {e}")
+
+def test_parse_cache():
+    """Test content-addressed parse cache functionality"""
+    print("\nTesting parse cache...")
+    
+    import io
+    import tempfile
+    import threading
+    from utils.file_parser import FileParser
+    from utils.parse_cache import ParseCache
+    
+    class CountingParser(FileParser):
+        calls = 0
+        
+        def parse_file(self, uploaded_file):
+            CountingParser.calls += 1
+            return super().parse_file(uploaded_file)
+    
+    def upload(name, content):
+        uploaded_file = io.BytesIO(content)
+        uploaded_file.name = name
+        return uploaded_file
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        parser = CountingParser()
+        cache = ParseCache(cache_dir)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.parse(parser, upload(f"spec{i}.txt", b"Sort the list."))))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if results == ["Sort the list."] * 8 and CountingParser.calls == 1:
+            print("✅ Identical uploads parsed once, even concurrently")
+        else:
+            print(f"❌ Identical uploads parsed {CountingParser.calls} times")
+        
+        if ParseCache(cache_dir).parse(parser, upload("other.txt", b"Sort the list.")) == "Sort the list." and CountingParser.calls == 1:
+            print("✅ Parsed text reused from the persistent tier")
+        else:
+            print("❌ Persistent parse cache tier missed")
+        
+        cache.parse(parser, upload("spec.py", b"Sort the list."))
+        cache.parse(parser, upload("spec.txt", b"Sort the list!"))
+        if CountingParser.calls == 3:
+            print("✅ Different content or file type is parsed again")
+        else:
+            print("❌ Parse cache key ignores content or file type")
+
+def test_problem_registry():
+    """Test one-time problem statement condensing functionality"""
+    print("\nTesting problem registry...")
+    
+    import tempfile
+    import threading
+    import time
+    from api_handlers.mock_review import MockReview
+    from utils.problem_registry import ProblemRegistry
+    from utils.prompt_builder import PromptBuilder
+    
+    class SummaryHandler:
+        model_name = "summary-model"
+        generation_params = {}
+        
+        def __init__(self, summary):
+            self.summary = summary
+            self.calls = 0
+        
+        def get_review(self, prompt, deadline=None):
+            self.calls += 1
+            time.sleep(0.1)
+            return self.summary
+    
+    long_problem = "\n\n".join(
+        f"Background story paragraph {i}: the warehouse robots move crates between shelves every night." for i in range(60)
+    ) + "\n\nImplement move(crates: list) -> int returning the number of moves."
+    builder = PromptBuilder()
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        registry = ProblemRegistry(cache_dir)
+        handler = SummaryHandler("- Implement move(crates: list) -> int\n- Return the number of moves")
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(registry.get_problem_text(long_problem, handler, builder)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if handler.calls == 1 and len(set(results)) == 1 and "move(crates: list) -> int" in results[0] and len(results[0]) < len(long_problem) // 5:
+            print("✅ Long problem statement condensed once for concurrent reviews")
+        else:
+            print(f"❌ Problem statement condensed {handler.calls} times")
+        
+        reformatted = long_problem.replace("\n\n", "  \n\n")
+        if ProblemRegistry(cache_dir).get_problem_text(reformatted, handler, builder) == results[0] and handler.calls == 1:
+            print("✅ Condensed summary reused across restarts and reformatted copies")
+        else:
+            print("❌ Condensed summary not reused")
+        
+        short_problem = "Add two numbers."
+        if registry.get_problem_text(short_problem, handler, builder) == short_problem and handler.calls == 1:
+            print("✅ Short problem statements sent in full")
+        else:
+            print("❌ Short problem statement was condensed")
+        
+        failing = SummaryHandler(MockReview("❌ Error"))
+        other_problem = long_problem.replace("crates", "boxes")
+        if registry.get_problem_text(other_problem, failing, builder) == other_problem and registry.get(other_problem) is None:
+            print("✅ Failed summaries fall back to the full statement and are not stored")
+        else:
+            print("❌ Failed summary was used or stored")
+        
+        if (registry.peek_problem_text(long_problem) == results[0] and registry.peek_problem_text(other_problem) is None
+                and registry.peek_problem_text(short_problem) == short_problem):
+            print("✅ Known problem text looked up without a model call, for prompts built before submit")
+        else:
+            print("❌ Problem text lookup without a model call incorrect")
+
+def test_prompt_caching():
+    """Test cache-friendly prompt layout and cached-token reporting"""
+    print("\nTesting prompt caching...")
+    
+    from types import SimpleNamespace
+    from api_handlers.claude_api import ClaudeHandler
+    from api_handlers.usage import get_usage_snapshots
+    from utils.prompt_builder import PromptBuilder, split_cacheable_prompt
+    
+    builder = PromptBuilder()
+    first = builder.build_review_prompt("Sort a list of numbers.", "def sort(items):\n    return sorted(items)\n")
+    second = builder.build_review_prompt("Sort a list of numbers.", "def sort(items):\n    items.sort()\n    return items\n")
+    first_segments = split_cacheable_prompt(first)
+    second_segments = split_cacheable_prompt(second)
+    if (len(first_segments) == 3 and "".join(first_segments) == first
+            and first_segments[:2] == second_segments[:2] and first_segments[2] != second_segments[2]):
+        print("✅ Instructions and problem statement form a byte-identical prefix")
+    else:
+        print("❌ Prompt prefix differs between solutions to the same problem")
+    
+    requests = []
+    def create(**kwargs):
+        requests.append(kwargs)
+        usage = SimpleNamespace(input_tokens=40, cache_read_input_tokens=900, cache_creation_input_tokens=0, output_tokens=200)
+        return SimpleNamespace(content=[SimpleNamespace(text="### Strengths")], usage=usage)
+    
+    with stub_provider_clients():
+        handler = ClaudeHandler()
+    handler.model_name = "claude-cache-test"
+    handler.api_key = "sk-test"
+    handler.client = SimpleNamespace(messages=SimpleNamespace(create=create))
+    handler.get_review(first)
+    
+    request = requests[0]
+    blocks = request['messages'][0]['content']
+    if (request.get('system') and all(message['role'] != 'system' for message in request['messages'])
+            and [block.get('cache_control') is not None for block in blocks] == [True, True, False]):
+        print("✅ Claude request uses the system parameter and marks cache breakpoints")
+    else:
+        print("❌ Claude request layout not cacheable")
+    
+    usage = next((usage for usage in get_usage_snapshots() if usage['key'] == "anthropic:claude-cache-test"), None)
+    if usage and usage['input_tokens'] == 940 and usage['cached_tokens'] == 900 and usage['output_tokens'] == 200:
+        print("✅ Cached prompt tokens reported")
+    else:
+        print(f"❌ Cached prompt tokens not reported: {usage}")
+
+def test_request_coalescing():
+    """Test single-flight coalescing of identical concurrent reviews"""
+    print("\nTesting request coalescing...")
+    
+    import threading
+    import time
+    from api_handlers.coalescing import CoalescingHandler
+    from api_handlers.deadline import Deadline
+    
+    class SlowStreamHandler:
+        model_name = "coalesce-model"
+        generation_params = {}
+        
+        def __init__(self):
+            self.calls = 0
+            self.closed = threading.Event()
+        
+        def get_review_stream(self, prompt, deadline=None):
+            self.calls += 1
+            try:
+                for word in ["Looks ", "good ", "to ", "me"]:
+                    time.sleep(0.1)
+                    if deadline and deadline.cancelled:
+                        return
+                    yield word
+                if deadline:
+                    deadline.add_usage(self.model_name, 40, 4)
+            finally:
+                self.closed.set()
+        
+        def get_review(self, prompt, deadline=None):
+            return "".join(self.get_review_stream(prompt, deadline))
+    
+    inner = SlowStreamHandler()
+    results = []
+    deadlines = [Deadline() for _ in range(6)]
+    def review(deadline):
+        results.append(list(CoalescingHandler(inner).get_review_stream("same prompt", deadline=deadline)))
+    
+    threads = [threading.Thread(target=review, args=(deadline,)) for deadline in deadlines]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.03)
+    for thread in threads:
+        thread.join()
+    
+    if inner.calls == 1 and results == [["Looks ", "good ", "to ", "me"]] * 6:
+        print("✅ Identical concurrent reviews share one call and every caller gets all chunks")
+    else:
+        print(f"❌ Coalescing made {inner.calls} calls: {results}")
+    
+    usage = [deadline.get_usage() for deadline in deadlines]
+    coalesced = [deadline.get_coalesced() for deadline in deadlines]
+    if (usage[0] == {"coalesce-model": {'input_tokens': 40, 'output_tokens': 4}} and not coalesced[0]
+            and usage[1:] == [{"coalesce-model": {'input_tokens': 0, 'output_tokens': 0}}] * 5
+            and coalesced[1:] == [{"coalesce-model"}] * 5):
+        print("✅ The shared call's tokens are credited once, to its leader; the other callers are coalesced")
+    else:
+        print(f"❌ Coalesced usage was misattributed: {usage}, {coalesced}")
+    
+    CoalescingHandler(inner).get_review("same prompt")
+    if inner.calls == 2:
+        print("✅ A finished call is not reused for later reviews")
+    else:
+        print("❌ Finished call was reused")
+    
+    inner.closed.clear()
+    deadline = Deadline()
+    stream = CoalescingHandler(inner).get_review_stream("cancel me", deadline=deadline)
+    first = next(stream)
+    deadline.cancel()
+    rest = list(stream)
+    if first == "Looks " and rest and "cancelled" in rest[-1] and inner.closed.wait(1):
+        print("✅ Shared call cancelled once its last caller leaves")
+    else:
+        print("❌ Abandoned shared call kept running")
+
+def test_similarity_index():
+    """Test near-duplicate solution detection functionality"""
+    print("\nTesting similarity index...")
+    
+    import tempfile
+    from utils.review_cache import ReviewCache
+    from utils.similarity_index import SimilarityIndex, get_reusable_review
+    
+    original = """
+def count_pairs(numbers, target):
+    # Count pairs that add up to target
+    seen = {}
+    pairs = 0
+    for number in numbers:
+        pairs += seen.get(target - number, 0)
+        seen[number] = seen.get(number, 0) + 1
+    return pairs
+"""
+    copied = """
+def solve(arr, k):
+    counts = {}
+    total = 0
+    for x in arr:
+        total += counts.get(k - x, 0)
+
+        counts[x] = counts.get(x, 0) + 1
+    return total
+"""
+    different = """
+def count_pairs(numbers, target):
+    pairs = 0
+    for i in range(len(numbers)):
+        for j in range(i + 1, len(numbers)):
+            if numbers[i] + numbers[j] == target:
+                pairs += 1
+    return pairs
+"""
+    
+    class ReviewHandler:
+        model_name = "similarity-model"
+        generation_params = {}
+        
+        def get_review(self, prompt, deadline=None):
+            return "## Review\nLooks good."
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        index = SimilarityIndex(f"{cache_dir}/similarity")
+        review_cache = ReviewCache(f"{cache_dir}/reviews")
+        handler = ReviewHandler()
+        review_cache.get_review(handler, "prompt for alice.py")
+        index.add("problem-1", original, {
+            'solution': 'alice.py',
+            'model': handler.model_name,
+            'review_key': review_cache.key_for(handler, "prompt for alice.py")
+        })
+        
+        matches = index.find_similar("problem-1", copied)
+        if matches and matches[0]['solution'] == 'alice.py' and not index.find_similar("problem-1", different):
+            print(f"✅ Renamed and reformatted copy found ({matches[0]['similarity']:.0%} similar), different approach not flagged")
+        else:
+            print("❌ Near-duplicate detection incorrect")
+        
+        if not index.find_similar("problem-2", copied) and not index.find_similar("problem-1", original, solution_name='alice.py'):
+            print("✅ Lookups limited to the same problem, excluding the solution's own earlier submission")
+        else:
+            print("❌ Lookup matched another problem or the solution itself")
+        
+        reloaded = SimilarityIndex(f"{cache_dir}/similarity")
+        reused = get_reusable_review(reloaded.find_similar("problem-1", copied), review_cache, handler.model_name)
+        if len(reloaded) == 1 and reused and reused[0] == "## Review\nLooks good.":
+            print("✅ Index reloaded from disk and the closest match's cached review reused")
+        else:
+            print("❌ Index not persisted or review not reused")
+        
+        if get_reusable_review(reloaded.find_similar("problem-1", copied), review_cache, "other-model") is None:
+            print("✅ Reviews only reused for the same model")
+        else:
+            print("❌ Review reused across models")
+        
+        from utils.similarity_index import COMPACT_MIN_STALE_LINES
+        signature = reloaded.signature(different)
+        for review_number in range(COMPACT_MIN_STALE_LINES * 2):
+            reloaded.add("problem-1", different, {'solution': 'bob.py', 'review': review_number}, signature=signature)
+        with open(reloaded.path, encoding='utf-8') as f:
+            lines = sum(1 for _ in f)
+        compacted = SimilarityIndex(f"{cache_dir}/similarity")
+        bob = compacted.find_similar("problem-1", different)
+        if lines <= COMPACT_MIN_STALE_LINES + 2 and len(compacted) == 2 and bob and bob[0]['review'] == COMPACT_MIN_STALE_LINES * 2 - 1:
+            print(f"✅ Re-added solutions compacted out of the index file ({lines} lines kept)")
+        else:
+            print(f"❌ Index file not compacted ({lines} lines, {len(compacted)} entries)")
+
+def test_job_queue():
+    """Test background review job functionality"""
+    print("\nTesting job queue...")
+    
+    import threading
+    import time
+    from utils.job_queue import JobQueue
+    
+    job_queue = JobQueue(max_workers=1)
+    release = threading.Event()
+    
+    def review(job):
+        job.set_phase("🤖 Reviewing...")
+        job.stream("## Review")
+        release.wait(timeout=5)
+        job.notify('success', "✅ Code review completed!")
+        job.clear_preview()
+        return {'review_comments': "## Review\nLooks good."}
+    
+    job_id = job_queue.submit(review, label="Gemini", timeout=30)
+    queued_id = job_queue.submit(review, label="Claude", timeout=30)
+    time.sleep(0.2)
+    running = job_queue.get(job_id).snapshot()
+    if running['status'] == 'running' and running['preview'] == "## Review" and job_queue.get(queued_id).status == 'queued':
+        print("✅ Job runs in the background, publishing its live output, while the next one queues")
+    else:
+        print(f"❌ Job state while running: {running['status']}")
+    
+    job_queue.cancel(queued_id)
+    release.set()
+    time.sleep(0.3)
+    job = job_queue.get(job_id)
+    if job.status == 'done' and job.result['review_comments'] == "## Review\nLooks good." and job.snapshot()['notices'] == [('success', "✅ Code review completed!")]:
+        print("✅ Finished job keeps its result and notices for later reruns")
+    else:
+        print(f"❌ Finished job state: {job.status}")
+    
+    if job_queue.get(queued_id).status == 'cancelled' and job_queue.get("unknown") is None:
+        print("✅ Cancelled queued job never started")
+    else:
+        print("❌ Cancelled queued job ran")
+    
+    def failing(job):
+        raise ValueError("Error parsing PDF")
+    
+    failed_id = job_queue.submit(failing)
+    time.sleep(0.2)
+    failed = job_queue.get(failed_id)
+    if failed.status == 'failed' and failed.error == "Error parsing PDF":
+        print("✅ Job errors reported instead of raised")
+    else:
+        print("❌ Job error not reported")
+
+def test_upload_ingestion():
+    """Test size-capped, type-checked upload ingestion functionality"""
+    print("\nTesting upload ingestion...")
+    
+    import io
+    import tempfile
+    from utils.file_parser import FileParser
+    from utils.ingest import UploadRejectedError, ingest_upload
+    from utils.parse_cache import ParseCache
+    
+    def upload(name, content):
+        uploaded_file = io.BytesIO(content)
+        uploaded_file.name = name
+        uploaded_file.size = len(content)
+        return uploaded_file
+    
+    def rejection(uploaded_file, limits=None):
+        try:
+            ingest_upload(uploaded_file, limits=limits)
+        except UploadRejectedError as e:
+            return str(e)
+        return None
+    
+    code = b"def add(a, b):\n    return a + b\n" * 2000
+    ingested = ingest_upload(upload("solution.py", code))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        parsed = ParseCache(cache_dir).parse(FileParser(), ingested)
+    if ingested.size == len(code) and ingested.getvalue() == code and parsed == code.decode('utf-8'):
+        print("✅ Upload copied in chunks into a spooled buffer and parsed from it")
+    else:
+        print("❌ Ingested upload differs from the original")
+    
+    if (rejection(upload("solution.py", b"x = 1\n" * 30000))
+            and rejection(upload("big.py", b"x")) is None
+            and rejection(upload("big.py", b"x" * 2048), limits={'max_bytes': 1024})):
+        print("✅ Line and byte caps enforced while reading")
+    else:
+        print("❌ Line or byte cap not enforced")
+    
+    oversized = upload("spec.pdf", b"%PDF-1.4")
+    oversized.size = 500 * 1024 * 1024
+    if rejection(oversized) and not FileParser().validate_file_size(oversized) and FileParser().validate_file_size(upload("spec.pdf", b"%PDF-1.4")):
+        print("✅ Oversized upload rejected from its declared size, before copying")
+    else:
+        print("❌ Oversized upload accepted")
+    
+    mislabeled = [upload("spec.pdf", b"Just text"), upload("spec.docx", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),
+                  upload("solution.py", b"%PDF-1.4\x00\x01"), upload("empty.txt", b"")]
+    if all(rejection(uploaded_file) for uploaded_file in mislabeled) and rejection(upload("legacy.doc", b"PK\x03\x04rest")) is None:
+        print("✅ Mislabeled and empty files rejected by their magic bytes")
+    else:
+        print("❌ Mislabeled file accepted")
+
+def test_parse_pool():
+    """Test parsing documents in the shared worker process pool"""
+    print("\nTesting parse pool...")
+    
+    try:
+        import fitz
+        import docx
+    except ImportError:
+        print("⚠️ PyMuPDF or python-docx not installed, skipping parse pool tests")
+        return
+    
+    from utils.file_parser import FileParser, PARALLEL_PDF_MIN_PAGES
+    from utils.parse_pool import ParsePool, ParsePoolBusyError, ParseTimeoutError
+    import io
+    import time
+    
+    doc = fitz.open()
+    for page_num in range(PARALLEL_PDF_MIN_PAGES + 6):
+        doc.new_page().insert_text((72, 72), f"Requirement {page_num}: return the sorted list.")
+    pdf = io.BytesIO(doc.tobytes())
+    pdf.name = "spec.pdf"
+    doc.close()
+    
+    document = docx.Document()
+    document.add_paragraph("Write a function that adds two numbers.")
+    word = io.BytesIO()
+    document.save(word)
+    word.name = "spec.docx"
+    word.seek(0)
+    
+    pool = ParsePool(workers=2, max_queue=0)
+    try:
+        parser = FileParser(parse_pool=pool)
+        sequential = FileParser(pdf_workers=0)
+        if parser.parse_file(pdf) == sequential.parse_file(pdf) and parser.parse_file(word) == sequential.parse_file(word):
+            print("✅ PDF and DOCX parsed in pool workers match in-thread parsing")
+        else:
+            print("❌ Pool parsing differs from in-thread parsing")
+        
+        try:
+            pool.map(time.sleep, [(1,)] * 3)
+            print("❌ Pool admitted more tasks than its capacity")
+        except ParsePoolBusyError:
+            print("✅ Tasks beyond the pool's capacity refused")
+        
+        time.sleep(1.5)
+        try:
+            pool.run(time.sleep, 2, timeout=0.2)
+            print("❌ Slow task not timed out")
+        except ParseTimeoutError:
+            print("✅ Slow task reported as timed out")
+        # The hung task is still sleeping, but the pool has already moved on to fresh workers
+        if pool.get_stats()['in_flight'] == 0 and pool.idle_workers() == 2:
+            print("✅ Pool recycled its workers after a timeout")
+        else:
+            print(f"❌ Timed-out task kept its worker slot: {pool.get_stats()}")
+        if pool.map(abs, [(-1,), (-2,)], timeout=30) == [1, 2]:
+            print("✅ Pool runs new tasks after a timeout")
+        else:
+            print("❌ Pool did not recover after a timeout")
+    finally:
+        pool.close()
+
+def test_review_history():
+    """Test the persistent, searchable review history"""
+    print("\nTesting review history...")
+    
+    from api_handlers.mock_review import MockReview
+    from utils.review_history import ReviewHistory
+    from concurrent.futures import ThreadPoolExecutor
+    import tempfile
+    
+    problem = "Write a function that sorts a list."
+    code = "def sort_list(items):\n    return sorted(items)\n"
+    review = "### Strengths\nClear use of the built-in sort. " * 40
+    with tempfile.TemporaryDirectory() as history_dir:
+        history = ReviewHistory(f"{history_dir}/history.sqlite3")
+        entry_id = history.record(problem, code, "gemini-test", review, solution_name="sort.py",
+                                  elapsed_ms=850.0, input_tokens=1200, output_tokens=300)
+        duplicate_id = history.record(problem, code, "gemini-test", review, solution_name="sort.py")
+        if entry_id is not None and duplicate_id == entry_id and history.get_stats()['reviews'] == 1:
+            print("✅ Review recorded once")
+        else:
+            print("❌ Review not recorded, or recorded twice")
+        
+        entry = history.get(entry_id)
+        stats = history.get_stats()
+        if entry['review'] == review and entry['input_tokens'] == 1200 and stats['stored_bytes'] < stats['review_bytes'] / 4:
+            print(f"✅ Review text stored compressed ({stats['compression_ratio']:.0%} of its size) and restored intact")
+        else:
+            print(f"❌ Stored review differs or is not compressed: {stats}")
+        
+        found = history.find("Write a function   that sorts a list.\n", code)
+        if [match['id'] for match in found] == [entry_id] and not history.find(problem, code + "# changed\n"):
+            print("✅ Past review found by problem and solution hash")
+        else:
+            print("❌ Past review lookup failed")
+        
+        if ([match['id'] for match in history.search("built-in sor")] == [entry_id]
+                and history.search("recursion") == [] and history.search('"sort (') is not None):
+            print("✅ Reviews searchable by word prefix, including odd punctuation")
+        else:
+            print("❌ Review search failed")
+        
+        if history.record(problem, code, "gemini-test", MockReview("Error: quota")) is None:
+            print("✅ Placeholder reviews not recorded")
+        else:
+            print("❌ Placeholder review recorded")
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda n: history.record(problem, f"x = {n}\n", "gemini-test", f"Review {n}"), range(20)))
+        journal_mode = history._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        if history.get_stats()['reviews'] == 21 and len(history.recent(5)) == 5 and journal_mode == 'wal':
+            print("✅ Concurrent writers recorded every review in WAL mode")
+        else:
+            print(f"❌ Concurrent writes lost ({history.get_stats()['reviews']} stored, journal {journal_mode})")
+        history.close()
+
+def test_structured_review():
+    """Test structured JSON reviews, their validation, rendering and section regeneration prompts"""
+    print("\nTesting structured reviews...")
+    
+    from api_handlers.structured_output import use_structured_output
+    from utils.prompt_builder import PromptBuilder
+    from utils.review_schema import SECTION_FIELDS, ReviewValidationError, get_review_schema, parse_structured_review, render_review_markdown
+    from utils.token_budget import estimate_tokens
+    import json
+    
+    review = {
+        "ai_authorship": {"human_percent": 70, "reasoning": "Consistent, terse naming."},
+        "problem_match": "Handles every requirement.",
+        "strengths": ["Uses the built-in sort"],
+        "improvements": ["Validate the input type"],
+        "detailed_analysis": "Runs in O(n log n).",
+        "recommendations": ["Add unit tests"],
+        "quality_score": {"score": 8, "justification": "Correct and readable."},
+        "suggested_improvements": "```python\ndef sort_list(items: list) -> list:\n    return sorted(items)\n```",
+    }
+    reply = "Here is the review:\n```json\n" + json.dumps(review) + "\n```"
+    if parse_structured_review(reply) == review:
+        print("✅ Structured review parsed from a fenced reply")
+    else:
+        print("❌ Structured review not parsed")
+    
+    broken = {**review, "quality_score": {"score": 14, "justification": "Too generous"}, "strengths": "Not a list"}
+    del broken["problem_match"]
+    try:
+        parse_structured_review(json.dumps(broken))
+        print("❌ Invalid structured review accepted")
+    except ReviewValidationError as e:
+        if all(field in str(e) for field in ("quality_score", "strengths", "problem_match")):
+            print("✅ Invalid fields all reported by the validator")
+        else:
+            print(f"❌ Validator missed problems: {e}")
+    
+    markdown = render_review_markdown(review)
+    headings = [line for line in markdown.splitlines() if line.startswith("### ")]
+    if len(headings) == len(SECTION_FIELDS) and "**8/10**" in markdown and "70% likely human-written" in markdown:
+        print("✅ Structured review rendered as the markdown report")
+    else:
+        print("❌ Markdown rendering incomplete")
+    
+    builder = PromptBuilder()
+    problem = "Write a function that sorts a list of numbers. " * 20
+    code = "def sort_list(items):\n    return sorted(items)\n" * 10
+    full_prompt = builder.build_structured_review_prompt(problem, code)
+    section_prompt = builder.build_section_prompt(problem, code, "strengths", review["strengths"])
+    shared = full_prompt[:full_prompt.index("Respond with the JSON review object only.")]
+    if section_prompt.startswith(shared) and parse_structured_review('{"strengths": ["Short"]}', fields=["strengths"]) == {"strengths": ["Short"]}:
+        print(f"✅ Section prompt shares the full prompt's prefix ({estimate_tokens(shared):,} cacheable tokens) and asks for one field")
+    else:
+        print("❌ Section prompt does not share the structured prompt's prefix")
+    
+    class OpenAIStub:
+        provider = "openai"
+        generation_params = {"temperature": 0.2}
+    class ClaudeStub:
+        provider = "anthropic"
+        generation_params = {"max_tokens": 4000}
+    openai_params = use_structured_output(OpenAIStub()).generation_params
+    if openai_params == {"temperature": 0.2, "response_format": {"type": "json_object"}}:
+        print("✅ Provider JSON mode switched on where the provider has one")
+    else:
+        print(f"❌ Unexpected structured output parameters: {openai_params}")
+    
+    claude_params = use_structured_output(ClaudeStub(), fields=["strengths"]).generation_params
+    tool = claude_params.get("tools", [{}])[0]
+    if (claude_params.get("max_tokens") == 4000 and claude_params.get("tool_choice") == {"type": "tool", "name": tool.get("name")}
+            and tool.get("input_schema") == get_review_schema(["strengths"])):
+        print("✅ Claude is forced to call a tool taking the review schema")
+    else:
+        print(f"❌ Unexpected Claude structured output parameters: {claude_params}")
+    
+    from types import SimpleNamespace
+    from api_handlers.claude_api import ClaudeHandler
+    
+    def create(**kwargs):
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", input={"strengths": ["Clear names"]})],
+            usage=SimpleNamespace(input_tokens=10, output_tokens=5)
+        )
+    
+    with stub_provider_clients():
+        claude = use_structured_output(ClaudeHandler(), fields=["strengths"])
+    claude.api_key = "sk-test"
+    claude.client = SimpleNamespace(messages=SimpleNamespace(create=create))
+    claude.model_name = "claude-structured-test"
+    if parse_structured_review(claude.get_review("prompt"), fields=["strengths"]) == {"strengths": ["Clear names"]}:
+        print("✅ Claude handler returns the tool input as the review")
+    else:
+        print("❌ Claude handler ignored the tool input")
+
 def main():
     """Run all tests"""
     print("🧪 Testing AI Code Reviewer Application")
@@ -143,6 +1826,31 @@ def main():
     test_prompt_builder()
     test_api_handlers()
     test_mock_reviews()
+    test_review_cache()
+    test_review_streaming()
+    test_provider_registry()
+    test_lazy_imports()
+    test_fanout_review()
+    test_batch_review()
+    test_rate_limiter()
+    test_circuit_breaker()
+    test_hedged_requests()
+    test_deadlines()
+    test_token_budget()
+    test_chunked_review()
+    test_pdf_parsing()
+    test_word_parsing()
+    test_legacy_doc_parsing()
+    test_parse_cache()
+    test_problem_registry()
+    test_prompt_caching()
+    test_request_coalescing()
+    test_similarity_index()
+    test_job_queue()
+    test_upload_ingestion()
+    test_parse_pool()
+    test_review_history()
+    test_structured_review()
     
     print("\n" + "=" * 50)
     print("✅ All tests completed!")
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Union
+
+DEFAULT_CACHE_ROOT = Path(os.getenv('AI_REVIEWER_CACHE_DIR', Path(__file__).resolve().parent.parent / '.cache'))
+
+# Eviction frees space down to this share of the disk limit, so the writes that follow
+# do not each rescan the cache directory
+DISK_LOW_WATER_RATIO = 0.9
+
+
+class TwoTierCache:
+    """Thread-safe cache with an in-memory LRU tier in front of a persistent on-disk tier"""
+
+    def __init__(self, cache_dir: Union[str, Path], max_memory_items: int = 256,
+                 max_disk_bytes: int = 200 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._disk_bytes = sum(path.stat().st_size for path in self._iter_disk_entries())
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._is_expired(entry['created']):
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry['value']
+                del self._memory[key]
+
+            entry = self._read_disk(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self._remember(key, entry)
+            self.stats['disk_hits'] += 1
+            return entry['value']
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value in both tiers"""
+        entry = {'created': time.time(), 'value': value}
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk(key, entry)
+            self.stats['writes'] += 1
+            self._evict_disk()
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            for path in self._iter_disk_entries():
+                self._remove(path)
+
+    def get_stats(self) -> dict:
+        """Get hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+            stats['memory_items'] = len(self._memory)
+            stats['disk_bytes'] = self._disk_bytes
+            return stats
+
+    def _remember(self, key: str, entry: dict) -> None:
+        """Insert into the memory tier, dropping the least recently used item when full"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _is_expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _path_for(self, key: str) -> Path:
+        # Shard by key prefix so a single directory never grows too large
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _iter_disk_entries(self):
+        return self.cache_dir.glob('*/*.json')
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self._is_expired(entry.get('created', 0)):
+            self._remove(path)
+            return None
+
+        # Touch the file so disk eviction follows access order
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write_disk(self, key: str, entry: dict) -> None:
+        path = self._path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        previous_size = path.stat().st_size if path.exists() else 0
+
+        # Write atomically so concurrent readers never see a partial entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._disk_bytes += path.stat().st_size - previous_size
+
+    def _evict_disk(self) -> None:
+        """Once over its size limit, drop least recently used entries down to the low-water mark"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+
+        entries = []
+        for path in self._iter_disk_entries():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._disk_bytes = sum(size for _, size, _ in entries)
+        low_water = int(self.max_disk_bytes * DISK_LOW_WATER_RATIO)
+        for _, size, path in entries:
+            if self._disk_bytes <= low_water:
+                break
+            self._remove(path)
+            self._memory.pop(path.stem, None)
+            self.stats['evictions'] += 1
+
+    def _remove(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            os.unlink(path)
+        except OSError:
+            return
+        self._disk_bytes = max(0, self._disk_bytes - size)
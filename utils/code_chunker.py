@@ -0,0 +1,190 @@
+import ast
+from typing import List, Optional
+
+from utils.token_budget import estimate_tokens
+
+
+class CodeChunk:
+    """A contiguous range of source lines reviewed on its own"""
+
+    def __init__(self, label: str, start_line: int, end_line: int, code: str):
+        self.label = label
+        self.start_line = start_line
+        self.end_line = end_line
+        self.code = code
+
+    @property
+    def title(self) -> str:
+        return f"{self.label} (lines {self.start_line}-{self.end_line})"
+
+    def __repr__(self) -> str:
+        return f"CodeChunk({self.title!r})"
+
+
+def split_code(code: str, max_tokens: int) -> List[CodeChunk]:
+    """Split Python source into chunks of at most max_tokens along ast boundaries
+
+    Module-level functions and classes are kept whole where they fit; oversized classes
+    are split into their methods and oversized functions into their top statements.
+    Small neighbouring pieces are packed together so the number of chunks stays low.
+    Every line of the file ends up in exactly one chunk, including comments and blank lines.
+    """
+    lines = code.split('\n')
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        tree = None
+
+    if tree is None or not tree.body:
+        segments = _split_lines(lines, 1, len(lines), "module", max_tokens)
+    else:
+        segments = _split_body(lines, tree.body, 1, len(lines), None, max_tokens)
+    return _pack(lines, segments, max_tokens)
+
+
+def summarize_symbols(code: str) -> str:
+    """Compact outline of a module: imports, constants, function and class signatures with line ranges"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return "(outline unavailable: the file does not parse)"
+
+    imports = []
+    entries = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.extend(f"{node.module or ''}.{alias.name}".lstrip('.') for alias in node.names)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            entries.append(f"{_signature(node)}  [lines {_first_line(node)}-{node.end_lineno}]")
+        elif isinstance(node, ast.ClassDef):
+            bases = ", ".join(ast.unparse(base) for base in node.bases)
+            entries.append(f"class {node.name}{f'({bases})' if bases else ''}  [lines {_first_line(node)}-{node.end_lineno}]")
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    entries.append(f"    {_signature(item)}  [lines {_first_line(item)}-{item.end_lineno}]")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = ", ".join(ast.unparse(target) for target in targets)
+            entries.append(f"{names} = ...  [line {node.lineno}]")
+
+    outline = []
+    if imports:
+        outline.append("imports: " + ", ".join(imports))
+    outline.extend(entries)
+    return "\n".join(outline) or "(no top-level definitions)"
+
+
+def _signature(node: ast.AST) -> str:
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _first_line(node: ast.AST) -> int:
+    """First line of a statement, including its decorators"""
+    decorators = getattr(node, 'decorator_list', None) or []
+    return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+
+def _node_label(node: ast.AST, parent: Optional[str]) -> str:
+    if isinstance(node, ast.ClassDef):
+        name = node.name
+    elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        name = f"{node.name}()"
+    else:
+        if parent is None:
+            return "module code"
+        return parent if parent.endswith(" body") else f"{parent} body"
+    return f"{parent}.{name}" if parent else name
+
+
+def _split_body(lines: List[str], body: list, start: int, end: int, parent: Optional[str],
+                max_tokens: int) -> List[tuple]:
+    """Split lines start..end into (label, start, end) segments, one per statement in body
+
+    Comments and blank lines before a statement belong to it; lines after the last
+    statement belong to the last one.
+    """
+    segments = []
+    segment_start = start
+    for index, node in enumerate(body):
+        segment_end = end if index == len(body) - 1 else max(node.end_lineno, segment_start)
+        label = _node_label(node, parent)
+        if _tokens(lines, segment_start, segment_end) <= max_tokens:
+            segments.append((label, segment_start, segment_end))
+        else:
+            segments.extend(_split_node(lines, node, segment_start, segment_end, label, max_tokens))
+        segment_start = segment_end + 1
+    return segments
+
+
+def _split_node(lines: List[str], node: ast.AST, start: int, end: int, label: str, max_tokens: int) -> List[tuple]:
+    """Split an oversized statement along its nested body, keeping its header with the first part"""
+    body = getattr(node, 'body', None)
+    if not isinstance(body, list) or not body or body[0].lineno <= start:
+        return _split_lines(lines, start, end, label, max_tokens)
+
+    # The header (decorators, signature, docstring-less preamble) leads into the first inner statement
+    segments = _split_body(lines, body, body[0].lineno, end, label, max_tokens)
+    first_label, _, first_end = segments[0]
+    if _tokens(lines, start, first_end) <= max_tokens:
+        segments[0] = (first_label, start, first_end)
+    else:
+        segments.insert(0, (label, start, body[0].lineno - 1))
+    return segments
+
+
+def _split_lines(lines: List[str], start: int, end: int, label: str, max_tokens: int) -> List[tuple]:
+    """Last resort for a single huge statement or unparsable code: split on line windows"""
+    segments = []
+    segment_start = start
+    used = 0
+    for line_number in range(start, end + 1):
+        cost = estimate_tokens(lines[line_number - 1]) + 1
+        if used and used + cost > max_tokens:
+            segments.append((label, segment_start, line_number - 1))
+            segment_start = line_number
+            used = 0
+        used += cost
+    segments.append((label, segment_start, end))
+    if len(segments) > 1:
+        segments = [(f"{label} part {i}", s, e) for i, (_, s, e) in enumerate(segments, start=1)]
+    return segments
+
+
+def _pack(lines: List[str], segments: List[tuple], max_tokens: int) -> List[CodeChunk]:
+    """Merge neighbouring segments into chunks that stay within max_tokens"""
+    chunks = []
+    labels = []
+    chunk_start = None
+    chunk_end = None
+    used = 0
+
+    def flush():
+        if chunk_start is None:
+            return
+        code = '\n'.join(lines[chunk_start - 1:chunk_end])
+        shown = labels if len(labels) <= 3 else labels[:3] + [f"{len(labels) - 3} more"]
+        chunks.append(CodeChunk(", ".join(shown), chunk_start, chunk_end, code))
+
+    for label, start, end in segments:
+        if start > end:
+            continue
+        cost = _tokens(lines, start, end) + 1
+        if chunk_start is not None and used + cost > max_tokens:
+            flush()
+            chunk_start, labels, used = None, [], 0
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+        if label not in labels:
+            labels.append(label)
+        used += cost
+    flush()
+    return chunks
+
+
+def _tokens(lines: List[str], start: int, end: int) -> int:
+    return estimate_tokens('\n'.join(lines[start - 1:end]))
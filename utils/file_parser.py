@@ -1,13 +1,61 @@
-import streamlit as st
-import tempfile
+import io
+import mimetypes
+import multiprocessing
 import os
-from typing import Union, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Union, Optional
 from pathlib import Path
 
+# Pages past this are left out of problem statements; override with AI_REVIEWER_MAX_PDF_PAGES
+DEFAULT_MAX_PDF_PAGES = int(os.getenv('AI_REVIEWER_MAX_PDF_PAGES', '300'))
+
+# Bump whenever a parser's output changes, so cached parses from older versions are not reused
+PARSER_VERSION = 2
+
+# PDFs with at least this many pages are extracted in a process pool, a range of pages per worker
+PARALLEL_PDF_MIN_PAGES = int(os.getenv('AI_REVIEWER_PARALLEL_PDF_PAGES', '64'))
+
+def _iter_page_text(doc, stop: int, start: int = 0) -> Iterator[str]:
+    """Text of pages start..stop-1 of an open PyMuPDF document, one page at a time"""
+    for page_num in range(start, stop):
+        yield doc.load_page(page_num).get_text()
+
+def _extract_pdf_pages(data: bytes, start: int, stop: int) -> str:
+    """Extract the text of pages start..stop-1; runs in a worker process for large PDFs"""
+    import fitz  # PyMuPDF
+    
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return "".join(_iter_page_text(doc, stop, start))
+
+def _parse_document(filename: str, data: bytes, max_pdf_pages: int) -> str:
+    """Parse a DOC or DOCX upload; runs in a worker process of the shared parse pool"""
+    upload = io.BytesIO(data)
+    upload.name = filename
+    parser = FileParser(max_pdf_pages, pdf_workers=0)
+    return parser.supported_formats[parser._get_file_extension(filename)](upload)
+
+class LocalFile(io.BytesIO):
+    """File on disk exposed with the same interface as a Streamlit UploadedFile"""
+    
+    def __init__(self, path: Union[str, Path]):
+        path = Path(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        super().__init__(data)
+        self.path = path
+        self.name = path.name
+        self.size = len(data)
+        self.type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
 class FileParser:
     """Utility class for parsing different file formats"""
     
-    def __init__(self):
+    def __init__(self, max_pdf_pages: Optional[int] = None, pdf_workers: Optional[int] = None, parse_pool=None):
+        self.max_pdf_pages = max_pdf_pages or DEFAULT_MAX_PDF_PAGES
+        # 0 or 1 keeps PDF extraction in the calling thread
+        self.pdf_workers = (os.cpu_count() or 1) if pdf_workers is None else pdf_workers
+        # With a shared ParsePool, documents are parsed in its worker processes; text files never are
+        self.parse_pool = parse_pool
         self.supported_formats = {
             'pdf': self._parse_pdf,
             'txt': self._parse_txt,
@@ -30,23 +78,31 @@ class FileParser:
         
         # Parse file based on its type
         try:
+            if self.parse_pool is not None and file_extension in ('doc', 'docx'):
+                return self.parse_pool.run(_parse_document, uploaded_file.name, self.read_bytes(uploaded_file), self.max_pdf_pages)
             return self.supported_formats[file_extension](uploaded_file)
         except Exception as e:
             raise Exception(f"Error parsing {uploaded_file.name}: {str(e)}")
     
+    def get_parse_settings(self, filename: str) -> str:
+        """Everything besides the file content that affects the parsed text of a file"""
+        extension = self._get_file_extension(filename)
+        settings = f"{extension}:v{PARSER_VERSION}"
+        if extension == 'pdf':
+            settings += f":pages={self.max_pdf_pages}"
+        return settings
+    
     def _get_file_extension(self, filename: str) -> str:
         """Extract file extension from filename"""
         return Path(filename).suffix.lower().lstrip('.')
     
     def _parse_txt(self, uploaded_file) -> str:
         """Parse TXT file"""
+        content = self.read_bytes(uploaded_file)
         try:
-            content = uploaded_file.read()
-            uploaded_file.seek(0)  # Reset file pointer
             return content.decode('utf-8')
         except UnicodeDecodeError:
             # Try with different encoding
-            uploaded_file.seek(0)
             return content.decode('latin-1')
     
     def _parse_python(self, uploaded_file) -> str:
@@ -61,119 +117,133 @@ class FileParser:
             raise ImportError("PyMuPDF not installed. Install with: pip install PyMuPDF")
         
         try:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_file_path = tmp_file.name
-            
-            # Parse PDF
-            doc = fitz.open(tmp_file_path)
-            text_content = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text_content += page.get_text()
+            # Open straight from the upload's bytes; nothing is written to disk
+            data = self.read_bytes(uploaded_file)
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                page_count = doc.page_count
+                pages = min(page_count, self.max_pdf_pages)
+                if self.parse_pool is not None or (pages >= PARALLEL_PDF_MIN_PAGES and self.pdf_workers > 1):
+                    text_content = None
+                else:
+                    text_content = "".join(_iter_page_text(doc, pages))
             
-            doc.close()
+            if text_content is None:
+                text_content = self._extract_pdf_in_pool(data, pages)
             
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
-            
-            # Reset file pointer
-            uploaded_file.seek(0)
+            if page_count > pages:
+                text_content += f"\n\n[... {page_count - pages} more pages not included]"
             
             return text_content.strip()
             
         except Exception as e:
-            # Clean up on error
-            if 'tmp_file_path' in locals():
-                try:
-                    os.unlink(tmp_file_path)
-                except:
-                    pass
             raise Exception(f"Error parsing PDF: {str(e)}")
     
+    def iter_pdf_pages(self, uploaded_file, max_pages: Optional[int] = None) -> Iterator[str]:
+        """Yield the text of each PDF page lazily, up to the page cap"""
+        import fitz  # PyMuPDF
+        
+        data = self.read_bytes(uploaded_file)
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            yield from _iter_page_text(doc, min(doc.page_count, max_pages or self.max_pdf_pages))
+    
+    def _extract_pdf_in_pool(self, data: bytes, pages: int) -> str:
+        """Extract page ranges in parallel worker processes and join them in page order"""
+        if pages == 0:
+            return ""
+        if self.parse_pool is None:
+            workers = min(self.pdf_workers, pages)
+        elif pages >= PARALLEL_PDF_MIN_PAGES:
+            # Only split over the workers idle now, so other sessions' uploads are not queued behind it
+            workers = max(1, min(self.parse_pool.idle_workers(), pages))
+        else:
+            workers = 1
+        step = -(-pages // workers)
+        ranges = [(start, min(start + step, pages)) for start in range(0, pages, step)]
+        if self.parse_pool is not None:
+            return "".join(self.parse_pool.map(_extract_pdf_pages, [(data, start, stop) for start, stop in ranges]))
+        # spawn rather than fork: the app process runs many threads
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_extract_pdf_pages, data, start, stop) for start, stop in ranges]
+            return "".join(future.result() for future in futures)
+    
+    def read_bytes(self, uploaded_file) -> bytes:
+        """Get an upload's content without moving its file pointer"""
+        if hasattr(uploaded_file, 'getvalue'):
+            return uploaded_file.getvalue()
+        data = uploaded_file.read()
+        uploaded_file.seek(0)
+        return data
+    
     def _parse_doc(self, uploaded_file) -> str:
-        """Parse DOC file using python-docx"""
-        try:
-            from docx import Document
-        except ImportError:
-            raise ImportError("python-docx not installed. Install with: pip install python-docx")
+        """Parse a legacy Word 97-2003 DOC file, or a DOCX saved with a .doc name"""
+        from utils.legacy_doc import extract_doc_text, is_ole_file, is_zip_file
+        
+        data = self.read_bytes(uploaded_file)
+        if is_zip_file(data):
+            return self._parse_docx(uploaded_file)
+        if not is_ole_file(data):
+            raise Exception("Error parsing DOC: not a Word document")
         
         try:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.doc') as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_file_path = tmp_file.name
-            
-            # Parse DOC
-            doc = Document(tmp_file_path)
-            text_content = ""
-            
-            for paragraph in doc.paragraphs:
-                text_content += paragraph.text + "\n"
-            
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
-            
-            # Reset file pointer
-            uploaded_file.seek(0)
-            
-            return text_content.strip()
-            
+            return extract_doc_text(data)
         except Exception as e:
-            # Clean up on error
-            if 'tmp_file_path' in locals():
-                try:
-                    os.unlink(tmp_file_path)
-                except:
-                    pass
             raise Exception(f"Error parsing DOC: {str(e)}")
     
     def _parse_docx(self, uploaded_file) -> str:
         """Parse DOCX file using python-docx"""
+        try:
+            return "\n".join(self.iter_docx_text(uploaded_file)).strip()
+        except ImportError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error parsing DOCX: {str(e)}")
+    
+    def iter_docx_text(self, uploaded_file) -> Iterator[str]:
+        """Yield the text of each DOCX paragraph and table row in document order
+        
+        Table cells are joined with " | "; cells merged across columns are only included once.
+        """
         try:
             from docx import Document
+            from docx.table import Table
         except ImportError:
             raise ImportError("python-docx not installed. Install with: pip install python-docx")
         
-        try:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_file_path = tmp_file.name
-            
-            # Parse DOCX
-            doc = Document(tmp_file_path)
-            text_content = ""
-            
-            for paragraph in doc.paragraphs:
-                text_content += paragraph.text + "\n"
-            
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
-            
-            # Reset file pointer
-            uploaded_file.seek(0)
-            
-            return text_content.strip()
-            
-        except Exception as e:
-            # Clean up on error
-            if 'tmp_file_path' in locals():
-                try:
-                    os.unlink(tmp_file_path)
-                except:
-                    pass
-            raise Exception(f"Error parsing DOCX: {str(e)}")
+        doc = Document(io.BytesIO(self.read_bytes(uploaded_file)))
+        for block in doc.iter_inner_content():
+            if isinstance(block, Table):
+                yield from self._iter_table_rows(block)
+            else:
+                yield block.text
     
-    def validate_file_size(self, uploaded_file, max_size_mb: int = 10) -> bool:
-        """Validate file size"""
+    def _iter_table_rows(self, table) -> Iterator[str]:
+        for row in table.rows:
+            cells = []
+            previous = None
+            for cell in row.cells:
+                # A cell merged across columns is repeated once per column it spans
+                if cell._tc is not previous:
+                    cells.append(cell.text.strip())
+                previous = cell._tc
+            yield " | ".join(cells)
+    
+    def validate_file_size(self, uploaded_file, max_size_mb: Optional[float] = None) -> bool:
+        """Validate file size against max_size_mb, by default the upload limit for the file's type
+        
+        A file object that does not report its size passes; ingestion checks it while copying.
+        """
         if uploaded_file is None:
             return False
         
-        file_size_mb = uploaded_file.size / (1024 * 1024)
-        return file_size_mb <= max_size_mb
+        if max_size_mb is None:
+            from utils.ingest import get_upload_limits
+            max_bytes = get_upload_limits(uploaded_file.name).get('max_bytes')
+            if max_bytes is None:
+                return True
+            max_size_mb = max_bytes / (1024 * 1024)
+        
+        size = getattr(uploaded_file, 'size', None)
+        return size is None or size / (1024 * 1024) <= max_size_mb
     
     def get_file_info(self, uploaded_file) -> dict:
         """Get file information"""
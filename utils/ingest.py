@@ -0,0 +1,184 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from utils.file_parser import FileParser
+from utils.legacy_doc import OLE_MAGIC, ZIP_MAGIC
+
+# Uploads are copied in pieces of this size, so caps are enforced before the whole file is read
+INGEST_CHUNK_SIZE = 1024 * 1024
+
+# Ingested uploads larger than this are spilled to a temporary file instead of held in memory
+SPOOL_MAX_MEMORY = int(os.getenv('AI_REVIEWER_SPOOL_BYTES', str(2 * 1024 * 1024)))
+
+# Per-type caps on upload size, PDF pages and text lines
+UPLOAD_LIMITS = {
+    'pdf': {'max_bytes': 25 * 1024 * 1024, 'max_pages': 2000},
+    'doc': {'max_bytes': 10 * 1024 * 1024},
+    'docx': {'max_bytes': 10 * 1024 * 1024},
+    'txt': {'max_bytes': 2 * 1024 * 1024, 'max_lines': 50000},
+    'py': {'max_bytes': 1024 * 1024, 'max_lines': 20000},
+}
+
+# Content types each extension may actually contain; a .doc may be a DOCX saved with the old name
+ACCEPTED_CONTENT = {
+    'pdf': {'pdf'},
+    'doc': {'ole', 'zip'},
+    'docx': {'zip'},
+    'txt': {'text'},
+    'py': {'text'},
+}
+
+_CONTENT_NAMES = {'pdf': "a PDF", 'ole': "a Word 97-2003 document", 'zip': "a ZIP/DOCX archive",
+                  'text': "plain text", 'binary': "a binary file"}
+
+
+class UploadRejectedError(ValueError):
+    """An upload refused before parsing: too large, too long, or not the type its name claims"""
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Classify a file by its first bytes: pdf, ole, zip, text or binary"""
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith(OLE_MAGIC):
+        return 'ole'
+    if head.startswith(ZIP_MAGIC):
+        return 'zip'
+    # Text never contains NUL bytes; UTF-16 text is not accepted by the text parsers either
+    return 'binary' if b'\0' in head else 'text'
+
+
+class IngestedFile:
+    """An upload copied through the ingestion stage into a spooled buffer
+
+    Exposes what parsers use of a Streamlit UploadedFile (name, size, type, read, seek,
+    getvalue), plus the content's sha256 computed while copying, so the parse cache
+    does not need another full copy of the bytes to hash it. getvalue is safe to call
+    from several threads, e.g. a background parse and the review job.
+    """
+
+    def __init__(self, name: str, buffer, size: int, sha256: str, content_type: str, mime_type: Optional[str] = None):
+        self.name = name
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+        self.type = mime_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self._buffer = buffer
+        self._lock = threading.Lock()
+
+    def read(self, size: int = -1) -> bytes:
+        with self._lock:
+            return self._buffer.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        with self._lock:
+            return self._buffer.seek(offset, whence)
+
+    def tell(self) -> int:
+        with self._lock:
+            return self._buffer.tell()
+
+    def getvalue(self) -> bytes:
+        """The whole content, leaving the read position where it was"""
+        with self._lock:
+            position = self._buffer.tell()
+            self._buffer.seek(0)
+            try:
+                return self._buffer.read()
+            finally:
+                self._buffer.seek(position)
+
+    def close(self) -> None:
+        self._buffer.close()
+
+
+def get_upload_limits(filename: str) -> dict:
+    """The caps that apply to an upload, by its extension"""
+    return UPLOAD_LIMITS.get(Path(filename).suffix.lower().lstrip('.'), {})
+
+
+def ingest_upload(uploaded_file, file_parser=None, limits: Optional[dict] = None) -> IngestedFile:
+    """Copy an upload into a spooled buffer in chunks, rejecting it as soon as it breaks a cap
+
+    The file type is sniffed from the first chunk and must match the extension, byte and
+    line caps are checked chunk by chunk, and a PDF's page count is checked once copied,
+    all before any text extraction or model call. Raises UploadRejectedError.
+    Accepts an UploadedFile or any binary file object with a name, such as open(path, 'rb').
+    """
+    name = Path(uploaded_file.name).name
+    extension = Path(name).suffix.lower().lstrip('.')
+    if extension not in ACCEPTED_CONTENT:
+        raise UploadRejectedError(f"Unsupported file format: {extension}")
+    limits = get_upload_limits(name) if limits is None else limits
+    max_bytes = limits.get('max_bytes')
+    max_lines = limits.get('max_lines')
+
+    # Reject on the declared size before copying anything
+    file_parser = file_parser or FileParser()
+    if max_bytes and not file_parser.validate_file_size(uploaded_file, max_bytes / (1024 * 1024)):
+        raise UploadRejectedError(_too_large(name, max_bytes))
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    lines = 0
+    content_type = None
+    try:
+        uploaded_file.seek(0)
+        while True:
+            chunk = uploaded_file.read(INGEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            if content_type is None:
+                content_type = sniff_content_type(chunk[:8192])
+                if content_type not in ACCEPTED_CONTENT[extension]:
+                    raise UploadRejectedError(
+                        f"{name} is {_CONTENT_NAMES[content_type]}, not a valid .{extension} file"
+                    )
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadRejectedError(_too_large(name, max_bytes))
+            if max_lines:
+                lines += chunk.count(b'\n')
+                if lines > max_lines:
+                    raise UploadRejectedError(f"{name} has more than {max_lines:,} lines")
+            digest.update(chunk)
+            buffer.write(chunk)
+        uploaded_file.seek(0)
+
+        if content_type is None:
+            raise UploadRejectedError(f"{name} is empty")
+        buffer.seek(0)
+        ingested = IngestedFile(name, buffer, size, digest.hexdigest(), content_type,
+                                getattr(uploaded_file, 'type', None))
+        if content_type == 'pdf' and limits.get('max_pages'):
+            _check_pdf_pages(ingested, limits['max_pages'])
+        return ingested
+    except Exception:
+        buffer.close()
+        raise
+
+
+def _check_pdf_pages(ingested: IngestedFile, max_pages: int) -> None:
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        # The PDF parser reports the missing dependency itself
+        return
+    try:
+        # Opening only reads the cross-reference table; no page is rendered
+        with fitz.open(stream=ingested.getvalue(), filetype="pdf") as doc:
+            page_count = doc.page_count
+    except Exception as e:
+        raise UploadRejectedError(f"{ingested.name} is not a readable PDF: {str(e)}")
+    if page_count > max_pages:
+        raise UploadRejectedError(f"{ingested.name} has {page_count:,} pages; the limit is {max_pages:,}")
+
+
+def _too_large(name: str, max_bytes: int) -> str:
+    return f"{name} is larger than the {max_bytes / (1024 * 1024):g} MB limit for this file type"
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from api_handlers.deadline import Deadline, ReviewCancelledError
+
+# Reviews run at once across every session; the rest wait in the queue
+DEFAULT_JOB_WORKERS = int(os.getenv('AI_REVIEWER_JOB_WORKERS', '8'))
+
+# How long a finished job's result stays available to a session that reconnects
+DEFAULT_JOB_RETENTION = float(os.getenv('AI_REVIEWER_JOB_RETENTION', '3600'))
+
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+
+class ReviewJob:
+    """One queued review: its status, live output, notices and result
+
+    The worker running the review reports through the job instead of calling Streamlit,
+    so any rerun of the page, or a new session after a reconnect, can pick it up by id.
+    """
+
+    def __init__(self, job_id: str, label: str, timeout: Optional[float] = None):
+        self.id = job_id
+        self.label = label
+        # The deadline covers the whole job, including time spent waiting for a worker
+        self.deadline = Deadline(timeout)
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.phase = None
+        self.progress = None
+        self.notices = []
+        self.preview = []
+        self.parts = {}
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def set_phase(self, phase: str) -> None:
+        """Describe what the review is doing now, e.g. parsing or condensing"""
+        with self._lock:
+            self.phase = phase
+            self.progress = None
+
+    def set_progress(self, fraction: float, text: str) -> None:
+        with self._lock:
+            self.progress = (fraction, text)
+
+    def notify(self, level: str, message: str) -> None:
+        """Add a message for the page to show with the given st level (info, warning, error, success)"""
+        with self._lock:
+            self.notices.append((level, message))
+
+    def stream(self, chunk: str) -> None:
+        """Append streamed review text to the live preview"""
+        with self._lock:
+            self.preview.append(chunk)
+
+    def clear_preview(self) -> None:
+        with self._lock:
+            self.preview = []
+
+    def expect_parts(self, labels: List[str]) -> None:
+        """Declare the named partial results, e.g. one per compared model, before they arrive"""
+        with self._lock:
+            self.parts = {label: None for label in labels}
+
+    def set_part(self, label: str, review: str, elapsed: float) -> None:
+        with self._lock:
+            self.parts[label] = (review, elapsed)
+
+    def snapshot(self) -> dict:
+        """A consistent copy of the job's state, safe to render while the worker keeps going"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'label': self.label,
+                'status': self.status,
+                'phase': self.phase,
+                'progress': self.progress,
+                'notices': list(self.notices),
+                'preview': ''.join(self.preview),
+                'parts': dict(self.parts),
+                'result': self.result,
+                'error': self.error,
+                'elapsed': (self.finished_at or time.time()) - (self.started_at or self.created_at),
+            }
+
+
+class JobQueue:
+    """Process-wide queue of review jobs executed by a bounded worker pool
+
+    Submitting returns a job id at once; the review runs on a worker thread whatever
+    happens to the Streamlit script that submitted it. Finished jobs are kept for
+    retention_seconds so their results survive reruns and reconnects.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_JOB_WORKERS, retention_seconds: float = DEFAULT_JOB_RETENTION):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="review-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[ReviewJob], object], label: str = "review", timeout: Optional[float] = None) -> str:
+        """Queue fn(job) and return the new job's id; fn's return value becomes the job's result"""
+        self._prune()
+        job = ReviewJob(uuid.uuid4().hex, label, timeout)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job.id
+
+    def get(self, job_id: Optional[str]) -> Optional[ReviewJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: Optional[str]) -> None:
+        """Cancel a job; a queued job never starts and a running one has its provider calls closed"""
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.deadline.cancel()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ('queued', 'running', *FINISHED_STATUSES)}
+
+    def _run(self, job: ReviewJob, fn: Callable[[ReviewJob], object]) -> None:
+        with job._lock:
+            if job.deadline.cancelled:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+        try:
+            result = fn(job)
+            status, error = ('cancelled' if job.deadline.cancelled else 'done'), None
+        except ReviewCancelledError:
+            result, status, error = None, 'cancelled', None
+        except Exception as e:
+            result, status, error = None, 'failed', str(e)
+        with job._lock:
+            job.result = result
+            job.error = error
+            job.status = status
+            job.finished_at = time.time()
+            job.preview = []
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
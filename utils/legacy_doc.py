@@ -0,0 +1,307 @@
+import bisect
+import re
+import struct
+from typing import Dict, List
+
+# First bytes of an OLE2 compound file, the container of Word 97-2003 .doc files
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# First bytes of a zip archive; .docx files are zips, and are often saved with a .doc name
+ZIP_MAGIC = b'PK\x03\x04'
+
+_END_OF_CHAIN = 0xFFFFFFFE
+_FREE_SECTOR = 0xFFFFFFFF
+
+# Word control characters mapped to the plain text they stand for; other control characters are dropped
+_SPECIAL_CHARACTERS = {
+    '\r': '\n',      # paragraph end
+    '\x07': '\t',    # table cell end; row ends are told apart by their paragraph properties
+    '\x0b': '\n',    # line break
+    '\x0c': '\n',    # page or section break
+    '\x0e': '\n',    # column break
+    '\x1e': '-',     # non-breaking hyphen
+    '\xa0': ' ',     # non-breaking space
+}
+_CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0e-\x1f]')
+
+# Paragraph properties marking a table row end (sprmPFTtp) or a nested table's row end (sprmPFInnerTtp)
+_ROW_END_SPRMS = {0x2417, 0x244C}
+# Operand sizes by the sprm's spra bits; 6 means the size is stored ahead of the operand
+_SPRM_OPERAND_SIZES = {0: 1, 1: 1, 2: 2, 3: 4, 4: 2, 5: 2, 7: 3}
+_SPRM_T_DEF_TABLE = {0xD608, 0xD606}
+
+
+def is_ole_file(data: bytes) -> bool:
+    return data[:8] == OLE_MAGIC
+
+
+def is_zip_file(data: bytes) -> bool:
+    return data[:4] == ZIP_MAGIC
+
+
+def extract_doc_text(data: bytes) -> str:
+    """Extract the main text of a Word 97-2003 .doc file from its bytes
+
+    Reads the compound file's streams in memory and follows the document's piece table,
+    so text is returned in document order in either of Word's text encodings. Headers,
+    footnotes and embedded objects are skipped; fields keep their displayed result.
+    Table cells are separated by tabs and rows end lines, using the paragraph properties
+    that mark a row end; if those cannot be read, a table's cells run on in one line.
+    """
+    streams = _CompoundFile(data).read_streams(('WordDocument', '0Table', '1Table'))
+    word_document = streams.get('WordDocument')
+    if word_document is None or len(word_document) < 0x200:
+        raise ValueError("Not a Word document: the WordDocument stream is missing")
+
+    ident, flags = struct.unpack_from('<H8xH', word_document, 0)
+    if ident != 0xA5EC:
+        raise ValueError("Not a Word 97-2003 document")
+    if flags & 0x0100:
+        raise ValueError("The document is password protected")
+
+    table = streams.get('1Table' if flags & 0x0200 else '0Table')
+    if table is None:
+        raise ValueError("The document's table stream is missing")
+
+    text_length, (clx_offset, clx_length), (papx_offset, papx_length) = _read_fib(word_document)
+    pieces = _read_piece_table(table[clx_offset:clx_offset + clx_length])
+    try:
+        row_ends = _read_row_end_paragraphs(word_document, table[papx_offset:papx_offset + papx_length])
+    except (struct.error, IndexError):
+        row_ends = []
+    return _clean_text(_read_pieces(word_document, pieces, text_length, row_ends))
+
+
+def _read_fib(word_document: bytes) -> tuple:
+    """Main-text length and the locations of the piece table and paragraph properties, from the file information block"""
+    offset = 32
+    (shorts,) = struct.unpack_from('<H', word_document, offset)
+    offset += 2 + shorts * 2
+    (longs,) = struct.unpack_from('<H', word_document, offset)
+    longs_offset = offset + 2
+    (text_length,) = struct.unpack_from('<i', word_document, longs_offset + 12)
+    offset = longs_offset + longs * 4
+    (pairs,) = struct.unpack_from('<H', word_document, offset)
+    if pairs <= 33:
+        raise ValueError("Unsupported Word file format")
+    papx = struct.unpack_from('<II', word_document, offset + 2 + 13 * 8)
+    clx = struct.unpack_from('<II', word_document, offset + 2 + 33 * 8)
+    return text_length, clx, papx
+
+
+def _read_piece_table(clx: bytes) -> List[tuple]:
+    """Pieces of the text as (first character, last character, file offset, compressed)"""
+    offset = 0
+    # Skip property modifier blocks ahead of the piece table
+    while offset < len(clx) and clx[offset] == 0x01:
+        (size,) = struct.unpack_from('<h', clx, offset + 1)
+        offset += 3 + size
+    if offset >= len(clx) or clx[offset] != 0x02:
+        raise ValueError("The document's piece table is missing")
+
+    (size,) = struct.unpack_from('<I', clx, offset + 1)
+    plc = clx[offset + 5:offset + 5 + size]
+    count = (len(plc) - 4) // 12
+    positions = struct.unpack_from(f'<{count + 1}I', plc, 0)
+    pieces = []
+    for index in range(count):
+        (fc,) = struct.unpack_from('<I', plc, (count + 1) * 4 + index * 8 + 2)
+        compressed = bool(fc & 0x40000000)
+        fc &= 0x3FFFFFFF
+        pieces.append((positions[index], positions[index + 1], fc // 2 if compressed else fc, compressed))
+    return pieces
+
+
+def _read_row_end_paragraphs(word_document: bytes, plc_bte_papx: bytes) -> List[tuple]:
+    """File offset ranges (start, end) of the paragraphs that end a table row, in order
+
+    Word writes the same mark for a cell end and a row end; only the row end's
+    paragraph carries the table-row flag. Paragraph properties live in 512-byte
+    pages of the WordDocument stream, listed by the table stream's PlcBtePapx.
+    """
+    count = (len(plc_bte_papx) - 4) // 8
+    pages = struct.unpack_from(f'<{count}I', plc_bte_papx, (count + 1) * 4) if count > 0 else ()
+    row_ends = []
+    for page_number in pages:
+        page = word_document[(page_number & 0x3FFFFF) * 512:][:512]
+        runs = page[511]
+        offsets = struct.unpack_from(f'<{runs + 1}I', page, 0)
+        for run in range(runs):
+            papx_offset = page[(runs + 1) * 4 + run * 13] * 2
+            if papx_offset and _is_row_end(page, papx_offset):
+                row_ends.append((offsets[run], offsets[run + 1]))
+    row_ends.sort()
+    return row_ends
+
+
+def _is_row_end(page: bytes, offset: int) -> bool:
+    """Whether the PapxInFkp at offset sets the table-row-end flag"""
+    size = page[offset]
+    if size == 0:
+        start, end = offset + 2, offset + 2 + 2 * page[offset + 1]
+    else:
+        start, end = offset + 1, offset + 2 * size
+    # Skip the paragraph style index ahead of the property modifiers
+    position = start + 2
+    while position + 2 <= end:
+        (sprm,) = struct.unpack_from('<H', page, position)
+        position += 2
+        if sprm in _ROW_END_SPRMS:
+            return page[position] != 0
+        spra = sprm >> 13
+        if spra != 6:
+            position += _SPRM_OPERAND_SIZES[spra]
+        elif sprm in _SPRM_T_DEF_TABLE:
+            (length,) = struct.unpack_from('<H', page, position)
+            position += 1 + length
+        else:
+            position += 1 + page[position]
+    return False
+
+
+def _read_pieces(word_document: bytes, pieces: List[tuple], text_length: int, row_ends: List[tuple]) -> str:
+    parts = []
+    starts = [start for start, _ in row_ends]
+    for start, end, offset, compressed in pieces:
+        end = min(end, text_length)
+        if start >= end:
+            continue
+        if compressed:
+            text = word_document[offset:offset + end - start].decode('cp1252', errors='replace')
+        else:
+            text = word_document[offset:offset + 2 * (end - start)].decode('utf-16-le', errors='replace')
+        if row_ends and '\x07' in text:
+            characters = list(text)
+            for index, char in enumerate(characters):
+                if char != '\x07':
+                    continue
+                fc = offset + (index if compressed else 2 * index)
+                row = bisect.bisect_right(starts, fc) - 1
+                if row >= 0 and fc < row_ends[row][1]:
+                    # A row end mark ends the line like a paragraph mark
+                    characters[index] = '\r'
+            text = ''.join(characters)
+        parts.append(text)
+    return ''.join(parts)
+
+
+def _clean_text(text: str) -> str:
+    # Keep only the displayed result of fields: drop everything from field start to separator
+    result = []
+    depth = 0
+    hidden_depth = []
+    for char in text:
+        if char == '\x13':
+            depth += 1
+            hidden_depth.append(depth)
+        elif char == '\x14':
+            if hidden_depth and hidden_depth[-1] == depth:
+                hidden_depth.pop()
+        elif char == '\x15':
+            if hidden_depth and hidden_depth[-1] == depth:
+                hidden_depth.pop()
+            depth = max(0, depth - 1)
+        elif not hidden_depth:
+            result.append(_SPECIAL_CHARACTERS.get(char, char))
+
+    text = _CONTROL_CHARACTERS.sub('', ''.join(result))
+    # Stripping each line also drops the tab left by the last cell mark of a row
+    return '\n'.join(line.rstrip() for line in text.split('\n')).strip()
+
+
+class _CompoundFile:
+    """Minimal in-memory reader for OLE2 compound files, enough to pull out named streams"""
+
+    def __init__(self, data: bytes):
+        if not is_ole_file(data) or len(data) < 512:
+            raise ValueError("Not an OLE2 compound file")
+        self.data = data
+        sector_shift, mini_shift = struct.unpack_from('<HH', data, 0x1E)
+        if sector_shift not in (9, 12) or mini_shift != 6:
+            raise ValueError("Not an OLE2 compound file: unsupported sector size")
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_shift
+        (self.first_directory,) = struct.unpack_from('<I', data, 0x30)
+        self.mini_cutoff, self.first_mini_fat, mini_fat_sectors = struct.unpack_from('<III', data, 0x38)
+        first_difat, difat_sectors = struct.unpack_from('<II', data, 0x44)
+        self.fat = self._read_fat(first_difat, difat_sectors)
+
+    def read_streams(self, names) -> Dict[str, bytes]:
+        entries = self._read_directory()
+        root = entries[0] if entries else None
+        mini_stream = None
+        mini_fat = None
+        streams = {}
+        for name, entry_type, start, size in entries:
+            if entry_type != 2 or name not in names:
+                continue
+            if size < self.mini_cutoff:
+                if mini_stream is None:
+                    mini_stream = self._read_chain(root[2])
+                    mini_fat = self._to_ints(self._read_chain(self.first_mini_fat))
+                streams[name] = self._read_mini_chain(mini_stream, mini_fat, start)[:size]
+            else:
+                streams[name] = self._read_chain(start)[:size]
+        return streams
+
+    def _sector(self, sector: int) -> bytes:
+        offset = (sector + 1) * self.sector_size
+        return self.data[offset:offset + self.sector_size]
+
+    def _read_fat(self, first_difat: int, difat_sectors: int) -> List[int]:
+        fat_sectors = list(struct.unpack_from('<109I', self.data, 0x4C))
+        sector = first_difat
+        # A DIFAT chain cannot be longer than the file has sectors
+        for _ in range(min(difat_sectors, len(self.data) // self.sector_size)):
+            if sector >= _END_OF_CHAIN:
+                break
+            values = self._to_ints(self._sector(sector))
+            fat_sectors.extend(values[:-1])
+            sector = values[-1]
+        fat = []
+        for sector in fat_sectors:
+            if sector < _END_OF_CHAIN:
+                fat.extend(self._to_ints(self._sector(sector)))
+        return fat
+
+    def _read_chain(self, sector: int) -> bytes:
+        parts = []
+        for sector in self._follow_chain(self.fat, sector):
+            parts.append(self._sector(sector))
+        return b''.join(parts)
+
+    def _read_mini_chain(self, mini_stream: bytes, mini_fat: List[int], sector: int) -> bytes:
+        parts = []
+        for sector in self._follow_chain(mini_fat, sector):
+            offset = sector * self.mini_sector_size
+            parts.append(mini_stream[offset:offset + self.mini_sector_size])
+        return b''.join(parts)
+
+    @staticmethod
+    def _follow_chain(fat: List[int], sector: int) -> List[int]:
+        """Sectors of the chain starting at sector, refusing a chain that loops back on itself"""
+        chain = []
+        visited = set()
+        while sector < _END_OF_CHAIN and sector < len(fat):
+            if sector in visited:
+                # A crafted file can point a sector back into its own chain to make it endless
+                raise ValueError("Corrupt Word file: a sector chain loops")
+            visited.add(sector)
+            chain.append(sector)
+            sector = fat[sector]
+        return chain
+
+    def _read_directory(self) -> List[tuple]:
+        directory = self._read_chain(self.first_directory)
+        entries = []
+        for offset in range(0, len(directory) - 127, 128):
+            (name_length,) = struct.unpack_from('<H', directory, offset + 0x40)
+            name = directory[offset:offset + max(0, name_length - 2)].decode('utf-16-le', errors='replace')
+            entry_type = directory[offset + 0x42]
+            start, size = struct.unpack_from('<II', directory, offset + 0x74)
+            entries.append((name, entry_type, start, size))
+        return entries
+
+    @staticmethod
+    def _to_ints(data: bytes) -> List[int]:
+        return list(struct.unpack(f'<{len(data) // 4}I', data[:len(data) // 4 * 4]))
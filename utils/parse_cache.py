@@ -0,0 +1,72 @@
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from utils.cache import DEFAULT_CACHE_ROOT, TwoTierCache
+
+
+class ParseCache:
+    """Content-addressed cache of parsed upload text, keyed on the file bytes and parser version
+
+    The same problem statement is uploaded by every student in a cohort, so each
+    distinct file is parsed once per deployment rather than on every submit. Concurrent
+    requests for the same file wait for a single parse instead of repeating it.
+    """
+
+    def __init__(self, cache_dir: Optional[Union[str, Path]] = None, max_memory_items: int = 128,
+                 max_disk_bytes: int = 100 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        self.store = TwoTierCache(
+            cache_dir or DEFAULT_CACHE_ROOT / 'parsed',
+            max_memory_items=max_memory_items,
+            max_disk_bytes=max_disk_bytes,
+            ttl_seconds=ttl_seconds
+        )
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data: Optional[bytes], file_parser, filename: str, content_hash: Optional[str] = None) -> str:
+        """Hash the file bytes together with everything that changes the parsed text
+
+        content_hash, the sha256 hex digest of the bytes, is used instead of data when given.
+        """
+        content_hash = content_hash or hashlib.sha256(data).hexdigest()
+        return hashlib.sha256(f"{content_hash}\0{file_parser.get_parse_settings(filename)}".encode('utf-8')).hexdigest()
+
+    def parse(self, file_parser, uploaded_file) -> str:
+        """Parse an upload with file_parser, reusing the text of an identical earlier upload"""
+        if uploaded_file is None:
+            return file_parser.parse_file(uploaded_file)
+
+        # Ingested uploads were hashed while they were copied; others are hashed here
+        content_hash = getattr(uploaded_file, 'sha256', None)
+        data = None if content_hash else file_parser.read_bytes(uploaded_file)
+        key = self.make_key(data, file_parser, uploaded_file.name, content_hash)
+        cached = self.store.get(key)
+        if cached is not None:
+            return cached
+
+        with self._key_locks_lock:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                cached = self.store.get(key)
+                if cached is not None:
+                    return cached
+                # Parse errors propagate and are not cached, so a fixed parser gets another try
+                text = file_parser.parse_file(uploaded_file)
+                self.store.set(key, text)
+                return text
+        finally:
+            with self._key_locks_lock:
+                if self._key_locks.get(key) is lock:
+                    del self._key_locks[key]
+
+    def get_stats(self) -> dict:
+        """Get hit/miss counters for both cache tiers"""
+        return self.store.get_stats()
+
+    def clear(self) -> None:
+        """Drop every cached parse"""
+        self.store.clear()
@@ -0,0 +1,148 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+# Worker processes parsing documents at once, shared by every session
+DEFAULT_PARSE_WORKERS = int(os.getenv('AI_REVIEWER_PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Parses allowed to wait for a worker; further ones are refused instead of piling up
+DEFAULT_PARSE_QUEUE_DEPTH = int(os.getenv('AI_REVIEWER_PARSE_QUEUE_DEPTH', '16'))
+
+# Seconds one document may take to parse, including time waiting for a worker
+DEFAULT_PARSE_TIMEOUT = float(os.getenv('AI_REVIEWER_PARSE_TIMEOUT', '120'))
+
+
+class ParsePoolBusyError(Exception):
+    """Raised instead of queueing a parse when the pool's queue is full"""
+
+    def __init__(self, capacity: int):
+        super().__init__(f"The document parser is busy ({capacity} documents in progress); please try again shortly")
+
+
+class ParseTimeoutError(Exception):
+    """A document took longer to parse than the pool's per-job timeout"""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"Parsing took longer than {timeout:.0f}s")
+
+
+def _warm_up_worker() -> None:
+    """Import the document libraries once per worker, so the first parse does not pay for it"""
+    for module in ('fitz', 'docx'):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+class ParsePool:
+    """Shared pool of worker processes for CPU-heavy document parsing
+
+    Workers are started up front and import the parsing libraries before the first
+    upload arrives. Parsing in separate processes keeps a large PDF from holding the
+    GIL the Streamlit server needs to serve every other session. At most
+    workers + max_queue tasks are admitted at once. A task that does not finish within
+    the timeout is reported to its caller and the pool is recycled: new tasks go to a
+    fresh set of workers, and the old ones are terminated once the other tasks already
+    given to them have finished, so a hung parser never keeps a worker slot.
+    """
+
+    def __init__(self, workers: int = DEFAULT_PARSE_WORKERS, max_queue: int = DEFAULT_PARSE_QUEUE_DEPTH,
+                 timeout: float = DEFAULT_PARSE_TIMEOUT):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self.timeout = timeout
+        self._pool = self._start_pool()
+        # Bumped on every recycle, so tasks of a retired pool no longer release slots
+        self._generation = 0
+        # Results given to the current pool, checked when it is retired
+        self._outstanding = []
+        self._retiring = []
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run fn(*args) in a worker process and return its result"""
+        return self.map(fn, [args], timeout=timeout)[0]
+
+    def map(self, fn: Callable, args_list: Sequence[tuple], timeout: Optional[float] = None) -> List:
+        """Run fn(*args) for each args in worker processes; results in order
+
+        The tasks share one timeout, counted from submission.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._in_flight + len(args_list) > self.capacity:
+                raise ParsePoolBusyError(self.capacity)
+            self._in_flight += len(args_list)
+            pool = self._pool
+            release = functools.partial(self._release_one, self._generation)
+            # Submitted under the lock, so a recycle never closes the pool between choosing and using it
+            results = [pool.apply_async(fn, args, callback=release, error_callback=release) for args in args_list]
+            self._outstanding = [result for result in self._outstanding if not result.ready()] + results
+        deadline = time.monotonic() + timeout
+        try:
+            return [result.get(timeout=max(0.0, deadline - time.monotonic())) for result in results]
+        except multiprocessing.TimeoutError:
+            self._recycle(pool, results)
+            raise ParseTimeoutError(timeout)
+
+    def idle_workers(self) -> int:
+        """Workers with nothing to do right now"""
+        with self._lock:
+            return max(0, self.workers - self._in_flight)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {'workers': self.workers, 'in_flight': in_flight, 'capacity': self.capacity}
+
+    def close(self) -> None:
+        with self._lock:
+            pools = [self._pool] + self._retiring
+            self._retiring = []
+        for pool in pools:
+            pool.terminate()
+
+    def _start_pool(self):
+        # spawn rather than fork: the app process runs many threads
+        return multiprocessing.get_context('spawn').Pool(
+            self.workers,
+            initializer=_warm_up_worker,
+            # Replace workers now and then, returning memory a parser library held on to
+            maxtasksperchild=100
+        )
+
+    def _recycle(self, pool, timed_out: list) -> None:
+        """Move new tasks to fresh workers and retire the pool a task timed out in"""
+        with self._lock:
+            # Another caller's timeout may already have replaced this pool
+            if pool is not self._pool:
+                return
+            others = [result for result in self._outstanding if result not in timed_out and not result.ready()]
+            self._pool = self._start_pool()
+            self._generation += 1
+            self._outstanding = []
+            self._in_flight = 0
+            self._retiring.append(pool)
+        pool.close()
+        threading.Thread(target=self._retire, args=(pool, others), daemon=True).start()
+
+    def _retire(self, pool, others: list) -> None:
+        # Let the other callers' tasks finish, within the timeout they were given, then kill the hung worker
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline and not all(result.ready() for result in others):
+            time.sleep(0.1)
+        pool.terminate()
+        with self._lock:
+            if pool in self._retiring:
+                self._retiring.remove(pool)
+
+    def _release_one(self, generation: int, _result=None) -> None:
+        # Runs when a task finishes, even after its caller gave up waiting for it
+        with self._lock:
+            if generation == self._generation:
+                self._in_flight -= 1
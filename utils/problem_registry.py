@@ -0,0 +1,117 @@
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from api_handlers.deadline import Deadline
+from api_handlers.mock_review import FallbackReview, MockReview
+from utils.cache import DEFAULT_CACHE_ROOT, TwoTierCache
+from utils.token_budget import clean_prose, estimate_tokens
+
+# Shorter problem statements are sent in full; condensing them would save little
+MIN_CONDENSE_TOKENS = 800
+
+# A summary must be at most this fraction of the original to be worth using
+MAX_SUMMARY_RATIO = 0.6
+
+
+class ProblemRegistry:
+    """Registry of problem statements by content hash, each condensed once into a requirements summary
+
+    Most reviews are many solutions against a handful of assignments. The first review
+    of a long problem statement asks the model for a compact requirements summary, and
+    every later review of the same problem sends that summary instead of the full text.
+    """
+
+    def __init__(self, cache_dir: Optional[Union[str, Path]] = None, max_memory_items: int = 64,
+                 max_disk_bytes: int = 20 * 1024 * 1024):
+        self.store = TwoTierCache(
+            cache_dir or DEFAULT_CACHE_ROOT / 'problems',
+            max_memory_items=max_memory_items,
+            max_disk_bytes=max_disk_bytes
+        )
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(problem_statement: str) -> str:
+        """Hash the normalized problem text, so reformatted copies of a statement share an entry"""
+        return hashlib.sha256(clean_prose(problem_statement).encode('utf-8')).hexdigest()
+
+    def get(self, problem_statement: str) -> Optional[dict]:
+        """The registry entry for a problem statement, if it has been condensed"""
+        return self.store.get(self.make_key(problem_statement))
+
+    def get_problem_text(self, problem_statement: str, handler, prompt_builder,
+                         deadline: Optional[Deadline] = None) -> str:
+        """Problem text to put in review prompts: the condensed summary when there is one
+
+        Condenses the statement with handler on first use. Short statements, and any
+        statement whose summary fails or saves too little, are returned unchanged.
+        """
+        problem_tokens = estimate_tokens(clean_prose(problem_statement))
+        if problem_tokens < MIN_CONDENSE_TOKENS:
+            return problem_statement
+
+        key = self.make_key(problem_statement)
+        entry = self.store.get(key)
+        if entry is None:
+            with self._key_locks_lock:
+                lock = self._key_locks.setdefault(key, threading.Lock())
+            try:
+                # Concurrent reviews of a new problem wait for one summary instead of each asking for one
+                with lock:
+                    entry = self.store.get(key) or self._condense(key, problem_statement, problem_tokens,
+                                                                  handler, prompt_builder, deadline)
+            finally:
+                with self._key_locks_lock:
+                    if self._key_locks.get(key) is lock:
+                        del self._key_locks[key]
+
+        if entry is None or entry['summary'] is None:
+            return problem_statement
+        return self.format_summary(key, entry['summary'])
+
+    def peek_problem_text(self, problem_statement: str) -> Optional[str]:
+        """The text get_problem_text would return, or None if getting it still needs a model call"""
+        if estimate_tokens(clean_prose(problem_statement)) < MIN_CONDENSE_TOKENS:
+            return problem_statement
+        key = self.make_key(problem_statement)
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        return problem_statement if entry['summary'] is None else self.format_summary(key, entry['summary'])
+
+    @staticmethod
+    def format_summary(key: str, summary: str) -> str:
+        return (
+            f"Condensed requirements of problem {key[:12]}, summarized from the full statement. "
+            f"Treat every listed requirement as binding.\n\n{summary}"
+        )
+
+    def _condense(self, key: str, problem_statement: str, problem_tokens: int, handler, prompt_builder,
+                  deadline: Optional[Deadline]) -> Optional[dict]:
+        summary = handler.get_review(prompt_builder.build_problem_summary_prompt(problem_statement), deadline=deadline)
+        # Never store a summary from a fallback model or local placeholder text
+        if not summary or isinstance(summary, (MockReview, FallbackReview)):
+            return None
+
+        summary = clean_prose(summary)
+        summary_tokens = estimate_tokens(summary)
+        entry = {
+            # Remember summaries that save too little, so the problem is not condensed again
+            'summary': summary if summary_tokens <= problem_tokens * MAX_SUMMARY_RATIO else None,
+            'model': handler.model_name,
+            'problem_tokens': problem_tokens,
+            'summary_tokens': summary_tokens,
+        }
+        self.store.set(key, entry)
+        return entry
+
+    def get_stats(self) -> dict:
+        """Get hit/miss counters for both registry tiers"""
+        return self.store.get_stats()
+
+    def clear(self) -> None:
+        """Forget every registered problem"""
+        self.store.clear()
@@ -1,8 +1,54 @@
+import json
+from typing import List, Optional
+
+from utils.review_schema import SECTION_HEADINGS, get_review_schema
+from utils.token_budget import clean_code, clean_prose, estimate_tokens, get_input_budget, get_problem_budget, truncate_code, truncate_text
+
+# Bump whenever the review prompt templates change, so stored reviews record which prompt produced them
+PROMPT_VERSION = 1
+
+# Tokens for the headings and instructions each prompt adds around the base prompt and inputs
+SCAFFOLD_TOKENS = 500
+
+# Tokens of a structured review's current section quoted when regenerating that section
+SECTION_CONTEXT_TOKENS = 1000
+
+# Prompts are laid out most stable first: instructions, then the problem statement, then the
+# solution. Everything before the solution is byte-identical across reviews of the same problem,
+# so provider prompt caches can reuse it. These headings start the problem and solution sections.
+PROBLEM_HEADING = "\n\n## Problem Statement\n"
+SOLUTION_HEADINGS = (
+    "\n\n## Python Solution Code\n",
+    "\n\n## Part ",
+    "\n\n## Reviews of Each Part\n",
+)
+
+def split_cacheable_prompt(prompt: str) -> List[str]:
+    """Split a prompt into its instructions, problem statement and solution segments
+    
+    Joining the segments gives back the prompt. The instructions are shared by every review
+    and the problem statement by every solution to it, so handlers mark the end of each
+    segment but the last as a prompt cache breakpoint.
+    """
+    cuts = []
+    problem_at = prompt.find(PROBLEM_HEADING)
+    if problem_at > 0:
+        cuts.append(problem_at)
+    search_from = max(problem_at, 0) + 1
+    solution_at = min((at for at in (prompt.find(heading, search_from) for heading in SOLUTION_HEADINGS) if at > 0), default=-1)
+    if solution_at > 0:
+        cuts.append(solution_at)
+    bounds = [0, *cuts, len(prompt)]
+    return [prompt[start:end] for start, end in zip(bounds, bounds[1:])]
+
 class PromptBuilder:
     """Utility class for building code review prompts"""
     
-    def __init__(self):
+    def __init__(self, max_input_tokens: Optional[int] = None):
         self.base_prompt = self._get_base_prompt()
+        # Prompt size limit; use get_handler_input_budget(handler) to size it for a model
+        self.max_input_tokens = max_input_tokens or get_input_budget()
+        self.base_prompt_tokens = estimate_tokens(self.base_prompt)
     
     def _get_base_prompt(self) -> str:
         """Get the base prompt template"""
@@ -90,8 +136,7 @@ Please be constructive, specific, and actionable in your feedback."""
         """Build a complete review prompt with problem statement and code"""
         
         # Clean and format the inputs
-        problem_clean = self._clean_text(problem_statement)
-        code_clean = self._clean_text(python_code)
+        problem_clean, code_clean = self._fit_inputs(problem_statement, python_code, self.base_prompt_tokens)
         
         # Build the complete prompt
         prompt = f"""{self.base_prompt}
@@ -110,11 +155,62 @@ Please provide a comprehensive code review based on the criteria outlined above.
         
         return prompt
     
+    def build_structured_review_prompt(self, problem_statement: str, python_code: str) -> str:
+        """Build a review prompt asking for the review sections as one JSON object"""
+        return self._build_structured_prefix(problem_statement, python_code) + "\n\nRespond with the JSON review object only."
+    
+    def build_section_prompt(self, problem_statement: str, python_code: str, field: str, current_value=None) -> str:
+        """Build a prompt that regenerates one section of a structured review
+        
+        The prompt starts with exactly the text of the structured review prompt up to the
+        code, so providers can serve it from their prompt cache, and only one field is written.
+        """
+        current = truncate_text(json.dumps({field: current_value}, indent=2, ensure_ascii=False), SECTION_CONTEXT_TOKENS)
+        
+        prompt = f"""{self._build_structured_prefix(problem_statement, python_code)}
+
+## Regenerate One Section
+
+The "{field}" field ({SECTION_HEADINGS[field]}) of an earlier review of this solution needs to be redone. The current version:
+
+{current}
+
+Write a better, more specific replacement for this field only. Respond with a JSON object that has the single key "{field}", whose value matches the schema above for that field, and no other text."""
+        
+        return prompt
+    
+    def _build_structured_prefix(self, problem_statement: str, python_code: str) -> str:
+        """Instructions, problem and code shared by the full structured review and section prompts"""
+        base_prompt = self._get_structured_base_prompt()
+        problem_clean, code_clean = self._fit_inputs(
+            problem_statement, python_code, estimate_tokens(base_prompt) + SECTION_CONTEXT_TOKENS
+        )
+        return f"""{base_prompt}
+
+## Problem Statement
+
+{problem_clean}
+
+## Python Solution Code
+
+```python
+{code_clean}
+```"""
+    
+    def _get_structured_base_prompt(self) -> str:
+        """The base prompt with its markdown report layout replaced by a JSON schema"""
+        criteria = self.base_prompt.split("Please provide your review in the following format:")[0]
+        schema = json.dumps(get_review_schema(), ensure_ascii=False)
+        return f"""{criteria}Return your review as a single JSON object matching this JSON schema, with no text before or after it:
+
+{schema}
+
+Be constructive, specific, and actionable in every field."""
+    
     def build_simple_prompt(self, problem_statement: str, python_code: str) -> str:
         """Build a simpler review prompt for quick feedback"""
         
-        problem_clean = self._clean_text(problem_statement)
-        code_clean = self._clean_text(python_code)
+        problem_clean, code_clean = self._fit_inputs(problem_statement, python_code)
         
         prompt = f"""You are a Python code reviewer. Review this code:
 
@@ -145,8 +241,7 @@ Format as bullet points."""
     def build_detailed_prompt(self, problem_statement: str, python_code: str) -> str:
         """Build a detailed review prompt with specific focus areas"""
         
-        problem_clean = self._clean_text(problem_statement)
-        code_clean = self._clean_text(python_code)
+        problem_clean, code_clean = self._fit_inputs(problem_statement, python_code, self.base_prompt_tokens)
         
         prompt = f"""{self.base_prompt}
 
@@ -209,20 +304,204 @@ Please provide a comprehensive analysis including specific code examples for imp
         
         return prompt
     
-    def _clean_text(self, text: str) -> str:
-        """Clean and format text for prompt building"""
-        if not text:
-            return "No content provided"
+    def build_consensus_prompt(self, problem_statement: str, python_code: str, reviews: dict) -> str:
+        """Build a prompt that merges several independent model reviews into one consensus report"""
+        
+        reviews_text = "\n\n".join(
+            f"### Review from {model_name}\n\n{review}" for model_name, review in reviews.items()
+        )
+        problem_clean, code_clean = self._fit_inputs(problem_statement, python_code, estimate_tokens(reviews_text))
+        
+        prompt = f"""You are a senior Python code reviewer consolidating independent code reviews of the same solution into a single consensus review.
+
+## Problem Statement
+
+{problem_clean}
+
+## Python Solution Code
+
+```python
+{code_clean}
+```
+
+## Independent Reviews
+
+The {len(reviews)} reviews to consolidate:
+
+{reviews_text}
+
+## Instructions
+
+- Keep findings that several reviewers agree on and state that they are shared
+- Include findings raised by only one reviewer only if you can verify them against the code, and attribute them
+- Call out disagreements explicitly (e.g. differing AI authorship estimates or quality scores) and give your reconciled judgment
+- Do not invent new issues that none of the reviewers raised
+
+Please provide the consensus review in the following format:
+
+## Code Review Report
+
+### 🔍 AI Authorship Analysis
+### 🧩 Problem-Solution Match
+### ✅ Strengths
+### 🔧 Areas for Improvement
+### 📝 Detailed Analysis
+### 🎯 Recommendations
+### 📊 Code Quality Score
+### 🚀 Suggested Improvements
+
+### 🤝 Reviewer Agreement
+[Summarize where the reviewers agreed and disagreed]"""
+        
+        return prompt
+    
+    def build_problem_summary_prompt(self, problem_statement: str) -> str:
+        """Build the prompt condensing a long problem statement into a reusable requirements summary"""
+        
+        problem_clean = truncate_text(self._clean_text(problem_statement), max(0, self.max_input_tokens - SCAFFOLD_TOKENS))
+        
+        prompt = f"""You are preparing a problem statement for automated code review. Many solutions to this problem will be reviewed against your summary instead of the full text, so it must keep everything a reviewer needs to judge whether a solution is correct.
+
+## Problem Statement
+
+{problem_clean}
+
+## Instructions
+
+Condense the problem statement into a requirements summary:
+- Required functions, classes or programs, with exact names, signatures and input/output formats
+- Every functional requirement and constraint, including limits on input sizes and required complexity
+- Edge cases and error handling the statement asks for
+- One or two of the given examples, verbatim
+- Grading or style rules, if any
+
+Keep identifiers, numbers and formats exactly as written. Drop background stories, motivation and repetition. Use short bullet points under the headings above, and no other commentary."""
+        
+        return prompt
+    
+    def fits_single_prompt(self, problem_statement: str, python_code: str) -> bool:
+        """Whether a review prompt can include the whole problem and code without truncation"""
+        problem_clean = self._clean_text(problem_statement)
+        code_clean = self._clean_code(python_code)
+        available = max(0, self.max_input_tokens - self.base_prompt_tokens - SCAFFOLD_TOKENS)
+        return get_problem_budget(available, estimate_tokens(problem_clean), estimate_tokens(code_clean)) is None
+    
+    def get_chunk_code_budget(self, problem_statement: str, outline: str) -> int:
+        """Tokens left for the code in each chunk prompt of a large-file review"""
+        problem_clean, outline_clean = self._fit_chunk_context(problem_statement, outline)
+        used = estimate_tokens(problem_clean) + estimate_tokens(outline_clean) + SCAFFOLD_TOKENS
+        return max(500, self.max_input_tokens - used)
+    
+    def build_chunk_review_prompt(self, problem_statement: str, chunk, outline: str, part: int, parts: int) -> str:
+        """Build the prompt reviewing one part of a solution too large for a single prompt"""
+        
+        problem_clean, outline_clean = self._fit_chunk_context(problem_statement, outline)
+        
+        prompt = f"""You are a professional Python code reviewer. The solution below is too large to review at once, so you are reviewing one part of it. Other parts are reviewed separately and all findings will be merged into one report.
+
+## Problem Statement
+
+{problem_clean}
+
+## Outline of the Whole Solution
+
+{outline_clean}
+
+## Part {part} of {parts}: {chunk.title}
+
+```python
+{chunk.code}
+```
+
+## Instructions
+
+Review only the code in this part, using the problem statement and outline for context. Do not report code from other parts as missing. Cite line numbers from the whole file (this part starts at line {chunk.start_line}).
+
+Report concise findings under these headings, skipping any with nothing to say:
+
+### Problem-Solution Match
+### AI Authorship Signals
+### Correctness and Edge Cases
+### Style and PEP 8
+### Efficiency and Performance
+### Readability and Maintainability
+### Error Handling and Robustness
+### Strengths
+### Suggested Improvements
+[Short code examples for the most important fixes]
+
+### Part Score
+[A score out of 10 for this part with one line of justification]"""
+        
+        return prompt
+    
+    def build_chunk_reduce_prompt(self, problem_statement: str, outline: str, chunk_reviews: dict) -> str:
+        """Build the prompt merging per-part reviews of a large solution into the standard report"""
+        
+        problem_clean, outline_clean = self._fit_chunk_context(problem_statement, outline)
+        
+        # Share what is left of the budget evenly so no part's findings are dropped entirely
+        overhead = self.base_prompt_tokens + estimate_tokens(problem_clean) + estimate_tokens(outline_clean) + SCAFFOLD_TOKENS
+        per_review = max(200, (self.max_input_tokens - overhead) // max(1, len(chunk_reviews)))
+        reviews_text = "\n\n".join(
+            f"### Part {part}: {title}\n\n{truncate_text(str(review).strip(), per_review)}"
+            for part, (title, review) in enumerate(chunk_reviews.items(), start=1)
+        )
+        
+        prompt = f"""{self.base_prompt}
+
+## Problem Statement
+
+{problem_clean}
+
+## Outline of the Whole Solution
+
+{outline_clean}
+
+## Reviews of Each Part
+
+The solution was too large to review at once, so each part was reviewed separately:
+
+{reviews_text}
+
+## Instructions
+
+Merge the part reviews into a single review of the whole solution, in the format above.
+- Judge the problem-solution match and AI authorship for the solution as a whole
+- Combine duplicate findings and keep the line numbers the part reviews cite
+- Give one overall Code Quality Score, weighing the parts by their importance to the solution
+- Do not invent findings that none of the part reviews support"""
         
-        # Remove excessive whitespace
-        cleaned = ' '.join(text.split())
+        return prompt
+    
+    def _fit_chunk_context(self, problem_statement: str, outline: str) -> tuple:
+        """Problem statement and outline for large-file prompts, each capped so the code keeps most of the budget"""
+        problem_clean = truncate_text(self._clean_text(problem_statement), self.max_input_tokens // 4)
+        outline_clean = truncate_text(outline, self.max_input_tokens // 8)
+        return problem_clean, outline_clean
+    
+    def _fit_inputs(self, problem_statement: str, python_code: str, overhead_tokens: int = 0) -> tuple:
+        """Clean the problem and code, truncating them only if the prompt would exceed its token budget"""
+        problem_clean = self._clean_text(problem_statement)
+        code_clean = self._clean_code(python_code)
         
-        # Limit length to prevent token overflow
-        max_length = 8000  # Conservative limit
-        if len(cleaned) > max_length:
-            cleaned = cleaned[:max_length] + "... [truncated]"
+        available = max(0, self.max_input_tokens - overhead_tokens - SCAFFOLD_TOKENS)
+        problem_budget = get_problem_budget(available, estimate_tokens(problem_clean), estimate_tokens(code_clean))
+        if problem_budget is not None:
+            problem_clean = truncate_text(problem_clean, problem_budget)
+            # Whatever the problem statement does not use goes to the code
+            code_clean = truncate_code(code_clean, available - estimate_tokens(problem_clean))
         
-        return cleaned
+        return problem_clean, code_clean
+    
+    def _clean_text(self, text: str) -> str:
+        """Clean and format text for prompt building"""
+        # Runs of whitespace are collapsed, but paragraph breaks are kept for readability
+        return clean_prose(text) or "No content provided"
+    
+    def _clean_code(self, code: str) -> str:
+        """Clean source code for prompt building, preserving indentation"""
+        return clean_code(code) or "No content provided"
     
     def get_model_specific_prompt(self, model_name: str, problem_statement: str, python_code: str) -> str:
         """Get model-specific prompt based on the selected AI model"""
@@ -0,0 +1,86 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from api_handlers.deadline import Deadline
+
+from api_handlers.mock_review import FallbackReview, MockReview, join_review_chunks
+from utils.cache import DEFAULT_CACHE_ROOT, TwoTierCache
+
+
+class ReviewCache:
+    """Content-addressed cache for model reviews, keyed on prompt, model and generation parameters"""
+
+    def __init__(self, cache_dir: Optional[Union[str, Path]] = None, max_memory_items: int = 256,
+                 max_disk_bytes: int = 200 * 1024 * 1024, ttl_seconds: Optional[float] = 30 * 24 * 3600):
+        self.store = TwoTierCache(
+            cache_dir or DEFAULT_CACHE_ROOT / 'reviews',
+            max_memory_items=max_memory_items,
+            max_disk_bytes=max_disk_bytes,
+            ttl_seconds=ttl_seconds
+        )
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str, generation_params: Optional[dict] = None) -> str:
+        """Hash the final prompt together with everything that changes the model output"""
+        payload = json.dumps(
+            {'prompt': prompt, 'model': model_name, 'params': generation_params or {}},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def key_for(self, handler, prompt: str) -> str:
+        """Build the cache key for a prompt sent to the given handler"""
+        return self.make_key(prompt, handler.model_name, getattr(handler, 'generation_params', {}))
+
+    def get(self, handler, prompt: str) -> Optional[str]:
+        """Return a cached review for this handler and prompt, if any"""
+        return self.store.get(self.key_for(handler, prompt))
+
+    def get_by_key(self, key: str) -> Optional[str]:
+        """Return a cached review by its cache key, e.g. one recorded for a similar solution"""
+        return self.store.get(key)
+
+    def put(self, handler, prompt: str, review: str) -> None:
+        """Store a review unless it is local fallback text or came from a fallback model"""
+        if not review or isinstance(review, (MockReview, FallbackReview)):
+            return
+        self.store.set(self.key_for(handler, prompt), str(review))
+
+    def get_review(self, handler, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        """Get a review from the cache, falling back to the handler on a miss"""
+        cached = self.get(handler, prompt)
+        if cached is not None:
+            return cached
+
+        review = handler.get_review(prompt, deadline=deadline)
+        self.put(handler, prompt, review)
+        return review
+
+    def get_review_stream(self, handler, prompt: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Stream a review, yielding a cached review as a single chunk on a hit
+
+        On a miss the handler's chunks are passed through as they arrive and the
+        assembled review is stored once the stream completes.
+        """
+        cached = self.get(handler, prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        for chunk in handler.get_review_stream(prompt, deadline=deadline):
+            chunks.append(chunk)
+            yield chunk
+
+        self.put(handler, prompt, join_review_chunks(chunks))
+
+    def get_stats(self) -> dict:
+        """Get hit/miss counters for both cache tiers"""
+        return self.store.get_stats()
+
+    def clear(self) -> None:
+        """Drop every cached review"""
+        self.store.clear()
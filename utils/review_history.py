@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional, Union
+
+from api_handlers.mock_review import FallbackReview, MockReview
+from utils.cache import DEFAULT_CACHE_ROOT
+from utils.problem_registry import ProblemRegistry
+from utils.prompt_builder import PROMPT_VERSION
+
+# SQLite database every finished review is recorded in; override with AI_REVIEWER_HISTORY_DB
+DEFAULT_HISTORY_PATH = Path(os.getenv('AI_REVIEWER_HISTORY_DB', DEFAULT_CACHE_ROOT / 'history.sqlite3'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    problem_hash TEXT NOT NULL,
+    solution_hash TEXT NOT NULL,
+    solution_name TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL,
+    prompt_version INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    elapsed_ms REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    review_hash TEXT NOT NULL,
+    review_bytes INTEGER NOT NULL,
+    review BLOB NOT NULL,
+    UNIQUE (problem_hash, solution_hash, model, prompt_version, review_hash)
+);
+CREATE INDEX IF NOT EXISTS reviews_by_files ON reviews (problem_hash, solution_hash, created_at);
+CREATE INDEX IF NOT EXISTS reviews_by_date ON reviews (created_at);
+"""
+
+# Contentless: the index holds only search terms, the text itself is stored compressed in reviews
+_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(solution_name, model, review, content='')"
+
+# Fields of a history entry; the review text itself is only loaded by get()
+_FIELDS = ('id', 'created_at', 'problem_hash', 'solution_hash', 'solution_name', 'model', 'prompt_version', 'source',
+           'elapsed_ms', 'input_tokens', 'output_tokens')
+_COLUMNS = ", ".join(_FIELDS)
+
+
+class ReviewHistory:
+    """Persistent, searchable history of finished reviews in a SQLite database
+
+    Every review is stored once, zlib-compressed, with the hashes of the problem and
+    solution it reviewed, the model and prompt version that wrote it, its timing and
+    the token counts the provider reported (estimated when none were). A full-text
+    index makes past reviews searchable, and reloading one is a local query instead of
+    another model call. The database runs in WAL mode so the review workers can write
+    while sessions read.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        self.path = Path(path or DEFAULT_HISTORY_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # sqlite3 connections may not be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        connection = self._connect()
+        connection.executescript(_SCHEMA)
+        try:
+            connection.execute(_FTS_SCHEMA)
+            self.full_text_search = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to scanning recent reviews
+            self.full_text_search = False
+        connection.commit()
+
+    @staticmethod
+    def make_problem_hash(problem_statement: str) -> str:
+        """Same key as the problem registry, so reformatted copies of a statement match"""
+        return ProblemRegistry.make_key(problem_statement)
+
+    @staticmethod
+    def make_solution_hash(solution_code: str) -> str:
+        return hashlib.sha256(solution_code.encode('utf-8')).hexdigest()
+
+    def record(self, problem_statement: str, solution_code: str, model: str, review: str, solution_name: str = '',
+               source: str = 'model', elapsed_ms: Optional[float] = None, input_tokens: Optional[int] = None,
+               output_tokens: Optional[int] = None, prompt_version: int = PROMPT_VERSION) -> Optional[int]:
+        """Store a finished review and return its history id
+
+        Local fallback text and reviews written by a fallback model are not stored. A review
+        identical to one already stored for the same files, model and prompt version is not
+        stored twice; the existing entry's id is returned.
+        """
+        if not review or isinstance(review, (MockReview, FallbackReview)):
+            return None
+
+        review = str(review)
+        encoded = review.encode('utf-8')
+        row = (
+            time.time(),
+            self.make_problem_hash(problem_statement),
+            self.make_solution_hash(solution_code),
+            solution_name,
+            model,
+            prompt_version,
+            source,
+            elapsed_ms,
+            input_tokens,
+            output_tokens,
+            hashlib.sha256(encoded).hexdigest(),
+            len(encoded),
+            zlib.compress(encoded),
+        )
+        connection = self._connect()
+        with connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO reviews (created_at, problem_hash, solution_hash, solution_name, model, "
+                "prompt_version, source, elapsed_ms, input_tokens, output_tokens, review_hash, review_bytes, review) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            if cursor.rowcount == 0:
+                existing = connection.execute(
+                    "SELECT id FROM reviews WHERE problem_hash = ? AND solution_hash = ? AND model = ? "
+                    "AND prompt_version = ? AND review_hash = ?",
+                    (row[1], row[2], model, prompt_version, row[10])
+                ).fetchone()
+                return existing[0]
+            if self.full_text_search:
+                connection.execute(
+                    "INSERT INTO reviews_fts (rowid, solution_name, model, review) VALUES (?, ?, ?, ?)",
+                    (cursor.lastrowid, solution_name, model, review)
+                )
+            return cursor.lastrowid
+
+    def get(self, entry_id: int) -> Optional[dict]:
+        """A history entry with its review text, or None if there is no such entry"""
+        row = self._connect().execute(f"SELECT {_COLUMNS}, review FROM reviews WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return None
+        entry = self._to_entry(row[:-1])
+        entry['review'] = zlib.decompress(row[-1]).decode('utf-8')
+        return entry
+
+    def find(self, problem_statement: str, solution_code: str, model: Optional[str] = None,
+             prompt_version: Optional[int] = None, limit: int = 10) -> List[dict]:
+        """Past reviews of exactly this problem and solution, newest first, without their text"""
+        query = f"SELECT {_COLUMNS} FROM reviews WHERE problem_hash = ? AND solution_hash = ?"
+        params = [self.make_problem_hash(problem_statement), self.make_solution_hash(solution_code)]
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model)
+        if prompt_version is not None:
+            query += " AND prompt_version = ?"
+            params.append(prompt_version)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._to_entry(row) for row in self._connect().execute(query, params)]
+
+    def recent(self, limit: int = 20) -> List[dict]:
+        """The latest reviews, newest first, without their text"""
+        rows = self._connect().execute(f"SELECT {_COLUMNS} FROM reviews ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [self._to_entry(row) for row in rows]
+
+    def search(self, text: str, limit: int = 20) -> List[dict]:
+        """Reviews whose text, solution name or model contains every word of text, best match first
+
+        Each word also matches longer words it starts, so "recurs" finds "recursion".
+        """
+        words = text.split()
+        if not words:
+            return self.recent(limit)
+        if not self.full_text_search:
+            return self._scan(words, limit)
+        # Quote every word, so punctuation in the search box is never read as FTS5 query syntax
+        match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+        rows = self._connect().execute(
+            f"SELECT {', '.join('r.' + field for field in _FIELDS)} "
+            "FROM reviews_fts JOIN reviews r ON r.id = reviews_fts.rowid "
+            "WHERE reviews_fts MATCH ? ORDER BY reviews_fts.rank LIMIT ?",
+            (match, limit)
+        )
+        return [self._to_entry(row) for row in rows]
+
+    def get_stats(self) -> dict:
+        """Number of stored reviews and how much compression saves"""
+        count, raw_bytes, stored_bytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(review_bytes), 0), COALESCE(SUM(LENGTH(review)), 0) FROM reviews"
+        ).fetchone()
+        return {
+            'reviews': count,
+            'review_bytes': raw_bytes,
+            'stored_bytes': stored_bytes,
+            'compression_ratio': round(stored_bytes / raw_bytes, 3) if raw_bytes else 0.0,
+        }
+
+    def close(self) -> None:
+        """Close the connections of every thread that used the history"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Used only by this thread, but close() may close it from another
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Safe with WAL: a crash can lose the last commits but never corrupts the database
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _scan(self, words: List[str], limit: int) -> List[dict]:
+        words = [word.lower() for word in words]
+        entries = []
+        for row in self._connect().execute(f"SELECT {_COLUMNS}, review FROM reviews ORDER BY created_at DESC"):
+            text = " ".join((row[4], row[5], zlib.decompress(row[-1]).decode('utf-8'))).lower()
+            if all(word in text for word in words):
+                entries.append(self._to_entry(row[:-1]))
+                if len(entries) == limit:
+                    break
+        return entries
+
+    @staticmethod
+    def _to_entry(row: tuple) -> dict:
+        return dict(zip(_FIELDS, row))
@@ -0,0 +1,143 @@
+import json
+from typing import Iterable, Optional
+
+# Sections of a structured review in display order: field, heading, JSON type, what the model writes.
+# Headings match the markdown report layout, so rendered reviews look like free-form ones.
+REVIEW_SECTIONS = [
+    ('ai_authorship', "🔍 AI Authorship Analysis", 'authorship',
+     "Estimate of how much of the code is human-written, with the reasoning behind it"),
+    ('problem_match', "🧩 Problem-Solution Match", 'text',
+     "How well the solution addresses the problem statement, including missed or misread requirements"),
+    ('strengths', "✅ Strengths", 'list', "Positive aspects of the code"),
+    ('improvements', "🔧 Areas for Improvement", 'list', "Specific issues, each with the fix you suggest"),
+    ('detailed_analysis', "📝 Detailed Analysis", 'text',
+     "Correctness, style, efficiency, readability, error handling and best practices, in markdown"),
+    ('recommendations', "🎯 Recommendations", 'list', "Specific, actionable recommendations"),
+    ('quality_score', "📊 Code Quality Score", 'score', "Score out of 10 with its justification"),
+    ('suggested_improvements', "🚀 Suggested Improvements", 'text',
+     "Improved code examples in markdown, with ```python fenced blocks"),
+]
+
+SECTION_FIELDS = [field for field, _, _, _ in REVIEW_SECTIONS]
+SECTION_HEADINGS = {field: heading for field, heading, _, _ in REVIEW_SECTIONS}
+
+_TYPE_SCHEMAS = {
+    'text': {'type': 'string'},
+    'list': {'type': 'array', 'items': {'type': 'string'}},
+    'authorship': {
+        'type': 'object',
+        'properties': {
+            'human_percent': {'type': 'integer', 'minimum': 0, 'maximum': 100},
+            'reasoning': {'type': 'string'},
+        },
+        'required': ['human_percent', 'reasoning'],
+    },
+    'score': {
+        'type': 'object',
+        'properties': {
+            'score': {'type': 'number', 'minimum': 0, 'maximum': 10},
+            'justification': {'type': 'string'},
+        },
+        'required': ['score', 'justification'],
+    },
+}
+
+
+class ReviewValidationError(ValueError):
+    """Model output that is not a structured review matching the schema"""
+
+
+def get_review_schema(fields: Optional[Iterable[str]] = None) -> dict:
+    """JSON schema of a structured review, or of an object holding only the given fields"""
+    fields = list(fields or SECTION_FIELDS)
+    descriptions = {field: description for field, _, _, description in REVIEW_SECTIONS}
+    kinds = {field: kind for field, _, kind, _ in REVIEW_SECTIONS}
+    return {
+        'type': 'object',
+        'properties': {
+            field: {**_TYPE_SCHEMAS[kinds[field]], 'description': descriptions[field]} for field in fields
+        },
+        'required': fields,
+    }
+
+
+def parse_structured_review(text: str, fields: Optional[Iterable[str]] = None) -> dict:
+    """Extract and validate the JSON object in a model's reply
+
+    Tolerates a notice or markdown code fence around the object, since not every provider
+    can be forced into JSON-only output. Raises ReviewValidationError.
+    """
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end < start:
+        raise ReviewValidationError("The reply contains no JSON object")
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise ReviewValidationError(f"The reply is not valid JSON: {str(e)}")
+    return validate_review(data, fields)
+
+
+def validate_review(data, fields: Optional[Iterable[str]] = None) -> dict:
+    """Check a structured review against the schema and return only its known fields
+
+    Only fields are required when given, e.g. the one section being regenerated.
+    Raises ReviewValidationError listing every problem found.
+    """
+    if not isinstance(data, dict):
+        raise ReviewValidationError("The review is not a JSON object")
+    kinds = {field: kind for field, _, kind, _ in REVIEW_SECTIONS}
+    problems = []
+    review = {}
+    for field in (fields or SECTION_FIELDS):
+        if field not in data:
+            problems.append(f"{field} is missing")
+            continue
+        value = data[field]
+        problem = _check_value(kinds[field], value)
+        if problem:
+            problems.append(f"{field} {problem}")
+        else:
+            review[field] = value
+    if problems:
+        raise ReviewValidationError("Invalid structured review: " + "; ".join(problems))
+    return review
+
+
+def _check_value(kind: str, value) -> Optional[str]:
+    if kind == 'text':
+        return None if isinstance(value, str) else "must be text"
+    if kind == 'list':
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            return "must be a list of text items"
+        return None
+    if not isinstance(value, dict):
+        return "must be an object"
+    number, text, low, high = (('human_percent', 'reasoning', 0, 100) if kind == 'authorship'
+                               else ('score', 'justification', 0, 10))
+    amount = value.get(number)
+    # bool is an int subclass, but true is not a score
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not low <= amount <= high:
+        return f"needs {number} between {low} and {high}"
+    if not isinstance(value.get(text), str):
+        return f"needs {text} text"
+    return None
+
+
+def render_section(field: str, value) -> str:
+    """One section of a structured review as markdown, under its report heading"""
+    if isinstance(value, list):
+        body = "\n".join(f"- {item}" for item in value) or "_None_"
+    elif field == 'ai_authorship':
+        body = (f"**{value['human_percent']:g}% likely human-written, {100 - value['human_percent']:g}% likely "
+                f"AI-generated**\n\n{value['reasoning']}")
+    elif field == 'quality_score':
+        body = f"**{value['score']:g}/10**\n\n{value['justification']}"
+    else:
+        body = value
+    return f"### {SECTION_HEADINGS[field]}\n{body}"
+
+
+def render_review_markdown(review: dict) -> str:
+    """A structured review as the markdown report shown and exported by the app"""
+    sections = [render_section(field, review[field]) for field in SECTION_FIELDS if field in review]
+    return "## Code Review Report\n\n" + "\n\n".join(sections)
@@ -0,0 +1,218 @@
+import builtins
+import io
+import json
+import keyword
+import os
+import random
+import re
+import threading
+import tokenize
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from utils.cache import DEFAULT_CACHE_ROOT
+
+# Solutions at least this similar are treated as near-duplicates
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv('AI_REVIEWER_SIMILARITY_THRESHOLD', '0.85'))
+
+# Tokens per shingle; long enough that shared boilerplate alone does not make solutions similar
+SHINGLE_SIZE = 5
+
+# The index file is rewritten once it holds more superseded or unreadable lines than live
+# entries, and at least this many, so re-added solutions do not grow it without bound
+COMPACT_MIN_STALE_LINES = 256
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_KEPT_NAMES = set(keyword.kwlist) | set(dir(builtins))
+_FALLBACK_TOKENS = re.compile(r"[A-Za-z_]\w*|\d+|\S")
+
+
+def normalize_code_tokens(code: str) -> List[str]:
+    """Python tokens with comments and blank lines dropped, and identifiers and literals normalized
+
+    Local names become ID, strings STR and numbers NUM, while keywords, builtins and
+    attribute names are kept, so renaming variables or reformatting does not change the result.
+    """
+    tokens = []
+    previous = None
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            kind, text = token.type, token.string
+            if kind in (tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER):
+                continue
+            if kind == tokenize.NAME:
+                # Attribute names are usually library calls (.append, .items) and say a lot about the approach
+                tokens.append(text if text in _KEPT_NAMES or previous == '.' else 'ID')
+            elif kind == tokenize.STRING:
+                tokens.append('STR')
+            elif kind == tokenize.NUMBER:
+                tokens.append('NUM')
+            elif kind == tokenize.NEWLINE:
+                tokens.append(';')
+            elif kind == tokenize.INDENT:
+                tokens.append('{')
+            elif kind == tokenize.DEDENT:
+                tokens.append('}')
+            else:
+                tokens.append(text)
+            previous = text
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Unparsable code is still compared, on its raw tokens
+        return _FALLBACK_TOKENS.findall(code)
+    return tokens
+
+
+def get_shingles(code: str, size: int = SHINGLE_SIZE) -> set:
+    """Stable 32-bit hashes of every run of size normalized tokens"""
+    tokens = normalize_code_tokens(code)
+    if len(tokens) < size:
+        return {zlib.crc32(' '.join(tokens).encode('utf-8'))} if tokens else set()
+    return {zlib.crc32(' '.join(tokens[i:i + size]).encode('utf-8')) for i in range(len(tokens) - size + 1)}
+
+
+def get_reusable_review(matches: List[dict], review_cache, model_name: str) -> Optional[Tuple[str, dict]]:
+    """The cached review of the most similar match reviewed by the same model, with that match"""
+    for match in matches:
+        if match.get('model') == model_name and match.get('review_key'):
+            review = review_cache.get_by_key(match['review_key'])
+            if review is not None:
+                return review, match
+    return None
+
+
+class SimilarityIndex:
+    """MinHash/LSH index of reviewed solutions, for finding near-duplicate submissions
+
+    Each solution is reduced to a MinHash signature over its normalized token shingles,
+    whose agreement estimates the Jaccard similarity of two solutions. Signatures are
+    split into bands hashed into buckets per problem, so a lookup only compares against
+    solutions that share a bucket. Entries are appended to a JSONL file and reloaded on start;
+    the file is rewritten with only the live entries once superseded lines pile up.
+    """
+
+    def __init__(self, index_dir: Optional[Union[str, Path]] = None, num_perm: int = 128, bands: int = 16,
+                 threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.index_dir = Path(index_dir or DEFAULT_CACHE_ROOT / 'similarity')
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.index_dir / 'index.jsonl'
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+
+        # Fixed seed: signatures are persisted, so the permutations must not change between runs
+        rng = random.Random(num_perm)
+        self._permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._entries = {}
+        self._buckets = {}
+        self._lines = 0
+        self._lock = threading.RLock()
+        self._load()
+        self._compact_if_stale()
+
+    def signature(self, code: str) -> List[int]:
+        """MinHash signature of a solution"""
+        shingles = get_shingles(code)
+        if not shingles:
+            return [_MAX_HASH] * self.num_perm
+        return [min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles) & _MAX_HASH for a, b in self._permutations]
+
+    def add(self, problem_key: str, solution_code: str, metadata: Optional[dict] = None,
+            signature: Optional[List[int]] = None) -> str:
+        """Index a solution to a problem, with metadata such as the key of its cached review"""
+        signature = signature or self.signature(solution_code)
+        entry_id = self.entry_id(problem_key, solution_code, (metadata or {}).get('solution', ''))
+        entry = {'id': entry_id, 'problem': problem_key, 'signature': signature, 'metadata': metadata or {}}
+        with self._lock:
+            if self._entries.get(entry_id) == entry:
+                return entry_id
+            self._insert(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+            self._lines += 1
+            self._compact_if_stale()
+        return entry_id
+
+    @staticmethod
+    def entry_id(problem_key: str, solution_code: str, solution_name: str = '') -> str:
+        """Id of a solution's entry: the same file resubmitted under the same name replaces its entry"""
+        return f"{problem_key[:16]}:{zlib.crc32(solution_name.encode('utf-8')):08x}:{zlib.crc32(solution_code.encode('utf-8')):08x}"
+
+    def find_similar(self, problem_key: str, solution_code: str, threshold: Optional[float] = None,
+                     limit: int = 5, signature: Optional[List[int]] = None, solution_name: Optional[str] = None) -> List[dict]:
+        """Indexed solutions to the same problem at least threshold similar, most similar first
+
+        Each result is the entry's metadata plus its 'id' and estimated 'similarity'. With a
+        solution_name, the solution's own entry from an earlier submission is left out.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = signature or self.signature(solution_code)
+        with self._lock:
+            candidates = set()
+            for bucket in self._bucket_keys(problem_key, signature):
+                candidates.update(self._buckets.get(bucket, ()))
+            if solution_name is not None:
+                candidates.discard(self.entry_id(problem_key, solution_code, solution_name))
+            entries = [self._entries[entry_id] for entry_id in candidates]
+
+        matches = []
+        for entry in entries:
+            similarity = sum(a == b for a, b in zip(signature, entry['signature'])) / self.num_perm
+            if similarity >= threshold:
+                matches.append({**entry['metadata'], 'id': entry['id'], 'similarity': round(similarity, 3)})
+        matches.sort(key=lambda match: match['similarity'], reverse=True)
+        return matches[:limit]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _bucket_keys(self, problem_key: str, signature: List[int]) -> List[str]:
+        return [
+            f"{problem_key}:{band}:{zlib.crc32(json.dumps(signature[band * self.rows:(band + 1) * self.rows]).encode('utf-8'))}"
+            for band in range(self.bands)
+        ]
+
+    def _insert(self, entry: dict) -> None:
+        # Re-adding a solution replaces its metadata, e.g. after it is reviewed again
+        if entry['id'] not in self._entries:
+            for bucket in self._bucket_keys(entry['problem'], entry['signature']):
+                self._buckets.setdefault(bucket, set()).add(entry['id'])
+        self._entries[entry['id']] = entry
+
+    def _compact_if_stale(self) -> None:
+        """Rewrite the index file with one line per live entry once enough of its lines are stale"""
+        stale = self._lines - len(self._entries)
+        if stale < COMPACT_MIN_STALE_LINES or stale <= len(self._entries):
+            return
+
+        # Pick up entries another process appended since this one loaded the file
+        self._load()
+        # Write atomically so a crash or a concurrent reader never sees a partial index
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._entries)
+
+    def _load(self) -> None:
+        # Later lines for the same entry replace earlier ones, so duplicates collapse into one entry
+        self._lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash mid-write
+                        continue
+                    if len(entry.get('signature', ())) == self.num_perm:
+                        self._insert(entry)
+        except OSError:
+            pass
@@ -0,0 +1,181 @@
+import ast
+import re
+from typing import List, Optional
+
+# Context windows (input + output tokens) of the models the handlers use
+MODEL_CONTEXT_LIMITS = {
+    'gpt-4o': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'claude-3-sonnet-20240229': 200000,
+    'models/gemini-1.5-flash': 1048576,
+    'models/gemini-1.5-pro': 2097152,
+}
+
+# Used for models not listed above; small enough to be safe for any of them
+DEFAULT_CONTEXT_LIMIT = 16000
+
+# Room left for the review itself when the handler does not set max_tokens
+DEFAULT_OUTPUT_TOKENS = 4096
+
+# Past this size, reviews get worse and slower while we keep paying for every token
+MAX_USEFUL_INPUT_TOKENS = 60000
+
+# Headroom for estimator error and provider-side message formatting
+SAFETY_MARGIN = 0.1
+
+# Letter runs are split every 6 characters, digits every 3, and each punctuation mark,
+# newline run and indentation run counts as one token. Spaces between words are free,
+# as BPE tokenizers merge them into the following word. This tracks real tokenizers
+# closely on code and prose, erring slightly high.
+_TOKEN_PIECES = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|\n+|(?m:^[ \t]+)|[^\sA-Za-z\d]")
+
+_BLANK_LINE_RUNS = re.compile(r"\n{3,}")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local estimate of how many tokens a text costs, without a tokenizer"""
+    if not text:
+        return 0
+    return len(_TOKEN_PIECES.findall(text))
+
+
+def get_context_limit(model_name: str) -> int:
+    """Context window of a model, by its API model name"""
+    return MODEL_CONTEXT_LIMITS.get(model_name, DEFAULT_CONTEXT_LIMIT)
+
+
+def get_input_budget(model_name: Optional[str] = None, output_tokens: Optional[int] = None) -> int:
+    """Prompt tokens worth sending to a model, leaving room for its output"""
+    context_limit = get_context_limit(model_name) if model_name else DEFAULT_CONTEXT_LIMIT
+    available = int((context_limit - (output_tokens or DEFAULT_OUTPUT_TOKENS)) * (1 - SAFETY_MARGIN))
+    return max(0, min(available, MAX_USEFUL_INPUT_TOKENS))
+
+
+def get_handler_input_budget(handler) -> int:
+    """Prompt token budget for a handler, small enough for every model it may end up calling
+
+    Covers the handler's fallback models and, for failover, hedging or coalescing
+    wrappers, the handlers they wrap, since any of them may be sent the same prompt.
+    """
+    params = getattr(handler, 'generation_params', None) or {}
+    output_tokens = params.get('max_tokens') or params.get('max_output_tokens')
+    model_names = [handler.model_name, *getattr(handler, 'fallback_models', [])]
+    budgets = [get_input_budget(model_name, output_tokens) for model_name in model_names]
+    for attribute in ('primary', 'alternate', 'secondary', 'handler'):
+        wrapped = getattr(handler, attribute, None)
+        if wrapped is not None:
+            budgets.append(get_handler_input_budget(wrapped))
+    return min(budgets)
+
+
+def clean_code(code: str) -> str:
+    """Normalize source code without touching indentation
+
+    Line endings are unified, trailing whitespace is stripped and long runs of
+    blank lines are squeezed; everything that affects meaning is kept.
+    """
+    if not code:
+        return ""
+    code = code.lstrip('\ufeff').replace('\r\n', '\n').replace('\r', '\n')
+    code = '\n'.join(line.rstrip() for line in code.split('\n'))
+    return _BLANK_LINE_RUNS.sub('\n\n', code).strip('\n')
+
+
+def clean_prose(text: str) -> str:
+    """Collapse whitespace in a document while keeping its paragraph breaks"""
+    if not text:
+        return ""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [' '.join(line.split()) for line in text.split('\n')]
+    return _BLANK_LINE_RUNS.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def truncate_code(code: str, max_tokens: int) -> str:
+    """Cut Python code to fit a token budget, ending on a complete statement
+
+    Prefers ending after a whole top-level function, class or statement; falls back to
+    the last complete nested statement, then to a whole line.
+    """
+    if estimate_tokens(code) <= max_tokens:
+        return code
+
+    lines = code.split('\n')
+    notice_tokens = 20
+    used = 0
+    fit = 0
+    for line in lines:
+        used += estimate_tokens(line) + 1
+        if used > max_tokens - notice_tokens:
+            break
+        fit += 1
+
+    cut = _statement_boundary(code, lines, fit)
+    kept = '\n'.join(lines[:cut]).rstrip()
+    return f"{kept}\n\n# ... [truncated: {len(lines) - cut} more lines not shown]"
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Cut prose to fit a token budget, ending on a paragraph or sentence boundary"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens - 10
+    paragraphs = text.split('\n\n')
+    kept, used = _take_pieces(paragraphs, budget)
+    # Fill what is left with the first sentences of the paragraph that did not fit
+    sentences, _ = _take_pieces(_SENTENCE_END.split(paragraphs[len(kept)]), budget - used)
+    if not kept and not sentences:
+        sentences, _ = _take_pieces(paragraphs[0].split(' '), budget)
+    if sentences:
+        kept.append(' '.join(sentences))
+    return '\n\n'.join(kept) + "\n\n... [truncated]"
+
+
+def _take_pieces(pieces: List[str], budget: int) -> tuple:
+    """Longest prefix of pieces that fits the budget, and the tokens it uses"""
+    kept = []
+    used = 0
+    for piece in pieces:
+        cost = estimate_tokens(piece) + 1
+        if used + cost > budget:
+            break
+        kept.append(piece)
+        used += cost
+    return kept, used
+
+
+def _statement_boundary(code: str, lines: List[str], fit: int) -> int:
+    """Number of lines to keep so the cut falls between statements"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        tree = None
+
+    if tree is not None:
+        top_level = [node.end_lineno for node in tree.body if node.end_lineno <= fit]
+        # Whole definitions read best, but not at the cost of dropping much of the budget
+        if top_level and top_level[-1] >= fit * 3 // 4:
+            return top_level[-1]
+        nested = [node.end_lineno for node in ast.walk(tree) if isinstance(node, ast.stmt) and node.end_lineno <= fit]
+        if nested:
+            return max(nested)
+        return fit
+
+    # Without a parse tree, cut just before the last unindented line that starts a statement
+    for index in range(fit, fit // 2, -1):
+        if index < len(lines) and lines[index][:1] not in ('', ' ', '\t', '#', ')', ']', '}'):
+            return index
+    return fit
+
+
+def get_problem_budget(max_tokens: int, problem_tokens: int, code_tokens: int) -> Optional[int]:
+    """Tokens the problem statement may use when problem and code together exceed the budget
+
+    Returns None if both fit. The code being reviewed gets priority; the problem
+    statement keeps at least a quarter of the budget when both are too long.
+    """
+    if problem_tokens + code_tokens <= max_tokens:
+        return None
+    return min(problem_tokens, max(max_tokens // 4, max_tokens - code_tokens))